@@ -1,10 +1,12 @@
 import streamlit as st
-from frontend.sidebar import display_sidebar
+from frontend.sidebar import display_sidebar, parse_carpetas
 from frontend.data_display import display_data_view
-from backend.process import process_escritura_publica
+from frontend.search_results import display_search_results
+from frontend.jobs_panel import display_jobs_panel, display_duplicate_warning
+from frontend.export_panel import display_export_panel
+from backend.jobs import submit_job, get_job
 from backend.database import find_escritura_by_carpeta
-import os
-import tempfile
+import copy
 
 
 # --- Configuración de la Página ---
@@ -24,6 +26,17 @@ if 'current_folder_number' not in st.session_state:
 # Nueva bandera para controlar el flujo post-guardado.
 if 'data_saved_successfully' not in st.session_state:
     st.session_state.data_saved_successfully = False
+if 'datos_originales' not in st.session_state:
+    st.session_state.datos_originales = None
+# Versión de la carpeta al cargar un análisis nuevo (None si estaba libre).
+if 'version_carpeta' not in st.session_state:
+    st.session_state.version_carpeta = None
+if 'datos_extraidos' not in st.session_state:
+    st.session_state.datos_extraidos = None
+if 'posibles_duplicados' not in st.session_state:
+    st.session_state.posibles_duplicados = None
+if 'advanced_search' not in st.session_state:
+    st.session_state.advanced_search = None
 
 
 def main():
@@ -35,12 +48,16 @@ def main():
 
     # --- Barra Lateral (Sidebar) ---
     uploaded_file, new_folder_number = display_sidebar()
+    with st.sidebar:
+        st.markdown("---")
+        display_export_panel()
 
     # --- NUEVA LÓGICA: Limpiar la vista después de guardar ---
     # Este bloque se activa cuando data_display.py establece la bandera.
     if st.session_state.get('data_saved_successfully', False):
         st.session_state.resultado_analisis = None
         st.session_state.current_folder_number = None
+        st.session_state.posibles_duplicados = None
         # Reseteamos la bandera para evitar que se ejecute en un bucle.
         st.session_state.data_saved_successfully = False
         # Mostramos un mensaje de éxito claro aquí.
@@ -48,40 +65,77 @@ def main():
         # No se necesita un rerun aquí, el flujo natural del script mostrará la vista vacía.
 
     # --- Lógica de Procesamiento de PDF (NUEVA ESCRITURA) ---
+    # El análisis no se ejecuta acá: se encola y lo procesa el worker (backend/worker.py).
     if 'start_analysis' in st.session_state and st.session_state.start_analysis:
         if uploaded_file and new_folder_number:
-            st.session_state.current_folder_number = new_folder_number
-            with st.spinner(f"Procesando PDF para la nueva carpeta {new_folder_number}..."):
-                try:
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                        tmp_file.write(uploaded_file.read())
-                        temp_pdf_path = tmp_file.name
-                    st.session_state.resultado_analisis = process_escritura_publica(temp_pdf_path)
-                except Exception as e:
-                    st.error(f"Ocurrió un error durante el procesamiento del PDF: {e}")
-                finally:
-                    if 'temp_pdf_path' in locals() and os.path.exists(temp_pdf_path):
-                        os.remove(temp_pdf_path)
+            try:
+                dividir = st.session_state.get('dividir_escrituras', False)
+                carpetas = parse_carpetas(st.session_state.get('carpetas_escrituras')) if dividir else None
+                job_id = submit_job(uploaded_file.getvalue(), new_folder_number, uploaded_file.name, dividir=dividir, carpetas=carpetas)
+                st.session_state.analysis_submitted = new_folder_number
+                st.session_state.analysis_dividir = dividir
+                if get_job(job_id).get('duplicado_de'):
+                    st.session_state.analysis_duplicate = True
+            except Exception as e:
+                st.session_state.analysis_error = f"No se pudo encolar el análisis del PDF: {e}"
         st.session_state.start_analysis = False
         st.rerun()
 
+    if st.session_state.get('analysis_submitted'):
+        if st.session_state.get('analysis_duplicate'):
+            st.info(f"Este PDF ya había sido analizado: se reutilizó el resultado para la carpeta {st.session_state.analysis_submitted}. Puedes cargarlo abajo.")
+            st.session_state.analysis_duplicate = False
+        elif st.session_state.get('analysis_dividir'):
+            st.info("Análisis del PDF con varias escrituras encolado. Cuando termine, cada escritura se podrá cargar en su carpeta.")
+        else:
+            st.info(f"Análisis de la carpeta {st.session_state.analysis_submitted} encolado. Su avance se muestra abajo.")
+        st.session_state.analysis_submitted = None
+    if st.session_state.get('analysis_error'):
+        st.error(st.session_state.analysis_error)
+        st.session_state.analysis_error = None
+
+    # --- Trabajos de Análisis ---
+    display_jobs_panel()
+
     # --- Lógica de Búsqueda (CARPETA EXISTENTE) ---
     if 'search_triggered' in st.session_state and st.session_state.search_triggered:
         search_number = st.session_state.search_query
         with st.spinner(f"Buscando carpeta número {search_number}..."):
-            found_data = find_escritura_by_carpeta(search_number)
-        if found_data:
+            try:
+                found_data = find_escritura_by_carpeta(search_number)
+                error_busqueda = None
+            except RuntimeError as e:
+                found_data, error_busqueda = None, str(e)
+        st.session_state.search_triggered = False
+        if error_busqueda:
+            # Sin rerun, para que el error quede a la vista.
+            st.error(error_busqueda)
+        elif found_data:
             st.success(f"Carpeta {search_number} encontrada y cargada.")
             st.session_state.resultado_analisis = found_data
             st.session_state.current_folder_number = search_number
+            # Guardamos una copia para enviar luego solo los campos modificados.
+            st.session_state.datos_originales = copy.deepcopy(found_data)
+            st.session_state.datos_extraidos = None
+            st.session_state.posibles_duplicados = None
+            st.rerun()
         else:
             st.warning(f"No se encontró ninguna carpeta con el número {search_number}.")
             st.session_state.resultado_analisis = None
             st.session_state.current_folder_number = None
-        st.session_state.search_triggered = False
-        st.rerun()
+            st.session_state.datos_originales = None
+            st.session_state.datos_extraidos = None
+            st.session_state.posibles_duplicados = None
+            st.rerun()
+
+    # --- Resultados de la Búsqueda Avanzada ---
+    if st.session_state.advanced_search:
+        display_search_results(st.session_state.advanced_search)
+        st.markdown("---")
 
     # --- Vista Principal de Datos ---
+    # Si es un posible duplicado se elige usar los datos de la escritura guardada o extraer igualmente.
+    display_duplicate_warning()
     if st.session_state.resultado_analisis:
         display_data_view(st.session_state.resultado_analisis, st.session_state.current_folder_number)
 
@@ -90,8 +144,10 @@ def main():
     with st.expander("Cómo funciona esta herramienta"):
         st.markdown(
             """
-            * **Analizar Nueva Escritura:** Sube un PDF, asigna un número de carpeta y haz clic en 'Iniciar Extracción'.
+            * **Analizar Nueva Escritura:** Sube un PDF, asigna un número de carpeta y haz clic en 'Iniciar Extracción'. El análisis se procesa en segundo plano; cuando termine, usa 'Cargar resultado' para revisarlo y guardarlo.
+            * **Varias Escrituras en un PDF:** Marca 'El PDF contiene varias escrituras' para un protocolo escaneado. Las escrituras se separan por su encabezado ('ESCRITURA NÚMERO ...') y su cierre ('Ante mí', 'CONCUERDA'), se extraen en simultáneo y cada una se carga y guarda en su carpeta: las indicadas o consecutivas desde la asignada.
             * **Buscar y Editar:** Introduce un número de carpeta existente y haz clic en 'Buscar Carpeta' para cargar, ver y editar sus datos.
+            * **Búsqueda Avanzada:** Busca escrituras por CUIT/CUIL o DNI de las partes, escribano y registro, matrícula, partida, fecha de otorgamiento o texto libre, y abre la carpeta que necesites.
             """
         )
 
@@ -0,0 +1,347 @@
+"""
+Carga masiva de escrituras sin interfaz gráfica.
+
+Procesa un directorio (o un manifiesto CSV) de PDFs en tres etapas
+conectadas por colas acotadas:
+
+    OCR (pool de procesos) -> extracción con GPT (asíncrona) -> escritura en MongoDB (por lotes)
+
+Las colas acotadas generan contrapresión: si el LLM o la base de datos se
+atrasan, el OCR deja de tomar documentos nuevos en lugar de acumular texto en
+memoria. Cada documento guardado se registra en un archivo de estado, de modo
+que si el proceso se interrumpe, al relanzarlo se omiten los ya cargados.
+
+Uso:
+    python -m backend.batch --dir escrituras/
+    python -m backend.batch --manifest manifiesto.csv --llm-workers 8
+"""
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import queue
+import re
+import statistics
+import threading
+import time
+
+from .ocr import extract_text_from_pdf, read_pdf_bytes, pdf_sha256
+from .extractor import aextract_data_with_langchain, extraction_metadata, TokenRateLimiter, LLM_TOKENS_PER_MINUTE
+from .database import get_db_collection, save_many_to_mongodb, save_ocr_texts
+from .metrics import get_logger, log, start_metrics_server
+
+logger = get_logger("batch")
+
+# Marca de fin de cola entre etapas.
+_FIN = object()
+
+
+def load_manifest(manifest_path):
+    """
+    Lee un manifiesto CSV con las columnas 'archivo' y 'numero_carpeta'.
+    Las rutas relativas se resuelven respecto de la carpeta del manifiesto.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    items = []
+    with open(manifest_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            archivo = os.path.join(base_dir, row["archivo"].strip())
+            items.append((archivo, int(row["numero_carpeta"])))
+    return items
+
+
+def scan_directory(directory):
+    """
+    Lista los PDFs de un directorio. El número de carpeta se toma del primer
+    número que aparece en el nombre del archivo (ej. '1234.pdf', 'carpeta_1234.pdf').
+    """
+    items = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(".pdf"):
+            continue
+        match = re.search(r"\d+", name)
+        if not match:
+            log(logger, f"Se omite {name}: no tiene número de carpeta en el nombre.", logging.WARNING, archivo=name)
+            continue
+        items.append((os.path.join(directory, name), int(match.group())))
+    return items
+
+
+def load_completed(state_path):
+    """
+    Devuelve los números de carpeta ya guardados según el archivo de estado.
+    """
+    completed = set()
+    if not os.path.exists(state_path):
+        return completed
+    with open(state_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue # Línea cortada por una interrupción.
+            if entry.get("estado") == "ok":
+                completed.add(entry["numero_carpeta"])
+    return completed
+
+
+def _ocr_document(pdf_path):
+    """
+    Etapa de OCR para un documento. Corre en un proceso del pool, por eso
+    el OCR interno de cada documento se hace en serie (workers=1).
+
+    Returns:
+        tuple: (texto, SHA-256 del PDF, segundos empleados)
+    """
+    inicio = time.perf_counter()
+    pdf_bytes = read_pdf_bytes(pdf_path)
+    sha256 = pdf_sha256(pdf_bytes)
+    text = extract_text_from_pdf(pdf_bytes, workers=1, sha256=sha256)
+    if isinstance(text, Exception):
+        raise text
+    return text, sha256, time.perf_counter() - inicio
+
+
+class BatchRunner:
+    """
+    Ejecuta las tres etapas del pipeline y junta las métricas de cada una.
+    """
+
+    def __init__(self, items, state_path, ocr_workers, llm_workers, batch_size, queue_size):
+        self.items = items
+        self.state_path = state_path
+        self.ocr_workers = ocr_workers
+        self.llm_workers = llm_workers
+        self.batch_size = batch_size
+        self.text_queue = queue.Queue(maxsize=queue_size)
+        self.data_queue = queue.Queue(maxsize=queue_size)
+        self.latencies = {"ocr": [], "llm": [], "db": []}
+        self.saved = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        # Si la etapa de LLM ya recibió el fin de la cola de textos.
+        self._textos_terminados = False
+
+    def _record(self, entry):
+        with self._lock:
+            if entry["estado"] == "ok":
+                self.saved += 1
+            else:
+                self.errors += 1
+                log(logger, f"Error en carpeta {entry['numero_carpeta']} ({entry['etapa']}): {entry['error']}", logging.ERROR,
+                    numero_carpeta=entry['numero_carpeta'], etapa=entry['etapa'])
+            with open(self.state_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _ocr_stage(self):
+        pending = iter(self.items)
+        in_flight = {}
+        try:
+            with ProcessPoolExecutor(max_workers=self.ocr_workers) as executor:
+                while True:
+                    # Mantenemos como máximo dos documentos por proceso en vuelo.
+                    while len(in_flight) < self.ocr_workers * 2:
+                        item = next(pending, None)
+                        if item is None:
+                            break
+                        in_flight[executor.submit(_ocr_document, item[0])] = item
+                    if not in_flight:
+                        break
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        pdf_path, numero_carpeta = in_flight.pop(future)
+                        try:
+                            text, sha256, segundos = future.result()
+                        except Exception as e:
+                            self._record({"archivo": pdf_path, "numero_carpeta": numero_carpeta, "estado": "error", "etapa": "ocr", "error": str(e)})
+                            continue
+                        self.latencies["ocr"].append(segundos)
+                        # put() bloquea si la etapa de LLM está atrasada (contrapresión).
+                        self.text_queue.put((pdf_path, numero_carpeta, text, sha256))
+        except Exception:
+            # Por ejemplo, BrokenProcessPool: los documentos sin procesar quedan
+            # fuera del archivo de estado y se toman al relanzar.
+            logger.exception("La etapa de OCR se detuvo.")
+        finally:
+            # Siempre avisamos el fin, para que las etapas siguientes no esperen para siempre.
+            self.text_queue.put(_FIN)
+
+    async def _extract(self, item, limiter, semaphore):
+        pdf_path, numero_carpeta, text, sha256 = item
+        loop = asyncio.get_running_loop()
+        try:
+            inicio = time.perf_counter()
+            try:
+                data = await aextract_data_with_langchain(text, limiter=limiter)
+            except Exception as e:
+                self._record({"archivo": pdf_path, "numero_carpeta": numero_carpeta, "estado": "error", "etapa": "llm", "error": str(e)})
+                return
+            self.latencies["llm"].append(time.perf_counter() - inicio)
+            if not data:
+                self._record({"archivo": pdf_path, "numero_carpeta": numero_carpeta, "estado": "error", "etapa": "llm", "error": "No se pudieron extraer datos"})
+                return
+            # put() bloquea si la escritura en MongoDB está atrasada (contrapresión).
+            data = {**data.model_dump(), 'extraccion': extraction_metadata(sha256)}
+            await loop.run_in_executor(None, self.data_queue.put, (pdf_path, numero_carpeta, data, text))
+        finally:
+            semaphore.release()
+
+    async def _allm_stage(self):
+        """
+        Etapa de extracción: un único event loop con como máximo `llm_workers`
+        extracciones en curso, que comparten el cliente de OpenAI y el
+        limitador de tokens por minuto.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.llm_workers)
+        limiter = TokenRateLimiter(LLM_TOKENS_PER_MINUTE)
+        tasks = set()
+        try:
+            while True:
+                # No tomamos un texto nuevo hasta que haya lugar para extraerlo.
+                await semaphore.acquire()
+                item = await loop.run_in_executor(None, self.text_queue.get)
+                if item is _FIN:
+                    self._textos_terminados = True
+                    semaphore.release()
+                    break
+                task = asyncio.create_task(self._extract(item, limiter, semaphore))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            # Un error en una extracción no corta la espera de las demás.
+            for resultado in await asyncio.gather(*tasks, return_exceptions=True):
+                if isinstance(resultado, Exception):
+                    log(logger, f"Error inesperado en una extracción: {resultado}", logging.ERROR)
+
+    def _llm_stage(self):
+        try:
+            asyncio.run(self._allm_stage())
+        except Exception:
+            logger.exception("La etapa de extracción se detuvo.")
+            # Vaciamos la cola de textos para que la etapa de OCR no quede bloqueada en put().
+            while not self._textos_terminados:
+                item = self.text_queue.get()
+                if item is _FIN:
+                    break
+                pdf_path, numero_carpeta, _, _ = item
+                self._record({"archivo": pdf_path, "numero_carpeta": numero_carpeta, "estado": "error", "etapa": "llm", "error": "La etapa de extracción se detuvo."})
+        finally:
+            # Con las extracciones en curso ya terminadas, avisamos el fin a la etapa de guardado.
+            self.data_queue.put(_FIN)
+
+    def _flush(self, batch):
+        inicio = time.perf_counter()
+        # El texto OCR se guarda para poder reextraer sin el PDF (ver reextract.py).
+        save_ocr_texts((data['extraccion']['pdf_sha256'], text) for _, _, data, text in batch)
+        resultados = save_many_to_mongodb([(data, numero_carpeta) for _, numero_carpeta, data, _ in batch], batch_size=self.batch_size)
+        self.latencies["db"].append(time.perf_counter() - inicio)
+        for (pdf_path, numero_carpeta, _, _), resultado in zip(batch, resultados):
+            if resultado["ok"]:
+                self._record({"archivo": pdf_path, "numero_carpeta": numero_carpeta, "estado": "ok"})
+            else:
+                self._record({"archivo": pdf_path, "numero_carpeta": numero_carpeta, "estado": "error", "etapa": "db", "error": resultado["error"]})
+
+    def _db_stage(self):
+        finished = False
+        batch = []
+        while not finished:
+            try:
+                item = self.data_queue.get(timeout=2)
+            except queue.Empty:
+                item = None
+            if item is _FIN:
+                finished = True
+            elif item is not None:
+                batch.append(item)
+            # Escribimos cuando el lote está lleno o si hubo una pausa sin datos nuevos.
+            if batch and (len(batch) >= self.batch_size or item is None or finished):
+                try:
+                    self._flush(batch)
+                except Exception as e:
+                    # Se sigue leyendo la cola para no bloquear a la etapa de extracción.
+                    logger.exception("No se pudo guardar un lote.")
+                    for pdf_path, numero_carpeta, _, _ in batch:
+                        self._record({"archivo": pdf_path, "numero_carpeta": numero_carpeta, "estado": "error", "etapa": "db", "error": str(e)})
+                batch = []
+
+    def run(self):
+        if get_db_collection() is None:
+            raise RuntimeError("No hay conexión a la base de datos.")
+
+        inicio = time.perf_counter()
+        threads = [threading.Thread(target=self._ocr_stage, name="ocr")]
+        threads.append(threading.Thread(target=self._llm_stage, name="llm"))
+        threads.append(threading.Thread(target=self._db_stage, name="db"))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - inicio
+
+    def report(self, elapsed):
+        """
+        Imprime el resumen de rendimiento: documentos por minuto y percentiles
+        de latencia por etapa.
+        """
+        print("\n--- Resumen de la carga masiva ---")
+        print(f"Documentos guardados: {self.saved} | con error: {self.errors} | tiempo total: {elapsed:.1f} s")
+        if elapsed > 0:
+            print(f"Rendimiento: {self.saved / elapsed * 60:.2f} documentos/minuto")
+        for etapa, valores in self.latencies.items():
+            if not valores:
+                continue
+            p50, p90, p99 = _percentiles(valores, (50, 90, 99))
+            print(f"  {etapa:>3}: n={len(valores)} p50={p50:.2f}s p90={p90:.2f}s p99={p99:.2f}s máx={max(valores):.2f}s")
+
+
+def _percentiles(valores, percentiles):
+    if len(valores) == 1:
+        return [valores[0]] * len(percentiles)
+    cortes = statistics.quantiles(valores, n=100, method="inclusive")
+    return [cortes[p - 1] for p in percentiles]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Carga masiva de escrituras públicas desde PDFs.")
+    origen = parser.add_mutually_exclusive_group(required=True)
+    origen.add_argument("--dir", help="Directorio con los PDFs; el número de carpeta se toma del nombre del archivo.")
+    origen.add_argument("--manifest", help="CSV con las columnas 'archivo' y 'numero_carpeta'.")
+    parser.add_argument("--estado", help="Archivo de estado para reanudar (por defecto batch_estado.jsonl junto a los PDFs).")
+    parser.add_argument("--ocr-workers", type=int, default=os.cpu_count() or 1, help="Procesos para la etapa de OCR.")
+    parser.add_argument("--llm-workers", type=int, default=4, help="Extracciones con GPT en simultáneo.")
+    parser.add_argument("--batch-size", type=int, default=50, help="Documentos por escritura en lote a MongoDB.")
+    parser.add_argument("--queue-size", type=int, default=16, help="Capacidad de las colas entre etapas.")
+    args = parser.parse_args(argv)
+    start_metrics_server()
+
+    if args.dir:
+        items = scan_directory(args.dir)
+        state_path = args.estado or os.path.join(args.dir, "batch_estado.jsonl")
+    else:
+        items = load_manifest(args.manifest)
+        state_path = args.estado or os.path.join(os.path.dirname(os.path.abspath(args.manifest)), "batch_estado.jsonl")
+
+    completed = load_completed(state_path)
+    pendientes = [item for item in items if item[1] not in completed]
+    print(f"{len(items)} documentos encontrados, {len(items) - len(pendientes)} ya cargados, {len(pendientes)} pendientes.")
+    if not pendientes:
+        return
+
+    runner = BatchRunner(
+        pendientes,
+        state_path,
+        ocr_workers=max(1, args.ocr_workers),
+        llm_workers=max(1, args.llm_workers),
+        batch_size=max(1, args.batch_size),
+        queue_size=max(1, args.queue_size),
+    )
+    elapsed = runner.run()
+    runner.report(elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from .metrics import increment
+
+
+def hash_key(*parts):
+    """
+    Calcula una clave SHA-256 estable a partir de las partes recibidas
+    (cadenas, bytes o cualquier valor serializable a JSON).
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            data = part
+        elif isinstance(part, str):
+            data = part.encode("utf-8")
+        else:
+            data = json.dumps(part, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+        # Prefijamos el largo para que ("ab", "c") y ("a", "bc") no colisionen.
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    Caché en disco local, direccionada por contenido. Cada entrada se guarda
+    como JSON comprimido con gzip en un archivo propio. El tamaño total se
+    limita a `max_bytes`, desalojando primero las entradas usadas hace más
+    tiempo (LRU según la fecha de modificación, que se actualiza en cada acierto).
+    Opcionalmente las entradas expiran después de `ttl` segundos.
+    Para no recorrer el directorio en cada escritura, el tamaño se lleva en
+    un total estimado: el directorio se recorre la primera vez, cuando el
+    total supera el límite y cada `rescan_every` escrituras (otros procesos
+    también escriben), y el desalojo baja hasta `low_water` del límite.
+    Los aciertos y fallos se cuentan en la métrica escrituras_cache_total
+    con la etiqueta cache=`name`.
+    """
+
+    def __init__(self, directory, max_bytes, ttl=None, name="cache", rescan_every=100, low_water=0.9):
+        self.directory = directory
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.rescan_every = rescan_every
+        self.low_water = low_water
+        self.hits = 0
+        self.misses = 0
+        self._size = None  # Total estimado en bytes; None hasta el primer recorrido.
+        self._writes = 0  # Escrituras desde el último recorrido.
+        self._size_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _path(self, key):
+        # Repartimos los archivos en subcarpetas para no tener miles en un mismo directorio.
+        return os.path.join(self.directory, key[:2], f"{key}.json.gz")
+
+    def get(self, key):
+        """
+        Devuelve el valor guardado para `key`, o None si no existe o expiró.
+        """
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self._miss()
+            return None
+
+        if self.ttl and time.time() - entry.get("creado", 0) > self.ttl:
+            self._remove(path)
+            self._miss()
+            return None
+
+        try:
+            os.utime(path) # Marca la entrada como usada recientemente.
+        except OSError:
+            pass
+        self.hits += 1
+        increment("escrituras_cache_total", 1, "Consultas a las cachés en disco", cache=self.name, resultado="acierto")
+        return entry["valor"]
+
+    def _miss(self):
+        self.misses += 1
+        increment("escrituras_cache_total", 1, "Consultas a las cachés en disco", cache=self.name, resultado="fallo")
+
+    def set(self, key, value):
+        """
+        Guarda `value` (serializable a JSON) bajo `key` y aplica el límite de tamaño.
+        """
+        if not self.enabled:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Escribimos en un archivo temporal y lo renombramos para que otro
+        # proceso nunca lea una entrada a medio escribir.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as f:
+                f.write(json.dumps({"creado": time.time(), "valor": value}, ensure_ascii=False, default=str).encode("utf-8"))
+            nuevo = os.path.getsize(tmp_path)
+            try:
+                anterior = os.path.getsize(path)
+            except OSError:
+                anterior = 0
+            os.replace(tmp_path, path)
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        with self._size_lock:
+            self._writes += 1
+            if self._size is not None:
+                self._size += nuevo - anterior
+            if self._size is None or self._size > self.max_bytes or self._writes >= self.rescan_every:
+                self._evict()
+
+    def stats(self):
+        """
+        Devuelve los contadores de aciertos y fallos de esta instancia.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json.gz"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _evict(self):
+        """
+        Recorre el directorio, recalcula el total y, si supera el límite,
+        borra las entradas menos usadas hasta bajar a `low_water` del límite
+        (así el próximo desalojo no llega en la escritura siguiente).
+        """
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            objetivo = self.max_bytes * self.low_water
+            for _, size, path in sorted(entries):
+                self._remove(path)
+                total -= size
+                if total <= objetivo:
+                    break
+        self._size = total
+        self._writes = 0
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,94 +1,241 @@
-import streamlit as st
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne, ASCENDING, DESCENDING, TEXT
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, OperationFailure
 from datetime import datetime
+import logging
 import os
+import math
+import threading
+import zlib
 
-# --- Variable de estado para la conexión ---
-# Usamos esto para evitar reconectar en cada rerun de Streamlit.
-# Es más eficiente que crear una conexión global al inicio del script.
-if "db_client" not in st.session_state:
-    st.session_state.db_client = None
+from .models import EscrituraPublicaData
+from .rules import parse_spanish_date, normalize_identifier, normalize_name
+from .metrics import get_logger, log, span
 
-def get_db_collection():
+# Las credenciales y el host de MongoDB pueden venir del archivo .env
+load_dotenv()
+
+logger = get_logger("database")
+
+# --- Cliente compartido por proceso ---
+# Un único MongoClient (con su pool de conexiones) para todo el proceso: lo
+# comparten todas las sesiones de Streamlit, los hilos y los scripts. El
+# cliente detecta solo las caídas y reconexiones, por eso no se hace un ping
+# antes de cada operación.
+_client = None
+_client_lock = threading.Lock()
+_indexes_ready = False
+
+MONGODB_DB_NAME = os.getenv("MONGO_DATABASE", "extractor_db") # Nombre de la DB
+MONGODB_COLLECTION = "escrituras"
+# Texto OCR de cada PDF, comprimido, identificado por el SHA-256 del PDF.
+OCR_TEXT_COLLECTION = "textos_ocr"
+# Migraciones de datos ya aplicadas, para no repetirlas en cada proceso.
+MIGRATIONS_COLLECTION = "migraciones"
+
+
+def _mongodb_uri():
     """
-    Establece o reutiliza una conexión a MongoDB y devuelve la colección.
+    Construye la URI de conexión a partir de las variables de entorno.
     """
-    if "db_client" in st.session_state and st.session_state.db_client:
-        try:
-            st.session_state.db_client.admin.command('ping')
-            db = st.session_state.db_client['extractor_db']
-            return db['escrituras']
-        except ConnectionFailure:
-            st.warning("La conexión a MongoDB se perdió. Intentando reconectar...")
-            st.session_state.db_client = None
+    # --- CAMBIO CLAVE PARA DOCKER CON AUTENTICACIÓN ---
+    # Usamos variables de entorno para la URI, usuario y contraseña de MongoDB.
+    # Dentro de Docker Compose, 'mongodb' es el nombre del servicio.
+    mongodb_host = os.getenv("MONGODB_HOST", "mongodb") # Por defecto 'mongodb' si es en Docker Compose
+    mongodb_port = os.getenv("MONGODB_PORT", "27017")
+    mongodb_user = os.getenv("MONGO_INITDB_ROOT_USERNAME")
+    mongodb_pass = os.getenv("MONGO_INITDB_ROOT_PASSWORD")
+
+    auth_source = "admin"
+
+    if mongodb_user and mongodb_pass:
+        # Nos aseguramos que pymongo esté usando la autenticación correcta (authSource)
+        return f"mongodb://{mongodb_user}:{mongodb_pass}@{mongodb_host}:{mongodb_port}/{MONGODB_DB_NAME}?authSource={auth_source}"
+    log(logger, "No se encontraron credenciales de MongoDB. Conectando sin autenticación (no recomendado para producción).", logging.WARNING)
+    return f"mongodb://{mongodb_host}:{mongodb_port}/{MONGODB_DB_NAME}"
+
 
+def get_client() -> MongoClient:
+    """
+    Devuelve el MongoClient del proceso, creándolo la primera vez.
+    El tamaño del pool y los timeouts se configuran con variables de entorno.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(
+                    _mongodb_uri(),
+                    maxPoolSize=int(os.getenv("MONGODB_MAX_POOL_SIZE", "50")),
+                    minPoolSize=int(os.getenv("MONGODB_MIN_POOL_SIZE", "0")),
+                    maxIdleTimeMS=int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000")),
+                    serverSelectionTimeoutMS=int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+                    connectTimeoutMS=int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "5000")),
+                    socketTimeoutMS=int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "30000")),
+                )
+    return _client
+
+
+def ensure_indexes(collection):
+    """
+    Crea los índices de la colección de escrituras (si ya existen, no hace nada).
+    El índice único sobre 'numero_carpeta' evita que find_one y el upsert de
+    save_to_mongodb recorran toda la colección y que se dupliquen carpetas.
+    Los demás índices sirven a search_escrituras.
+    """
+    indices = [
+        ([('busqueda.cuils', ASCENDING)], {'name': 'busqueda_cuils'}),
+        ([('busqueda.documentos', ASCENDING)], {'name': 'busqueda_documentos'}),
+        ([('busqueda.escribano', ASCENDING), ('busqueda.registro', ASCENDING)], {'name': 'busqueda_escribano_registro'}),
+        ([('busqueda.registro', ASCENDING)], {'name': 'busqueda_registro'}),
+        ([('busqueda.matricula', ASCENDING)], {'name': 'busqueda_matricula'}),
+        ([('busqueda.partida', ASCENDING)], {'name': 'busqueda_partida'}),
+        ([('fecha_otorgamiento_iso', DESCENDING), ('numero_carpeta', ASCENDING)], {'name': 'fecha_otorgamiento'}),
+        ([('extraccion.pdf_sha256', ASCENDING)], {'name': 'extraccion_pdf_sha256'}),
+        ([('ultima_modificacion', ASCENDING)], {'name': 'ultima_modificacion'}),
+        ([('observaciones', TEXT), ('descripcion_propiedad.direccion', TEXT)], {'name': 'texto_observaciones_direccion', 'default_language': 'spanish'}),
+    ]
     try:
-        # --- CAMBIO CLAVE PARA DOCKER CON AUTENTICACIÓN ---
-        # Usamos variables de entorno para la URI, usuario y contraseña de MongoDB.
-        # Dentro de Docker Compose, 'mongodb' es el nombre del servicio.
-        mongodb_host = os.getenv("MONGODB_HOST", "mongodb") # Por defecto 'mongodb' si es en Docker Compose
-        mongodb_port = os.getenv("MONGODB_PORT", "27017")
-        mongodb_user = os.getenv("MONGO_INITDB_ROOT_USERNAME")
-        mongodb_pass = os.getenv("MONGO_INITDB_ROOT_PASSWORD")
-        mongodb_db_name = os.getenv("MONGO_DATABASE", "extractor_db") # Nombre de la DB
-
-        auth_source = "admin" 
-
-        # Construir la URI de conexión
-        if mongodb_user and mongodb_pass:
-            # Nos aseguramos que pymongo esté usando la autenticación correcta (authSource)
-            MONGODB_URI = f"mongodb://{mongodb_user}:{mongodb_pass}@{mongodb_host}:{mongodb_port}/{mongodb_db_name}?authSource={auth_source}"
-        else:
-            MONGODB_URI = f"mongodb://{mongodb_host}:{mongodb_port}/{mongodb_db_name}"
-            st.warning("No se encontraron credenciales de MongoDB. Conectando sin autenticación (no recomendado para producción).")
+        collection.create_index([('numero_carpeta', ASCENDING)], unique=True, name='numero_carpeta_unico')
+    except OperationFailure as e:
+        # Pasa si ya hay carpetas duplicadas: la aplicación sigue funcionando, pero hay que depurarlas.
+        log(logger, f"No se pudo crear el índice único de 'numero_carpeta' (¿carpetas duplicadas?): {e}", logging.ERROR)
+    for claves, opciones in indices:
+        try:
+            collection.create_index(claves, **opciones)
+        except OperationFailure as e:
+            # Por ejemplo, un índice existente con el mismo nombre y otras opciones: sin él las búsquedas son más lentas.
+            log(logger, f"No se pudo crear el índice '{opciones['name']}': {e}", logging.ERROR)
 
-        client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)
-        client.admin.command('ping') # Esto autentica contra la DB 'admin' si authSource está en la URI.
 
-        st.session_state.db_client = client
-        st.success(f"Conexión a MongoDB ({mongodb_host}:{mongodb_port}) establecida con éxito.")
+def search_fields(data: dict) -> dict:
+    """
+    Calcula los campos derivados que usa la búsqueda: identificadores solo con
+    dígitos y nombres sin acentos ni mayúsculas (así '20-12345678-9' y
+    '20123456789' coinciden), más la fecha de otorgamiento como fecha real.
+    """
+    partes = data.get('partes_intervinientes') or []
+    propiedad = data.get('descripcion_propiedad') or {}
+    busqueda = {
+        'cuils': sorted({normalize_identifier(p.get('numero_CUIL')) for p in partes} - {''}),
+        'documentos': sorted({normalize_identifier(p.get('numero_documento')) for p in partes} - {''}),
+        'escribano': normalize_name(data.get('escribano')),
+        'registro': normalize_identifier(data.get('registro_escribano')),
+        'matricula': normalize_identifier(propiedad.get('matricula')),
+        'partida': normalize_identifier(propiedad.get('Partida')),
+    }
+    return {'busqueda': busqueda, 'fecha_otorgamiento_iso': parse_spanish_date(data.get('fecha_otorgamiento'))}
 
-        db = client[mongodb_db_name] # Aquí seleccionamos la base de datos de trabajo
-        return db['escrituras']
-    except Exception as e:
-        st.error(f"Error crítico al conectar a la base de datos: {e}. Asegúrate de que MongoDB esté corriendo y las credenciales sean correctas.")
-        return None
 
-def save_to_mongodb(data: dict, numero_carpeta: int) -> bool:
+def _backfill_search_fields(collection, batch_size: int = 500):
     """
-    Guarda o actualiza una escritura en MongoDB.
+    Completa los campos de búsqueda de los documentos guardados antes de que
+    existieran. Corre una sola vez por base de datos: al terminar se registra
+    en la colección de migraciones y los demás procesos no vuelven a recorrer
+    la colección (los documentos nuevos ya se guardan con esos campos).
+    """
+    migraciones = collection.database[MIGRATIONS_COLLECTION]
+    if migraciones.find_one({'_id': 'campos_busqueda'}):
+        return
+    operations = []
+    for document in collection.find({'busqueda': {'$exists': False}}):
+        operations.append(UpdateOne({'_id': document['_id']}, {'$set': search_fields(document)}))
+        if len(operations) >= batch_size:
+            collection.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+    migraciones.update_one({'_id': 'campos_busqueda'}, {'$set': {'fecha': datetime.now()}}, upsert=True)
 
-    Returns:
-        bool: True si la operación fue exitosa, False en caso de error.
+
+def _bootstrap(collection):
     """
-    collection = get_db_collection()
-    if collection is None:
-        st.error("No se puede guardar: no hay conexión a la base de datos.")
-        return False
+    Índices y migraciones de la colección, una vez por proceso. Sus errores
+    se registran pero no impiden usar la base de datos; solo una falla de
+    conexión se propaga.
+    """
+    for paso in (ensure_indexes, _backfill_search_fields):
+        try:
+            paso(collection)
+        except ConnectionFailure:
+            raise
+        except Exception as e:
+            log(logger, f"Falló la preparación de la base de datos ({paso.__name__}): {e}", logging.ERROR)
 
-    if not numero_carpeta:
-        st.error("El número de carpeta no puede estar vacío.")
-        return False
 
+def get_db_collection():
+    """
+    Devuelve la colección de escrituras usando el cliente compartido del proceso.
+    La primera vez que se llama en el proceso crea los índices (ver _bootstrap).
+    """
+    global _indexes_ready
+    try:
+        collection = get_client()[MONGODB_DB_NAME][MONGODB_COLLECTION]
+        if not _indexes_ready:
+            with _client_lock:
+                if not _indexes_ready:
+                    _bootstrap(collection)
+                    _indexes_ready = True
+        return collection
+    except Exception as e:
+        log(logger, f"Error crítico al conectar a la base de datos: {e}. Asegúrate de que MongoDB esté corriendo y las credenciales sean correctas.", logging.ERROR)
+        return None
+
+def build_update_operations(data: dict, numero_carpeta: int, now: datetime = None, campos_editados=()) -> dict:
+    """
+    Construye el documento de actualización para guardar una escritura:
+    $set de todos los datos con 'ultima_modificacion' y 'fecha_creacion' solo al insertar.
+    `campos_editados` son las rutas corregidas a mano respecto de lo que
+    devolvió la extracción; reemplazan a las que hubiera guardadas.
+    """
     update_payload = data.copy()
     update_payload['numero_carpeta'] = numero_carpeta
     # Eliminamos el _id y fecha_creacion para que no cree problemas cuando se hace una modificación a los datos.
     update_payload.pop('_id', None)
     update_payload.pop('fecha_creacion', None)
+    # La versión solo la incrementa la base de datos (ver save_changes_to_mongodb).
+    update_payload.pop('version', None)
+    update_payload['campos_editados'] = sorted(campos_editados or [])
+    update_payload.update(search_fields(update_payload))
 
-    now = datetime.now()
-    
-    update_operations = {
+    now = now or datetime.now()
+
+    return {
         '$set': {
             **update_payload,
             'ultima_modificacion': now
         },
         '$setOnInsert': {
             'fecha_creacion': now
+        },
+        '$inc': {
+            'version': 1
         }
     }
 
+@span("mongo.guardar")
+def save_to_mongodb(data: dict, numero_carpeta: int, campos_editados=()) -> bool:
+    """
+    Guarda o actualiza una escritura en MongoDB.
+
+    Args:
+        campos_editados: Rutas que se corrigieron a mano antes de guardar
+            (ver changed_paths); una reextracción las conserva.
+
+    Returns:
+        bool: True si la operación fue exitosa, False en caso de error.
+    """
+    collection = get_db_collection()
+    if collection is None:
+        log(logger, "No se puede guardar: no hay conexión a la base de datos.", logging.ERROR, numero_carpeta=numero_carpeta)
+        return False
+
+    if not numero_carpeta:
+        log(logger, "No se puede guardar: el número de carpeta está vacío.", logging.ERROR)
+        return False
+
+    update_operations = build_update_operations(data, numero_carpeta, campos_editados=campos_editados)
+
     try:
         resultado = collection.update_one(
             {'numero_carpeta': numero_carpeta},
@@ -98,25 +245,389 @@ def save_to_mongodb(data: dict, numero_carpeta: int) -> bool:
         # No mostramos el mensaje de éxito aquí, lo hará app.py.
         return True # Devolvemos True en caso de éxito.
     except Exception as e:
-        st.error(f"Error al guardar/actualizar el documento en MongoDB: {e}")
+        log(logger, f"Error al guardar/actualizar el documento en MongoDB: {e}", logging.ERROR, numero_carpeta=numero_carpeta)
         return False # Devolvemos False en caso de error.
 
 
+# Resultados posibles de save_changes_to_mongodb
+GUARDADO = "guardado"
+SIN_CAMBIOS = "sin_cambios"
+CONFLICTO = "conflicto"
+ERROR_GUARDADO = "error"
+
+# Campos cuyos cambios obligan a recalcular los campos de búsqueda derivados.
+_CAMPOS_BUSQUEDA = ('partes_intervinientes', 'escribano', 'registro_escribano', 'descripcion_propiedad', 'fecha_otorgamiento')
+
+
+def _normalize_value(value):
+    # Los widgets devuelven "" donde había None, y el editor de tablas NaN.
+    if value is None or value == "" or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value
+
+
+def changed_paths(original, actual, prefix: str = "") -> dict:
+    """
+    Compara los datos originales con los editados y devuelve solo las rutas
+    que cambiaron, en notación de puntos de MongoDB (ej.
+    'partes_intervinientes.3.numero_documento' o
+    'descripcion_propiedad.nomenclatura_catastral.1.manzana').
+    Si una lista cambió de largo (se agregaron o quitaron filas), se devuelve
+    la lista entera.
+
+    Returns:
+        dict: {ruta: valor nuevo}
+    """
+    cambios = {}
+    if isinstance(original, dict) and isinstance(actual, dict):
+        for clave in set(original) | set(actual):
+            if not prefix and clave in ('_id', 'fecha_creacion', 'ultima_modificacion', 'version', 'busqueda', 'fecha_otorgamiento_iso',
+                                        'extraccion', 'campos_editados'):
+                continue
+            ruta = f"{prefix}{clave}"
+            cambios.update(changed_paths(original.get(clave), actual.get(clave), ruta + "."))
+        return cambios
+    ruta = prefix[:-1]
+    if isinstance(original, list) and isinstance(actual, list) and len(original) == len(actual):
+        for i, (antes, despues) in enumerate(zip(original, actual)):
+            cambios.update(changed_paths(antes, despues, f"{ruta}.{i}."))
+        return cambios
+    if _normalize_value(original) != _normalize_value(actual):
+        cambios[ruta] = actual
+    return cambios
+
+
+@span("mongo.guardar_cambios")
+def save_changes_to_mongodb(data: dict, numero_carpeta: int, original: dict) -> str:
+    """
+    Guarda solo los campos que cambiaron respecto de `original` (la versión
+    cargada desde la base), con control de concurrencia optimista: la
+    actualización solo se aplica si el documento sigue en la versión que se
+    cargó. Si otra persona lo guardó mientras tanto, no se pisa su trabajo y
+    se devuelve CONFLICTO. Las rutas cambiadas se agregan a 'campos_editados'
+    para que una reextracción no las pise. No usa Streamlit.
+
+    Returns:
+        str: GUARDADO, SIN_CAMBIOS, CONFLICTO o ERROR_GUARDADO.
+    """
+    cambios = changed_paths(original, data)
+    if not cambios:
+        return SIN_CAMBIOS
+
+    collection = get_db_collection()
+    if collection is None:
+        return ERROR_GUARDADO
+
+    cambios = {ruta: _normalize_value(valor) if not isinstance(valor, (dict, list)) else valor for ruta, valor in cambios.items()}
+    editados = sorted(cambios)
+    if any(ruta.split('.')[0] in _CAMPOS_BUSQUEDA for ruta in cambios):
+        cambios.update(search_fields(data))
+
+    version = original.get('version') or 0
+    # Los documentos guardados antes de existir la versión no tienen el campo.
+    filtro_version = version if version else {'$in': [None, 0]}
+    try:
+        resultado = collection.update_one(
+            {'numero_carpeta': int(numero_carpeta), 'version': filtro_version},
+            {
+                '$set': {**cambios, 'ultima_modificacion': datetime.now()},
+                '$inc': {'version': 1},
+                '$addToSet': {'campos_editados': {'$each': editados}},
+            },
+        )
+    except Exception as e:
+        log(logger, f"Error al guardar los cambios en MongoDB: {e}", logging.ERROR)
+        return ERROR_GUARDADO
+    return GUARDADO if resultado.matched_count else CONFLICTO
+
+
+def carpeta_version(numero_carpeta: int):
+    """
+    Versión actual de la escritura guardada en la carpeta: None si la carpeta
+    está libre (o no hay conexión) y 0 si se guardó antes de existir la versión.
+    """
+    collection = get_db_collection()
+    if collection is None:
+        return None
+    documento = collection.find_one({'numero_carpeta': int(numero_carpeta)}, {'version': 1})
+    return None if documento is None else documento.get('version') or 0
+
+
+@span("mongo.guardar_analisis")
+def save_analysis_to_mongodb(data: dict, numero_carpeta: int, version, campos_editados=()) -> str:
+    """
+    Guarda el documento completo de un análisis nuevo con control de
+    concurrencia optimista, como save_changes_to_mongodb: `version` es la que
+    tenía la carpeta al cargar el análisis (ver carpeta_version; None si
+    estaba libre). Si desde entonces alguien guardó en la carpeta, no se pisa
+    su trabajo y se devuelve CONFLICTO. No usa Streamlit.
+
+    Returns:
+        str: GUARDADO, CONFLICTO o ERROR_GUARDADO.
+    """
+    collection = get_db_collection()
+    if collection is None or not numero_carpeta:
+        return ERROR_GUARDADO
+    if version is None:
+        filtro_version = {'$exists': False}
+    else:
+        filtro_version = version if version else {'$in': [None, 0]}
+    try:
+        # Si la versión no coincide, el upsert intenta crear otra escritura con
+        # el mismo número de carpeta y el índice único lo rechaza.
+        collection.update_one(
+            {'numero_carpeta': int(numero_carpeta), 'version': filtro_version},
+            build_update_operations(data, numero_carpeta, campos_editados=campos_editados),
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return CONFLICTO
+    except Exception as e:
+        log(logger, f"Error al guardar el análisis en MongoDB: {e}", logging.ERROR)
+        return ERROR_GUARDADO
+    return GUARDADO
+
+
+@span("mongo.guardar_lote")
+def save_many_to_mongodb(items, batch_size: int = 500) -> list:
+    """
+    Guarda o actualiza muchas escrituras con escrituras en lote (bulk_write no
+    ordenado), con la misma semántica de 'fecha_creacion' y
+    'ultima_modificacion' que save_to_mongodb. No usa Streamlit, por lo que
+    sirve para workers y scripts.
+
+    Args:
+        items: Iterable de pares (data, numero_carpeta).
+        batch_size (int): Cantidad de upserts por cada bulk_write.
+
+    Returns:
+        list: Un dict por elemento, en el mismo orden, con 'numero_carpeta',
+        'ok' (bool), 'insertado' (True si se creó el documento) y 'error'.
+    """
+    items = list(items)
+    resultados = [{'numero_carpeta': numero_carpeta, 'ok': False, 'insertado': False, 'error': None} for _, numero_carpeta in items]
+
+    validos = []
+    for i, (data, numero_carpeta) in enumerate(items):
+        if not numero_carpeta:
+            resultados[i]['error'] = "El número de carpeta no puede estar vacío."
+        else:
+            validos.append(i)
+    if not validos:
+        return resultados
+
+    collection = get_db_collection()
+    if collection is None:
+        for i in validos:
+            resultados[i]['error'] = "No hay conexión a la base de datos."
+        return resultados
+
+    for start in range(0, len(validos), batch_size):
+        lote = validos[start:start + batch_size]
+        now = datetime.now()
+        operations = [
+            UpdateOne(
+                {'numero_carpeta': items[i][1]},
+                build_update_operations(items[i][0], items[i][1], now),
+                upsert=True
+            )
+            for i in lote
+        ]
+        errores = {}
+        try:
+            resultado = collection.bulk_write(operations, ordered=False)
+            upserted = resultado.upserted_ids or {}
+        except BulkWriteError as e:
+            # Con ordered=False el resto del lote se aplica igual; solo fallan los informados.
+            errores = {error['index']: error.get('errmsg', str(error)) for error in e.details.get('writeErrors', [])}
+            upserted = {u['index']: u['_id'] for u in e.details.get('upserted', [])}
+        except Exception as e:
+            errores = {j: str(e) for j in range(len(lote))}
+            upserted = {}
+        for j, i in enumerate(lote):
+            if j in errores:
+                resultados[i]['error'] = errores[j]
+            else:
+                resultados[i]['ok'] = True
+                resultados[i]['insertado'] = j in upserted
+    return resultados
+
+
+def save_ocr_texts(items) -> bool:
+    """
+    Guarda comprimido (zlib) el texto OCR de cada PDF, identificado por su
+    SHA-256, para poder volver a extraer los datos sin el PDF y sin repetir
+    el OCR (ver reextract.py), con su firma MinHash para detectar escrituras
+    casi duplicadas (ver similarity.py). Un texto ya guardado no se reescribe.
+    No usa Streamlit.
+
+    Args:
+        items: Iterable de pares (sha256 del PDF, texto).
+
+    Returns:
+        bool: True si se guardaron, False si no hay conexión o falló.
+    """
+    from .similarity import minhash_signature
+
+    now = datetime.now()
+    operations = [
+        UpdateOne(
+            {'_id': sha256},
+            {'$setOnInsert': {
+                'texto': zlib.compress(texto.encode('utf-8')),
+                'compresion': 'zlib',
+                'caracteres': len(texto),
+                'minhash': minhash_signature(texto).tobytes(),
+                'fecha_creacion': now,
+            }},
+            upsert=True,
+        )
+        for sha256, texto in items if sha256 and texto
+    ]
+    if not operations:
+        return True
+    try:
+        get_client()[MONGODB_DB_NAME][OCR_TEXT_COLLECTION].bulk_write(operations, ordered=False)
+        return True
+    except Exception as e:
+        log(logger, f"No se pudo guardar el texto OCR en MongoDB: {e}", logging.WARNING)
+        return False
+
+
+def load_ocr_texts(sha256s) -> dict:
+    """
+    Devuelve {sha256: texto} con los textos OCR guardados de esos PDFs.
+    """
+    documentos = get_client()[MONGODB_DB_NAME][OCR_TEXT_COLLECTION].find({'_id': {'$in': list(sha256s)}})
+    return {documento['_id']: zlib.decompress(documento['texto']).decode('utf-8') for documento in documentos}
+
+
+@span("mongo.buscar_carpeta")
 def find_escritura_by_carpeta(numero_carpeta: int):
     """
     Busca un documento en MongoDB por su número de carpeta.
+
+    Returns:
+        dict: El documento, o None si la carpeta no existe.
+
+    Raises:
+        RuntimeError: Si no hay conexión o la consulta falla (el mensaje se
+        muestra en la interfaz).
+    """
+    collection = get_db_collection()
+    if collection is None:
+        raise RuntimeError("No se puede buscar: sin conexión a la base de datos.")
+
+    try:
+        document = collection.find_one({'numero_carpeta': int(numero_carpeta)}, {'busqueda': 0, 'fecha_otorgamiento_iso': 0})
+    except Exception as e:
+        log(logger, f"Ocurrió un error durante la búsqueda: {e}", logging.ERROR, numero_carpeta=numero_carpeta)
+        raise RuntimeError(f"Ocurrió un error durante la búsqueda: {e}") from e
+    if document:
+        # Limpiamos el _id para evitar problemas al reenviarlo en una actualización.
+        document.pop('_id', None)
+    return document
+
+
+
+def reuse_escritura(numero_carpeta: int, pdf_sha256: str = None):
+    """
+    Copia los datos de una escritura ya guardada para usarlos en un análisis
+    nuevo que el usuario confirmó como duplicado, sin llamar al LLM. Las
+    correcciones hechas a mano en la original siguen marcadas como tales.
+    No usa Streamlit.
+
+    Returns:
+        dict | None: Los datos, con 'extraccion.reutilizado_de'; None si no existe o no hay conexión.
     """
     collection = get_db_collection()
     if collection is None:
-        st.error("No se puede buscar: sin conexión a la base de datos.")
         return None
-    
+    original = collection.find_one({'numero_carpeta': int(numero_carpeta)})
+    if not original:
+        return None
+    datos = {campo: original.get(campo) for campo in EscrituraPublicaData.model_fields}
+    datos['campos_editados'] = original.get('campos_editados') or []
+    datos['extraccion'] = {
+        # La versión y el modelo de la extracción original; el texto es el del PDF nuevo.
+        **{clave: valor for clave, valor in (original.get('extraccion') or {}).items() if clave in ('version', 'modelo', 'fecha')},
+        'pdf_sha256': pdf_sha256,
+        'reutilizado_de': original['numero_carpeta'],
+    }
+    return datos
+
+# Campos que se traen para listar resultados, sin el documento completo.
+SEARCH_PROJECTION = {
+    '_id': 0,
+    'numero_carpeta': 1,
+    'numero_escritura': 1,
+    'fecha_otorgamiento': 1,
+    'escribano': 1,
+    'registro_escribano': 1,
+    'descripcion_propiedad.direccion': 1,
+    'partes_intervinientes.rol': 1,
+    'partes_intervinientes.nombre': 1,
+    'partes_intervinientes.apellido': 1,
+}
+
+
+@span("mongo.busqueda")
+def search_escrituras(cuil=None, documento=None, escribano=None, registro=None, matricula=None,
+                      partida=None, fecha_desde=None, fecha_hasta=None, texto=None,
+                      page: int = 1, page_size: int = 20) -> dict:
+    """
+    Busca escrituras combinando filtros (todos opcionales): CUIT/CUIL o DNI de
+    alguna parte, escribano y registro, matrícula o partida, rango de fecha de
+    otorgamiento y texto libre en observaciones y dirección. Cada filtro usa
+    un índice, y los resultados se paginan trayendo solo los campos de
+    SEARCH_PROJECTION.
+
+    Returns:
+        dict: 'resultados' (lista de documentos parciales), 'total', 'pagina' y 'paginas'.
+        None si no hay conexión o la consulta falla.
+    """
+    collection = get_db_collection()
+    if collection is None:
+        return None
+
+    query = {}
+    if cuil:
+        query['busqueda.cuils'] = normalize_identifier(cuil)
+    if documento:
+        query['busqueda.documentos'] = normalize_identifier(documento)
+    if escribano:
+        query['busqueda.escribano'] = normalize_name(escribano)
+    if registro:
+        query['busqueda.registro'] = normalize_identifier(registro)
+    if matricula:
+        query['busqueda.matricula'] = normalize_identifier(matricula)
+    if partida:
+        query['busqueda.partida'] = normalize_identifier(partida)
+    if fecha_desde or fecha_hasta:
+        rango = {}
+        if fecha_desde:
+            rango['$gte'] = fecha_desde
+        if fecha_hasta:
+            rango['$lte'] = fecha_hasta
+        query['fecha_otorgamiento_iso'] = rango
+    projection = dict(SEARCH_PROJECTION)
+    if texto:
+        query['$text'] = {'$search': texto}
+        projection['score'] = {'$meta': 'textScore'}
+        sort = [('score', {'$meta': 'textScore'})]
+    else:
+        sort = [('fecha_otorgamiento_iso', DESCENDING), ('numero_carpeta', ASCENDING)]
+
+    page = max(1, int(page))
     try:
-        document = collection.find_one({'numero_carpeta': int(numero_carpeta)})
-        if document:
-            # Limpiamos el _id para evitar problemas al reenviarlo en una actualización.
-            document.pop('_id', None)
-        return document
+        total = collection.count_documents(query)
+        cursor = collection.find(query, projection).sort(sort).skip((page - 1) * page_size).limit(page_size)
+        return {
+            'resultados': list(cursor),
+            'total': total,
+            'pagina': page,
+            'paginas': max(1, math.ceil(total / page_size)),
+        }
     except Exception as e:
-        st.error(f"Ocurrió un error durante la búsqueda: {e}")
+        log(logger, f"Ocurrió un error durante la búsqueda avanzada: {e}", logging.ERROR)
         return None
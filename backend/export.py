@@ -0,0 +1,232 @@
+"""
+Exportación masiva de la colección de escrituras a tablas planas.
+
+Genera dos tablas:
+
+    partes          una fila por parte interviniente, con los datos de su escritura
+    nomenclaturas   una fila por nomenclatura catastral, con los datos de su escritura
+
+Los documentos se leen con un cursor por lotes y las filas se escriben por
+tramos (Parquet con pyarrow o CSV), así la memoria no crece con el tamaño de
+la colección. Con --incremental solo se exportan las escrituras modificadas
+(ultima_modificacion) desde la exportación anterior; una carpeta modificada
+vuelve a aparecer completa y prevalece la fila con la ultima_modificacion
+más reciente.
+
+Uso:
+    python -m backend.export --salida exportes/
+    python -m backend.export --salida exportes/ --formato csv --incremental
+    python -m backend.export --salida exportes/ --desde 2024-01-01
+"""
+from datetime import datetime
+import argparse
+import csv
+import json
+import os
+import time
+
+from .database import get_db_collection
+from .models import EscrituraPublicaData, ParteInterviniente, NomenclaturaCatastralData
+from .metrics import get_logger, log, span
+
+logger = get_logger("export")
+
+FORMATOS = ("parquet", "csv")
+ESTADO_ARCHIVO = "export_estado.json"
+
+# Datos de la escritura que se repiten en cada fila.
+COLUMNAS_ESCRITURA = [
+    "numero_carpeta", "numero_escritura", "fecha_otorgamiento", "fecha_otorgamiento_iso", "lugar_escritura",
+    "folio_escritura", "escribano", "registro_escribano", "direccion", "Partida", "matricula",
+    "superficie", "valor_transaccion", "ultima_modificacion",
+]
+COLUMNAS = {
+    "partes": COLUMNAS_ESCRITURA + ["indice"] + list(ParteInterviniente.model_fields),
+    "nomenclaturas": COLUMNAS_ESCRITURA + ["indice"] + list(NomenclaturaCatastralData.model_fields),
+}
+# Columnas que no son texto (para el esquema de Parquet).
+_COLUMNAS_ENTERAS = {"numero_carpeta", "indice"}
+_COLUMNAS_FECHA = {"fecha_otorgamiento_iso", "ultima_modificacion"}
+
+PROJECTION = {
+    "_id": 0,
+    "fecha_otorgamiento_iso": 1,
+    "ultima_modificacion": 1,
+    "numero_carpeta": 1,
+    **{campo: 1 for campo in EscrituraPublicaData.model_fields},
+}
+
+
+def _texto(valor):
+    if valor is None or isinstance(valor, str):
+        return valor
+    return str(valor)
+
+
+def flatten_escritura(documento):
+    """
+    Convierte una escritura en sus filas planas.
+
+    Returns:
+        dict: {'partes': [filas], 'nomenclaturas': [filas]}
+    """
+    propiedad = documento.get("descripcion_propiedad") or {}
+    base = {columna: _texto(documento.get(columna)) for columna in COLUMNAS_ESCRITURA}
+    base.update({columna: _texto(propiedad.get(columna)) for columna in ("direccion", "Partida", "matricula", "superficie")})
+    base["numero_carpeta"] = documento.get("numero_carpeta")
+    base["fecha_otorgamiento_iso"] = documento.get("fecha_otorgamiento_iso")
+    base["ultima_modificacion"] = documento.get("ultima_modificacion")
+
+    filas = {"partes": [], "nomenclaturas": []}
+    for tabla, elementos in (("partes", documento.get("partes_intervinientes")), ("nomenclaturas", propiedad.get("nomenclatura_catastral"))):
+        campos = COLUMNAS[tabla][len(COLUMNAS_ESCRITURA) + 1:]
+        for indice, elemento in enumerate(elementos or []):
+            elemento = elemento if isinstance(elemento, dict) else {}
+            filas[tabla].append({**base, "indice": indice, **{campo: _texto(elemento.get(campo)) for campo in campos}})
+    return filas
+
+
+class _CsvWriter:
+    def __init__(self, path, columnas):
+        self.path = path
+        self._archivo = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._archivo, fieldnames=columnas)
+        self._writer.writeheader()
+
+    def write(self, filas):
+        self._writer.writerows(filas)
+
+    def close(self):
+        self._archivo.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path, columnas):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Para exportar a Parquet instala pyarrow (pip install pyarrow) o usa el formato csv.") from e
+        self._pa = pa
+        self.path = path
+        self.columnas = columnas
+        self.schema = pa.schema([
+            (columna, pa.int64() if columna in _COLUMNAS_ENTERAS else pa.timestamp("ms") if columna in _COLUMNAS_FECHA else pa.string())
+            for columna in columnas
+        ])
+        self._writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write(self, filas):
+        tramo = self._pa.Table.from_pydict({columna: [fila.get(columna) for fila in filas] for columna in self.columnas}, schema=self.schema)
+        self._writer.write_table(tramo)
+
+    def close(self):
+        self._writer.close()
+
+
+def export_escrituras(salida, formato="parquet", desde=None, hasta=None, lote=1000, sufijo=None):
+    """
+    Exporta las escrituras modificadas en (desde, hasta] a los archivos
+    partes y nomenclaturas de `salida`. Lee de a `lote` documentos y escribe
+    un tramo cada `lote` documentos, sin acumular la colección en memoria.
+
+    Args:
+        salida (str): Directorio de destino (se crea si no existe).
+        formato (str): 'parquet' o 'csv'.
+        desde, hasta (datetime, optional): Límites de ultima_modificacion.
+        sufijo (str, optional): Se agrega al nombre de los archivos (ej. la fecha del corte).
+
+    Returns:
+        dict: 'archivos' ({tabla: ruta}), 'escrituras' y filas por tabla.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconocido: {formato} (usa {' o '.join(FORMATOS)}).")
+    collection = get_db_collection()
+    if collection is None:
+        raise RuntimeError("No hay conexión a la base de datos.")
+
+    query = {}
+    if desde or hasta:
+        query["ultima_modificacion"] = {}
+        if desde:
+            query["ultima_modificacion"]["$gt"] = desde
+        if hasta:
+            query["ultima_modificacion"]["$lte"] = hasta
+
+    os.makedirs(salida, exist_ok=True)
+    nombre = (lambda tabla: f"{tabla}_{sufijo}.{formato}") if sufijo else (lambda tabla: f"{tabla}.{formato}")
+    clase = _ParquetWriter if formato == "parquet" else _CsvWriter
+    writers = {tabla: clase(os.path.join(salida, nombre(tabla)), columnas) for tabla, columnas in COLUMNAS.items()}
+    resumen = {"archivos": {tabla: writer.path for tabla, writer in writers.items()}, "escrituras": 0, "partes": 0, "nomenclaturas": 0}
+    pendientes = {tabla: [] for tabla in COLUMNAS}
+
+    def volcar():
+        for tabla, filas in pendientes.items():
+            if filas:
+                writers[tabla].write(filas)
+                resumen[tabla] += len(filas)
+                filas.clear()
+
+    try:
+        with span("exportacion", formato=formato) as datos:
+            cursor = collection.find(query, PROJECTION).sort("numero_carpeta", 1).batch_size(lote)
+            for documento in cursor:
+                for tabla, filas in flatten_escritura(documento).items():
+                    pendientes[tabla].extend(filas)
+                resumen["escrituras"] += 1
+                if resumen["escrituras"] % lote == 0:
+                    volcar()
+            volcar()
+            datos.update({clave: resumen[clave] for clave in ("escrituras", "partes", "nomenclaturas")})
+    finally:
+        for writer in writers.values():
+            writer.close()
+    log(logger, f"Exportadas {resumen['escrituras']} escrituras ({resumen['partes']} partes, {resumen['nomenclaturas']} nomenclaturas).",
+        escrituras=resumen["escrituras"], partes=resumen["partes"], nomenclaturas=resumen["nomenclaturas"])
+    return resumen
+
+
+def load_export_state(salida):
+    """
+    Devuelve la ultima_modificacion hasta la que llegó la exportación anterior, o None.
+    """
+    path = os.path.join(salida, ESTADO_ARCHIVO)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return datetime.fromisoformat(json.load(f)["hasta"])
+
+
+def save_export_state(salida, hasta):
+    with open(os.path.join(salida, ESTADO_ARCHIVO), "w", encoding="utf-8") as f:
+        json.dump({"hasta": hasta.isoformat()}, f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta las escrituras a tablas planas (partes y nomenclaturas catastrales) en Parquet o CSV.")
+    parser.add_argument("--salida", default="exportes", help="Directorio de destino.")
+    parser.add_argument("--formato", choices=FORMATOS, default="parquet")
+    desde = parser.add_mutually_exclusive_group()
+    desde.add_argument("--desde", type=datetime.fromisoformat, help="Solo escrituras modificadas después de esta fecha (AAAA-MM-DD o ISO).")
+    desde.add_argument("--incremental", action="store_true", help="Solo lo modificado desde la exportación anterior en el mismo directorio.")
+    parser.add_argument("--lote", type=int, default=1000, help="Documentos por lote del cursor y por tramo escrito.")
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    # Corte fijo: lo que se modifique durante la exportación entra en la próxima.
+    hasta = datetime.now()
+    desde = load_export_state(args.salida) if args.incremental else args.desde
+    if args.incremental and desde is None:
+        print("No hay una exportación anterior en ese directorio: se exporta todo.")
+    resumen = export_escrituras(
+        args.salida, formato=args.formato, desde=desde, hasta=hasta,
+        lote=max(1, args.lote), sufijo=hasta.strftime("%Y%m%dT%H%M%S"),
+    )
+    save_export_state(args.salida, hasta)
+    print(f"{resumen['escrituras']} escrituras exportadas en {time.perf_counter() - inicio:.1f} s:")
+    for tabla, path in resumen["archivos"].items():
+        print(f"  {tabla}: {resumen[tabla]} filas -> {path}")
+
+
+if __name__ == "__main__":
+    main()
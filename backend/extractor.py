@@ -1,24 +1,66 @@
 # Import necessary libraries
+# LangChain, langchain_openai y openai tardan varios segundos en importarse:
+# se cargan recién al armar el prompt o el cliente (ver _prompt_and_parser y get_llm),
+# para que importar este módulo no los arrastre.
 from dotenv import load_dotenv
-from langchain_core.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
-from langchain.output_parsers import PydanticOutputParser
+from pydantic import create_model
+from datetime import datetime
+from functools import lru_cache
+import asyncio
+import logging
 import os
+import random
+import time
 
 # Buscamos los modelos Pydantic necesarios para la extracción de datos
 from .models import EscrituraPublicaData
+from .cache import DiskCache, hash_key
+from .segmenter import reduce_text
+from .rules import extract_rule_fields, apply_rule_fields
+from .metrics import get_logger, log, span, increment
 
+logger = get_logger("extractor")
+
+# Carga OPENAI_API_KEY (y el resto de la configuración) desde .env; su
+# ausencia se informa recién al crear el cliente, en get_llm.
 load_dotenv()
 
-# Buscamos la clave de OpenAI está configurada en las variables de entorno
-os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
+# Modelo de OpenAI y temperatura usados para la extracción
+LLM_MODEL = os.getenv("OPENAI_MODEL", "gpt-4")
+LLM_TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", "0"))
+
+# Si los campos que las reglas resuelven con confianza se omiten del pedido al LLM.
+# Con 0 se le piden igual, para medir la concordancia entre ambos.
+RULES_SKIP_LLM_FIELDS = os.getenv("RULES_SKIP_LLM_FIELDS", "1") == "1"
+
+# --- Concurrencia y límites de uso de la API ---
+# Extracciones simultáneas y presupuesto de tokens por minuto (0 = sin límite).
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "40000"))
+# Tokens que se reservan para la respuesta de cada extracción.
+LLM_EXPECTED_COMPLETION_TOKENS = int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", "1500"))
+# Reintentos ante errores 429/5xx, con espera exponencial y jitter (en segundos).
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "60"))
 
-# Configura el parser de salida Pydantic
-parser = PydanticOutputParser(pydantic_object=EscrituraPublicaData)
+# Precio en USD por cada 1000 tokens de entrada y de salida, para estimar el costo.
+LLM_PRICE_INPUT_PER_1K = float(os.getenv("LLM_PRICE_INPUT_PER_1K", "0.03"))
+LLM_PRICE_OUTPUT_PER_1K = float(os.getenv("LLM_PRICE_OUTPUT_PER_1K", "0.06"))
+
+# --- Caché de extracciones ---
+# Si el texto, el prompt (con las instrucciones de formato del parser) y el
+# modelo son los mismos que en una llamada anterior, se reutiliza el resultado
+# validado en lugar de volver a llamar a GPT. Con LLM_CACHE_MAX_MB=0 queda deshabilitada.
+extraction_cache = DiskCache(
+    directory=os.getenv("LLM_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "escrituras", "llm")),
+    max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "100")) * 1024 * 1024),
+    ttl=float(os.getenv("LLM_CACHE_TTL_DAYS", "30")) * 24 * 3600 or None,
+    name="llm",
+)
 
-# Creamos el prompt para GPT
-prompt_template = PromptTemplate(
-    template="""Debes Extraer la siguiente información exclusivamente de la **escritura pública actual** proporcionada.
+# Prompt para GPT; el PromptTemplate se arma en _prompt_and_parser.
+PROMPT_TEMPLATE = """Debes Extraer la siguiente información exclusivamente de la **escritura pública actual** proporcionada.
 
     INSTRUCCIONES IMPORTANTES:
 
@@ -53,31 +95,453 @@ prompt_template = PromptTemplate(
     {escritura_text}
 
     """
-    ,
-    input_variables=["escritura_text"],
-    partial_variables={"format_instructions": parser.get_format_instructions()},
-)
 
-def extract_data_with_langchain(text_from_pdf):
+
+@lru_cache(maxsize=None)
+def _prompt_and_parser(fields=None):
+    """
+    Devuelve el prompt y el parser para extraer todos los campos o, si se
+    indican `fields`, solo ese subconjunto de EscrituraPublicaData (se usa
+    para volver a consultar únicamente los campos que faltaron).
+    Se arman una sola vez por proceso y por conjunto de campos.
+    """
+    from langchain_core.prompts import PromptTemplate
+    from langchain.output_parsers import PydanticOutputParser
+
+    if fields is None:
+        output_parser = PydanticOutputParser(pydantic_object=EscrituraPublicaData)
+    else:
+        partial_model = create_model(
+            "EscrituraPublicaDataParcial",
+            **{field: (EscrituraPublicaData.model_fields[field].annotation, EscrituraPublicaData.model_fields[field]) for field in fields},
+        )
+        output_parser = PydanticOutputParser(pydantic_object=partial_model)
+    prompt = PromptTemplate(
+        template=PROMPT_TEMPLATE,
+        input_variables=["escritura_text"],
+        partial_variables={"format_instructions": output_parser.get_format_instructions()},
+    )
+    return prompt, output_parser
+
+
+# Cadenas prompt | llm ya armadas para el cliente compartido, por conjunto de campos.
+_chains = {}
+
+
+def _llm_chain(fields=None, llm=None):
+    """
+    Devuelve la cadena prompt | llm. Con el cliente compartido se arma una
+    sola vez por conjunto de campos y la reutilizan todas las extracciones
+    del proceso (todas las sesiones y reruns de Streamlit, y el worker); con
+    un modelo propio (ej. uno falso en pruebas) se arma en el momento.
+    """
+    if llm is not None:
+        return _prompt_and_parser(fields)[0] | llm
+    llm = get_llm()
+    key = (fields, id(llm))
+    chain = _chains.get(key)
+    if chain is None:
+        chain = _chains[key] = _prompt_and_parser(fields)[0] | llm
+    return chain
+
+
+def _llm_identity(llm=None):
+    """
+    Identifica el modelo que responde, para la clave de la caché. Un modelo
+    pasado por quien llama (uno falso en pruebas u otro modelo) tiene su
+    propia clave y no pisa ni lee los resultados del cliente compartido.
+    """
+    if llm is None:
+        return {"model": LLM_MODEL, "temperature": LLM_TEMPERATURE}
+    return {
+        "llm": f"{type(llm).__module__}.{type(llm).__qualname__}",
+        "model": getattr(llm, "model_name", None) or getattr(llm, "model", None),
+        "temperature": getattr(llm, "temperature", None),
+    }
+
+
+def _extraction_cache_key(text_from_pdf, prompt=None, llm=None):
+    """
+    Clave de la caché de extracciones: el texto, el prompt renderizado (que
+    incluye las instrucciones de formato del PydanticOutputParser) y el
+    modelo que responde con su configuración.
+    """
+    prompt = prompt or _prompt_and_parser()[0]
+    return hash_key(
+        text_from_pdf,
+        prompt.format(escritura_text=""),
+        _llm_identity(llm),
+    )
+
+
+def get_extraction_cache_stats():
+    """
+    Devuelve los aciertos y fallos de la caché de extracciones en este proceso.
+    """
+    return extraction_cache.stats()
+
+
+@lru_cache(maxsize=None)
+def extraction_version():
+    """
+    Versión de la extracción: hash corto del prompt y del esquema de
+    EscrituraPublicaData. Cambia sola al modificar cualquiera de los dos, y
+    así reextract.py encuentra las escrituras extraídas con una versión anterior.
+    """
+    return hash_key(PROMPT_TEMPLATE, EscrituraPublicaData.model_json_schema())[:12]
+
+
+def extraction_metadata(pdf_sha256=None):
+    """
+    Datos de la extracción que se guardan con el resultado (campo 'extraccion'):
+    versión, modelo, fecha y el SHA-256 del PDF, que identifica su texto OCR
+    guardado (ver database.save_ocr_texts).
+    """
+    return {'version': extraction_version(), 'modelo': LLM_MODEL, 'fecha': datetime.now(), 'pdf_sha256': pdf_sha256}
+
+
+# Cliente de OpenAI compartido, se crea en el primer uso.
+_llm = None
+
+
+def get_llm():
+    """
+    Devuelve el cliente de ChatOpenAI compartido por todo el proceso, para no
+    crear uno nuevo (con su pool de conexiones) en cada extracción. Los
+    reintentos los maneja este módulo, por eso el cliente no reintenta solo.
+    """
+    global _llm
+    if _llm is None:
+        # Verifica si la clave de OpenAI está configurada
+        if not os.getenv("OPENAI_API_KEY"):
+            raise RuntimeError("Por favor, configura la variable de entorno OPENAI_API_KEY con tu clave de OpenAI.")
+        from langchain_openai import ChatOpenAI
+        _llm = ChatOpenAI(model_name=LLM_MODEL, temperature=LLM_TEMPERATURE, max_retries=0)
+    return _llm
+
+
+def _cached_result(cache_key, output_parser):
+    if not cache_key:
+        return None
+    cached = extraction_cache.get(cache_key)
+    if cached is None:
+        return None
+    log(logger, "Datos recuperados de la caché de extracciones.", cache="llm")
+    return output_parser.pydantic_object.model_validate(cached)
+
+
+def _store_result(cache_key, extracted_data):
+    if not cache_key:
+        return
+    try:
+        extraction_cache.set(cache_key, extracted_data.model_dump())
+    except Exception as e:
+        log(logger, f"No se pudo guardar el resultado en la caché de extracciones: {e}", logging.WARNING)
+
+
+def _record_usage(message):
+    """
+    Registra los tokens que informó el modelo en la respuesta (usage_metadata)
+    y su costo estimado según LLM_PRICE_INPUT_PER_1K y LLM_PRICE_OUTPUT_PER_1K.
+    """
+    usage = getattr(message, "usage_metadata", None) or {}
+    entrada = usage.get("input_tokens", 0)
+    salida = usage.get("output_tokens", 0)
+    if not (entrada or salida):
+        return
+    costo = entrada / 1000 * LLM_PRICE_INPUT_PER_1K + salida / 1000 * LLM_PRICE_OUTPUT_PER_1K
+    increment("escrituras_llm_tokens_total", entrada, "Tokens informados por el modelo", tipo="entrada", modelo=LLM_MODEL)
+    increment("escrituras_llm_tokens_total", salida, "Tokens informados por el modelo", tipo="salida", modelo=LLM_MODEL)
+    increment("escrituras_llm_costo_usd_total", costo, "Costo estimado de las llamadas al modelo", modelo=LLM_MODEL)
+    log(logger, f"Tokens usados: {entrada} de entrada, {salida} de salida (USD {costo:.4f}).",
+        evento="uso_llm", tokens_entrada=entrada, tokens_salida=salida, costo_usd=round(costo, 6), modelo=LLM_MODEL)
+
+
+def _log_retry(error, delay):
+    increment("escrituras_llm_reintentos_total", 1, "Reintentos ante errores de OpenAI")
+    log(logger, f"Error reintentable de OpenAI ({error}), reintentando en {delay:.1f} s...", logging.WARNING)
+
+
+def _is_retryable(error):
+    """
+    Indica si vale la pena reintentar: límites de uso (429), errores del
+    servidor (5xx) y problemas de conexión o timeout.
+    """
+    import openai
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return status_code == 429 or (status_code is not None and status_code >= 500)
+
+
+def _backoff_delay(attempt):
+    """
+    Espera exponencial con jitter completo: un valor al azar entre 0 y
+    LLM_BACKOFF_BASE * 2^intento, acotado por LLM_BACKOFF_MAX.
+    """
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model(LLM_MODEL)
+    except Exception:
+        return None
+
+
+def estimate_tokens(text):
+    """
+    Cuenta los tokens del texto con tiktoken; si no está disponible, los
+    estima (unos 4 caracteres por token en español).
+    """
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def _is_empty(value):
+    if isinstance(value, dict):
+        return all(_is_empty(v) for v in value.values())
+    return value in (None, "", [])
+
+
+def _missing_fields(data, fields):
+    return [field for field in fields if _is_empty(data.get(field))]
+
+
+def _merge_fields(data, partial_data, fields):
+    partial = partial_data.model_dump()
+    for field in fields:
+        if not _is_empty(partial.get(field)):
+            data[field] = partial[field]
+    return data
+
+
+def _plan_extraction(text_from_pdf):
+    """
+    Prepara una extracción: aplica las reglas determinísticas y el segmentador.
+
+    Returns:
+        tuple: (reglas, texto a enviar, campos a pedir al LLM o None para todos,
+        campos que salieron del texto reducido y admiten consulta de respaldo).
+    """
+    with span("extraccion.preparacion", caracteres=len(text_from_pdf)) as datos:
+        reglas = extract_rule_fields(text_from_pdf)
+        reduced_text, campos = reduce_text(text_from_pdf)
+        datos["caracteres_enviados"] = len(reduced_text)
+    omitidos = list(reglas["campos"]) if RULES_SKIP_LLM_FIELDS else []
+    fields = None
+    if omitidos:
+        log(logger, f"Campos resueltos con reglas, sin consultar al LLM: {', '.join(omitidos)}.", campos_reglas=omitidos)
+        fields = tuple(field for field in EscrituraPublicaData.model_fields if field not in omitidos)
+    campos = [field for field in campos if field not in omitidos]
+    return reglas, reduced_text, fields, campos
+
+
+def _finish_extraction(data, reglas):
+    """
+    Completa los datos del LLM con las reglas y valida el resultado final.
+    """
+    return EscrituraPublicaData.model_validate(apply_rule_fields(data, reglas))
+
+
+def _report_tokens(text_from_pdf, reduced_text, fields=None, fallback_fields=None):
+    """
+    Informa los tokens del prompt con el texto completo y los efectivamente
+    enviados: texto reducido por el segmentador, sin los campos resueltos por
+    reglas, más la consulta de respaldo si la hubo.
+    """
+    completo = estimate_tokens(_prompt_and_parser()[0].format(escritura_text=text_from_pdf))
+    prompt, _ = _prompt_and_parser(fields)
+    enviado = estimate_tokens(prompt.format(escritura_text=reduced_text))
+    if fallback_fields:
+        fallback_prompt, _ = _prompt_and_parser(tuple(fallback_fields))
+        enviado += estimate_tokens(fallback_prompt.format(escritura_text=text_from_pdf))
+    ahorro = 100 * (1 - enviado / completo) if completo else 0
+    log(logger, f"Tokens del prompt: {completo} con el texto completo, {enviado} enviados (ahorro: {ahorro:.0f}%).",
+        tokens_texto_completo=completo, tokens_enviados=enviado)
+
+
+def _extract_once(text, fields, llm, use_cache):
+    """
+    Ejecuta la cadena prompt | llm | parser una vez (con caché y reintentos)
+    para todos los campos o solo para `fields`.
+    """
+    prompt, output_parser = _prompt_and_parser(fields)
+    cache_key = _extraction_cache_key(text, prompt, llm) if use_cache and extraction_cache.enabled else None
+    cached = _cached_result(cache_key, output_parser)
+    if cached is not None:
+        return cached
+
+    # Crea la cadena de LangChain. El parser se aplica aparte para conservar
+    # la respuesta del modelo, que trae los tokens usados.
+    llm_chain = _llm_chain(fields, llm)
+    # Invoca la cadena con el texto del PDF, reintentando ante límites de uso o errores del servidor
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            with span("llm.llamada", campos=len(fields) if fields else "todos", intento=attempt + 1):
+                message = llm_chain.invoke({"escritura_text": text})
+            break
+        except Exception as e:
+            if attempt == LLM_MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = _backoff_delay(attempt)
+            _log_retry(e, delay)
+            time.sleep(delay)
+    _record_usage(message)
+    with span("llm.parseo"):
+        extracted_data = output_parser.invoke(message)
+
+    _store_result(cache_key, extracted_data)
+    return extracted_data
+
+
+async def _aextract_once(text, fields, llm, limiter, semaphore, use_cache):
+    """
+    Versión asíncrona de _extract_once, que además respeta el semáforo de
+    concurrencia y el limitador de tokens por minuto.
+    """
+    prompt, output_parser = _prompt_and_parser(fields)
+    cache_key = _extraction_cache_key(text, prompt, llm) if use_cache and extraction_cache.enabled else None
+    cached = _cached_result(cache_key, output_parser)
+    if cached is not None:
+        return cached
+
+    llm_chain = _llm_chain(fields, llm)
+    prompt_tokens = estimate_tokens(prompt.format(escritura_text=text))
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        if limiter is not None:
+            with span("llm.espera_limite", tokens=prompt_tokens + LLM_EXPECTED_COMPLETION_TOKENS):
+                await limiter.acquire(prompt_tokens + LLM_EXPECTED_COMPLETION_TOKENS)
+        try:
+            async with semaphore:
+                with span("llm.llamada", campos=len(fields) if fields else "todos", intento=attempt + 1):
+                    message = await llm_chain.ainvoke({"escritura_text": text})
+            break
+        except Exception as e:
+            if attempt == LLM_MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = _backoff_delay(attempt)
+            _log_retry(e, delay)
+            await asyncio.sleep(delay)
+    _record_usage(message)
+    with span("llm.parseo"):
+        extracted_data = output_parser.invoke(message)
+
+    _store_result(cache_key, extracted_data)
+    return extracted_data
+
+
+class TokenRateLimiter:
+    """
+    Limitador asíncrono de tokens por minuto (cubeta de tokens). Cada llamada
+    reserva los tokens estimados del prompt más la respuesta esperada y espera
+    si el presupuesto del último minuto está agotado.
+    """
+
+    def __init__(self, tokens_per_minute):
+        self.capacity = tokens_per_minute
+        self.available = tokens_per_minute
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    async def acquire(self, tokens):
+        if not self.capacity:
+            return
+        # Una llamada más grande que el presupuesto entero no podría pasar nunca.
+        tokens = min(tokens, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self.available < tokens:
+                await asyncio.sleep((tokens - self.available) * 60 / self.capacity)
+                self._refill()
+            self.available -= tokens
+
+
+def extract_data_with_langchain(text_from_pdf, use_cache=True, llm=None):
     """
     Utiliza LangChain y GPT para extraer datos relevantes del texto.
+
+    Los campos de formato fijo (número de escritura, folio, registro) se
+    resuelven antes con reglas (ver rules.py) y no se le piden al modelo; los
+    CUIT/CUIL, la partida y la matrícula se validan o completan con ellas.
+    En escrituras largas se envían al modelo solo las secciones de donde salen
+    los campos (ver segmenter.reduce_text). Los campos que vuelvan vacíos se
+    consultan de nuevo, solos, con el texto completo. Si el mismo texto ya fue
+    procesado con el mismo prompt y modelo, se usa la caché de extracciones.
+
+    Args:
+        llm (optional): Modelo de chat a usar en lugar del cliente compartido (ej. uno falso en pruebas).
     """
     if not text_from_pdf:
         return None
     try:
-    # Verifica si la clave de OpenAI está configurada
-        if not os.getenv("OPENAI_API_KEY"):
-            print("Por favor, configura la variable de entorno OPENAI_API_KEY con tu clave de OpenAI.")
-            return None
-        llm = ChatOpenAI(model_name="gpt-4", temperature=0)
-
-        # Crea la cadena de LangChain
-        extraction_chain = prompt_template | llm | parser
-        # Invoca la cadena con el texto del PDF
-        extracted_data = extraction_chain.invoke({"escritura_text": text_from_pdf})
-        return extracted_data
+        reglas, reduced_text, fields, campos = _plan_extraction(text_from_pdf)
+        data = _extract_once(reduced_text, fields, llm, use_cache).model_dump()
+
+        faltantes = _missing_fields(data, campos)
+        if faltantes:
+            log(logger, f"Campos vacíos con el texto reducido ({', '.join(faltantes)}), se consultan con el texto completo.", campos_faltantes=faltantes)
+            partial_data = _extract_once(text_from_pdf, tuple(faltantes), llm, use_cache)
+            data = _merge_fields(data, partial_data, faltantes)
+        _report_tokens(text_from_pdf, reduced_text, fields, faltantes)
+        return _finish_extraction(data, reglas)
+    except Exception as e:
+        logger.exception(f"Error al extraer datos con LangChain: {e}")
+        return None
+
+
+async def aextract_data_with_langchain(text_from_pdf, llm=None, limiter=None, semaphore=None, use_cache=True):
+    """
+    Versión asíncrona de extract_data_with_langchain. Respeta el semáforo de
+    concurrencia y el limitador de tokens por minuto recibidos, y reintenta
+    con espera exponencial y jitter ante errores 429/5xx.
+    """
+    if not text_from_pdf:
+        return None
+    semaphore = semaphore or asyncio.Semaphore(1)
+    try:
+        reglas, reduced_text, fields, campos = _plan_extraction(text_from_pdf)
+        data = (await _aextract_once(reduced_text, fields, llm, limiter, semaphore, use_cache)).model_dump()
+
+        faltantes = _missing_fields(data, campos)
+        if faltantes:
+            log(logger, f"Campos vacíos con el texto reducido ({', '.join(faltantes)}), se consultan con el texto completo.", campos_faltantes=faltantes)
+            partial_data = await _aextract_once(text_from_pdf, tuple(faltantes), llm, limiter, semaphore, use_cache)
+            data = _merge_fields(data, partial_data, faltantes)
+        _report_tokens(text_from_pdf, reduced_text, fields, faltantes)
+        return _finish_extraction(data, reglas)
     except Exception as e:
-        print(f"Error al extraer datos con LangChain: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
\ No newline at end of file
+        log(logger, f"Error al extraer datos con LangChain: {e}", logging.ERROR)
+        return None
+
+
+async def aextract_many(texts, llm=None, max_concurrency=None, tokens_per_minute=None):
+    """
+    Extrae los datos de varios textos en simultáneo, con como máximo
+    `max_concurrency` llamadas en curso y sin superar `tokens_per_minute`.
+
+    Returns:
+        list: Un EscrituraPublicaData (o None si falló) por texto, en el mismo orden.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency or LLM_MAX_CONCURRENCY)
+    limiter = TokenRateLimiter(LLM_TOKENS_PER_MINUTE if tokens_per_minute is None else tokens_per_minute)
+    return await asyncio.gather(*(
+        aextract_data_with_langchain(text, llm=llm, limiter=limiter, semaphore=semaphore)
+        for text in texts
+    ))
+
+
+def extract_many(texts, llm=None, max_concurrency=None, tokens_per_minute=None):
+    """
+    Envoltorio sincrónico de aextract_many para usar desde scripts.
+    """
+    return asyncio.run(aextract_many(texts, llm=llm, max_concurrency=max_concurrency, tokens_per_minute=tokens_per_minute))
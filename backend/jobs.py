@@ -0,0 +1,355 @@
+"""
+Trabajos de análisis en segundo plano.
+
+La interfaz encola el PDF (guardado en GridFS) y recibe un id de trabajo; un
+proceso worker aparte (python -m backend.worker) toma los trabajos en orden,
+ejecuta el OCR y la extracción y guarda en MongoDB el estado, el avance de
+cada etapa y el resultado. Así el análisis no bloquea la sesión de Streamlit,
+sobrevive a una recarga del navegador y varios usuarios no compiten por el
+proceso del servidor web.
+"""
+from bson import ObjectId
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+import gridfs
+import hashlib
+import logging
+import os
+import socket
+import time
+
+from .database import get_client, MONGODB_DB_NAME
+from .metrics import get_logger, log
+
+logger = get_logger("jobs")
+
+JOBS_COLLECTION = "trabajos"
+PDF_BUCKET = "pdfs"
+
+# Estados de un trabajo
+EN_COLA = "en_cola"
+EN_PROCESO = "en_proceso"
+TERMINADO = "terminado"
+ERROR = "error"
+
+# Un trabajo en proceso sin novedades durante este tiempo se considera
+# abandonado (worker caído) y vuelve a la cola.
+JOB_STALE_MINUTES = int(os.getenv("JOB_STALE_MINUTES", "30"))
+# Cada cuántos segundos un worker busca trabajos abandonados.
+REQUEUE_INTERVAL = 60
+
+_indexes_ready = False
+
+
+def _db():
+    return get_client()[MONGODB_DB_NAME]
+
+
+def get_jobs_collection():
+    """
+    Devuelve la colección de trabajos, creando sus índices la primera vez.
+    """
+    global _indexes_ready
+    collection = _db()[JOBS_COLLECTION]
+    if not _indexes_ready:
+        collection.create_index([('estado', ASCENDING), ('creado', ASCENDING)], name='estado_creado')
+        collection.create_index([('numero_carpeta', ASCENDING), ('creado', DESCENDING)], name='carpeta_creado')
+        collection.create_index([('sha256', ASCENDING), ('creado', DESCENDING)], name='sha256_creado')
+        collection.create_index([('creado', DESCENDING)], name='creado')
+        _indexes_ready = True
+    return collection
+
+
+def _pdf_store():
+    return gridfs.GridFS(_db(), collection=PDF_BUCKET)
+
+
+def find_duplicate_job(sha256: str):
+    """
+    Busca el trabajo más reciente (que no haya fallado) para un PDF con el
+    mismo contenido. No trae el resultado.
+    """
+    return get_jobs_collection().find_one(
+        {'sha256': sha256, 'estado': {'$ne': ERROR}},
+        {'resultado': 0},
+        sort=[('creado', DESCENDING)],
+    )
+
+
+def submit_job(pdf_bytes: bytes, numero_carpeta: int, nombre_archivo: str = None, dividir: bool = False, carpetas: list = None) -> str:
+    """
+    Encola el análisis de un PDF para una carpeta.
+
+    El PDF se identifica por su SHA-256, calculado una sola vez al recibirlo.
+    Antes de guardar nada se buscan duplicados: si el mismo PDF ya está en
+    cola o en proceso para la misma carpeta, se devuelve ese trabajo; si ya
+    se analizó, el trabajo nuevo se crea terminado con el mismo resultado,
+    sin volver a aplicar OCR ni llamar al modelo.
+
+    Con `dividir`, el PDF se trata como un protocolo con varias escrituras
+    (ver process.process_protocolo): cada una va a la carpeta indicada en
+    `carpetas` o, si no se indican, a carpetas consecutivas desde `numero_carpeta`.
+
+    Returns:
+        str: El id del trabajo.
+    """
+    sha256 = hashlib.sha256(pdf_bytes).hexdigest()
+    collection = get_jobs_collection()
+    now = datetime.now()
+    job = {
+        'numero_carpeta': numero_carpeta,
+        'archivo': nombre_archivo,
+        'sha256': sha256,
+        'pdf_id': None,
+        'estado': EN_COLA,
+        'etapas': {
+            'ocr': {'estado': EN_COLA},
+            'extraccion': {'estado': EN_COLA},
+        },
+        'resultado': None,
+        'error': None,
+        'dividir': dividir,
+        'carpetas': list(carpetas) if carpetas else None,
+        'creado': now,
+        'actualizado': now,
+    }
+
+    previo = find_duplicate_job(sha256)
+    # Un resultado de un PDF entero no sirve para sus escrituras separadas, ni al revés.
+    if previo and bool(previo.get('dividir')) != dividir:
+        previo = None
+    if previo and previo['estado'] in (EN_COLA, EN_PROCESO) and previo['numero_carpeta'] == numero_carpeta:
+        log(logger, f"El PDF ya está encolado para la carpeta {numero_carpeta} (trabajo {previo['_id']}).", trabajo=str(previo['_id']))
+        return str(previo['_id'])
+    if previo and previo['estado'] == TERMINADO and not dividir:
+        resultado = collection.find_one({'_id': previo['_id']}, {'resultado': 1}).get('resultado')
+        if resultado:
+            log(logger, f"El PDF ya se analizó en el trabajo {previo['_id']}; se reutiliza el resultado.", trabajo=str(previo['_id']))
+            job.update({
+                'estado': TERMINADO,
+                'etapas': previo.get('etapas', job['etapas']),
+                'resultado': resultado,
+                'duplicado_de': previo['_id'],
+                'finalizado': now,
+            })
+            return str(collection.insert_one(job).inserted_id)
+
+    job['pdf_id'] = _pdf_store().put(pdf_bytes, filename=nombre_archivo, numero_carpeta=numero_carpeta, sha256=sha256)
+    return str(collection.insert_one(job).inserted_id)
+
+
+def get_job(job_id: str):
+    """
+    Devuelve un trabajo por su id (sin el PDF), o None si no existe.
+    """
+    return get_jobs_collection().find_one({'_id': ObjectId(job_id)})
+
+
+def list_jobs(numero_carpeta: int = None, limit: int = 20, desde: datetime = None) -> list:
+    """
+    Lista los trabajos más recientes, opcionalmente de una sola carpeta.
+    Con `desde`, solo los que siguen en cola o en proceso y los creados
+    desde esa fecha. No trae el resultado para que el listado sea liviano.
+    """
+    query = {} if numero_carpeta is None else {'numero_carpeta': numero_carpeta}
+    if desde is not None:
+        query['$or'] = [{'estado': {'$in': [EN_COLA, EN_PROCESO]}}, {'creado': {'$gte': desde}}]
+    cursor = get_jobs_collection().find(query, {'resultado': 0}).sort('creado', DESCENDING).limit(limit)
+    return list(cursor)
+
+
+def claim_next_job(worker_id: str):
+    """
+    Toma atómicamente el trabajo en cola más antiguo y lo marca en proceso.
+    Varios workers pueden llamarla a la vez sin tomar el mismo trabajo.
+    """
+    now = datetime.now()
+    return get_jobs_collection().find_one_and_update(
+        {'estado': EN_COLA},
+        {'$set': {'estado': EN_PROCESO, 'worker': worker_id, 'iniciado': now, 'actualizado': now}},
+        sort=[('creado', ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def update_stage(job_id, etapa: str, estado: str, **detalle):
+    """
+    Registra el estado y el avance de una etapa del trabajo.
+    """
+    now = datetime.now()
+    cambios = {f'etapas.{etapa}.estado': estado, 'actualizado': now}
+    if estado == EN_PROCESO and not detalle:
+        cambios[f'etapas.{etapa}.inicio'] = now
+    if estado in (TERMINADO, ERROR):
+        cambios[f'etapas.{etapa}.fin'] = now
+    for clave, valor in detalle.items():
+        cambios[f'etapas.{etapa}.{clave}'] = valor
+    get_jobs_collection().update_one({'_id': ObjectId(job_id)}, {'$set': cambios})
+
+
+def finish_job(job_id, resultado=None, error: str = None, posibles_duplicados=None, escrituras=None):
+    """
+    Marca el trabajo como terminado (con su resultado) o con error, y borra el PDF encolado.
+    En un protocolo, `escrituras` es el resumen de cada escritura separada
+    (carpeta, páginas y si se extrajo), que el listado muestra sin traer el resultado.
+    """
+    collection = get_jobs_collection()
+    cambios = {
+        'estado': ERROR if error else TERMINADO,
+        'resultado': resultado,
+        'error': error,
+        'posibles_duplicados': posibles_duplicados or [],
+        'finalizado': datetime.now(),
+        'actualizado': datetime.now(),
+    }
+    if escrituras is not None:
+        cambios['escrituras'] = escrituras
+    job = collection.find_one_and_update({'_id': ObjectId(job_id)}, {'$set': cambios})
+    if job and job.get('pdf_id'):
+        try:
+            _pdf_store().delete(job['pdf_id'])
+        except Exception as e:
+            log(logger, f"No se pudo borrar el PDF del trabajo {job_id}: {e}", logging.WARNING, trabajo=str(job_id))
+
+
+def requeue_stale_jobs(minutes: int = None) -> int:
+    """
+    Devuelve a la cola los trabajos en proceso sin novedades hace más de
+    `minutes` minutos (por ejemplo, si el worker se cayó).
+
+    Returns:
+        int: Cantidad de trabajos reencolados.
+    """
+    limite = datetime.now() - timedelta(minutes=minutes or JOB_STALE_MINUTES)
+    resultado = get_jobs_collection().update_many(
+        {'estado': EN_PROCESO, 'actualizado': {'$lt': limite}},
+        {'$set': {'estado': EN_COLA, 'actualizado': datetime.now()}},
+    )
+    return resultado.modified_count
+
+
+def force_extraction(job_id: str) -> bool:
+    """
+    Vuelve a encolar un trabajo que terminó sin extraer por ser un posible
+    duplicado, para que se extraigan sus datos con el LLM igualmente. Usa el texto OCR guardado, por
+    lo que no hace falta el PDF ni repetir el OCR.
+
+    Returns:
+        bool: True si el trabajo volvió a la cola.
+    """
+    now = datetime.now()
+    resultado = get_jobs_collection().update_one(
+        {'_id': ObjectId(job_id), 'estado': TERMINADO, 'dividir': {'$ne': True}},
+        {'$set': {
+            'estado': EN_COLA,
+            'forzar_extraccion': True,
+            # El PDF se borró al terminar; se extrae desde el texto OCR guardado.
+            'pdf_id': None,
+            'etapas.extraccion': {'estado': EN_COLA},
+            'resultado': None,
+            'posibles_duplicados': [],
+            'actualizado': now,
+        }},
+    )
+    return bool(resultado.modified_count)
+
+
+def _run_protocolo_job(job, progress):
+    """
+    Separa y extrae las escrituras de un protocolo. El resultado del trabajo
+    es {'escrituras': [...]}, una por carpeta, para revisar y guardar de a una.
+    """
+    from .process import process_protocolo
+
+    pdf_bytes = _pdf_store().get(job['pdf_id']).read()
+    escrituras = process_protocolo(
+        pdf_bytes,
+        primera_carpeta=job['numero_carpeta'],
+        carpetas=job.get('carpetas'),
+        progress=progress,
+        sha256=job.get('sha256'),
+    )
+    if not escrituras or not any(escritura['resultado'] for escritura in escrituras):
+        finish_job(job['_id'], error="No se pudieron extraer datos del PDF.")
+        return
+    finish_job(
+        job['_id'],
+        resultado={'escrituras': escrituras},
+        posibles_duplicados=[duplicado for escritura in escrituras for duplicado in escritura['posibles_duplicados']],
+        escrituras=[
+            {'numero_carpeta': e['numero_carpeta'], 'paginas': e['paginas'], 'ok': bool(e['resultado'])}
+            for e in escrituras
+        ],
+    )
+
+
+def run_job(job):
+    """
+    Ejecuta un trabajo ya tomado: lee el PDF de GridFS a memoria, corre el
+    pipeline sobre esos bytes y guarda el resultado. Si se pidió extraer
+    igualmente un posible duplicado, extrae desde el texto OCR guardado.
+    """
+    # Importamos acá para no cargar el OCR y LangChain en quien solo encola trabajos.
+    from .process import process_escritura_publica, process_ocr_text
+    from .database import load_ocr_texts
+
+    job_id = job['_id']
+    log(logger, f"Procesando trabajo {job_id} (carpeta {job['numero_carpeta']}).", trabajo=str(job_id), numero_carpeta=job['numero_carpeta'])
+
+    def progress(etapa, estado, **detalle):
+        update_stage(job_id, etapa, estado, **detalle)
+
+    try:
+        if job.get('dividir'):
+            _run_protocolo_job(job, progress)
+            return
+        if job.get('forzar_extraccion'):
+            texto = load_ocr_texts([job['sha256']]).get(job['sha256'])
+            if not texto:
+                finish_job(job_id, error="No se encontró el texto OCR guardado del PDF.")
+                return
+            resultado = process_ocr_text(texto, job['sha256'], progress=progress)
+        else:
+            pdf_bytes = _pdf_store().get(job['pdf_id']).read()
+            resultado = process_escritura_publica(
+                pdf_bytes,
+                progress=progress,
+                sha256=job.get('sha256'),
+                numero_carpeta=job['numero_carpeta'],
+            )
+        if resultado:
+            posibles_duplicados = resultado.pop('posibles_duplicados', None)
+            # Un posible duplicado termina sin resultado: el usuario elige usar
+            # los datos de la escritura guardada o extraer igualmente.
+            finish_job(job_id, resultado=resultado or None, posibles_duplicados=posibles_duplicados)
+        else:
+            finish_job(job_id, error="No se pudieron extraer datos del PDF.")
+    except Exception as e:
+        finish_job(job_id, error=str(e))
+
+
+def run_worker(poll_interval: float = 2.0, once: bool = False):
+    """
+    Bucle del worker: toma trabajos en cola y los ejecuta de a uno.
+
+    Args:
+        poll_interval (float): Segundos de espera cuando no hay trabajos.
+        once (bool): Si es True, procesa los trabajos pendientes y termina.
+    """
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    log(logger, f"Worker {worker_id} esperando trabajos.", worker=worker_id)
+    ultima_revision = None
+    while True:
+        # Si otro worker se cayó, sus trabajos vuelven a la cola sin tener que reiniciar ninguno.
+        if ultima_revision is None or time.monotonic() - ultima_revision >= REQUEUE_INTERVAL:
+            reencolados = requeue_stale_jobs()
+            if reencolados:
+                log(logger, f"{reencolados} trabajos abandonados volvieron a la cola.", logging.WARNING, reencolados=reencolados)
+            ultima_revision = time.monotonic()
+        job = claim_next_job(worker_id)
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
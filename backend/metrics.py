@@ -0,0 +1,300 @@
+"""
+Instrumentación del pipeline: logs estructurados, tramos (spans) con su
+duración y métricas en formato Prometheus.
+
+- Los logs salen por la salida estándar como una línea JSON por evento
+  (LOG_FORMAT=json, por defecto) o como texto legible (LOG_FORMAT=texto).
+  Cada evento lleva el id de la corrida del pipeline en la que ocurrió.
+- span("ocr.pagina", pagina=3) mide un tramo, lo registra en el histograma
+  escrituras_etapa_segundos y lo informa en el log.
+- Los contadores e histogramas se exponen en http://localhost:METRICS_PORT/metrics
+  (con METRICS_PORT=0, por defecto, el servidor no se levanta).
+- Con METRICS_PROFILE_PATH definido, la próxima corrida del pipeline se
+  ejecuta con cProfile y el perfil se guarda en esa ruta (una sola vez).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cProfile
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_PROFILE_PATH = os.getenv("METRICS_PROFILE_PATH")
+
+# Límites (en segundos) de los histogramas de duración.
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Id de la corrida del pipeline y tramo en curso, propagados a los eventos.
+_run_id = ContextVar("run_id", default=None)
+_span_actual = ContextVar("span", default=None)
+
+
+# --- Logs ---
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        evento = {
+            "ts": round(record.created, 3),
+            "nivel": record.levelname.lower(),
+            "modulo": record.name,
+            "mensaje": record.getMessage(),
+        }
+        if _run_id.get():
+            evento["corrida"] = _run_id.get()
+        evento.update(getattr(record, "campos", {}))
+        if record.exc_info:
+            evento["excepcion"] = self.formatException(record.exc_info)
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+
+_logging_ready = False
+
+
+def get_logger(nombre):
+    """
+    Devuelve el logger de un módulo del backend. La primera vez configura el
+    logger raíz 'escrituras' para que escriba en la salida estándar.
+    """
+    global _logging_ready
+    if not _logging_ready:
+        raiz = logging.getLogger("escrituras")
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(_JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter("%(levelname)s %(name)s: %(message)s"))
+        raiz.addHandler(handler)
+        raiz.setLevel(LOG_LEVEL)
+        raiz.propagate = False
+        _logging_ready = True
+    return logging.getLogger(f"escrituras.{nombre}")
+
+
+def log(logger, mensaje, nivel=logging.INFO, **campos):
+    """
+    Registra un evento con campos estructurados (aparecen como claves del JSON).
+    """
+    logger.log(nivel, mensaje, extra={"campos": campos})
+
+
+# --- Métricas ---
+
+class _Registry:
+    """
+    Contadores e histogramas en memoria, con etiquetas, seguros entre hilos.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+
+    def increment(self, nombre, valor=1, ayuda="", **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            self._help.setdefault(nombre, ("counter", ayuda))
+            self._counters[clave] = self._counters.get(clave, 0) + valor
+
+    def observe(self, nombre, valor, ayuda="", buckets=DURATION_BUCKETS, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            self._help.setdefault(nombre, ("histogram", ayuda))
+            histograma = self._histograms.get(clave)
+            if histograma is None:
+                histograma = self._histograms[clave] = {"buckets": buckets, "cuentas": [0] * len(buckets), "suma": 0.0, "total": 0}
+            for i, limite in enumerate(histograma["buckets"]):
+                if valor <= limite:
+                    histograma["cuentas"][i] += 1
+            histograma["suma"] += valor
+            histograma["total"] += 1
+
+    def value(self, nombre, **etiquetas):
+        """
+        Valor actual de un contador (0 si no se registró).
+        """
+        with self._lock:
+            return self._counters.get((nombre, tuple(sorted(etiquetas.items()))), 0)
+
+    def render(self):
+        """
+        Exporta todas las métricas en el formato de texto de Prometheus.
+        """
+        def etiquetas_texto(etiquetas, extra=()):
+            pares = list(etiquetas) + list(extra)
+            if not pares:
+                return ""
+            return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pares) + "}"
+
+        lineas = []
+        with self._lock:
+            for nombre, (tipo, ayuda) in sorted(self._help.items()):
+                lineas.append(f"# HELP {nombre} {ayuda or nombre}")
+                lineas.append(f"# TYPE {nombre} {tipo}")
+                if tipo == "counter":
+                    for (n, etiquetas), valor in sorted(self._counters.items()):
+                        if n == nombre:
+                            lineas.append(f"{nombre}{etiquetas_texto(etiquetas)} {valor}")
+                    continue
+                for (n, etiquetas), histograma in sorted(self._histograms.items()):
+                    if n != nombre:
+                        continue
+                    for limite, cuenta in zip(histograma["buckets"], histograma["cuentas"]):
+                        lineas.append(f"{nombre}_bucket{etiquetas_texto(etiquetas, [('le', limite)])} {cuenta}")
+                    lineas.append(f"{nombre}_bucket{etiquetas_texto(etiquetas, [('le', '+Inf')])} {histograma['total']}")
+                    lineas.append(f"{nombre}_sum{etiquetas_texto(etiquetas)} {histograma['suma']}")
+                    lineas.append(f"{nombre}_count{etiquetas_texto(etiquetas)} {histograma['total']}")
+        return "\n".join(lineas) + "\n"
+
+
+registry = _Registry()
+
+
+def increment(nombre, valor=1, ayuda="", **etiquetas):
+    registry.increment(nombre, valor, ayuda, **etiquetas)
+
+
+def observe(nombre, valor, ayuda="", **etiquetas):
+    registry.observe(nombre, valor, ayuda, **etiquetas)
+
+
+_span_logger = None
+
+
+@contextmanager
+def span(nombre, **campos):
+    """
+    Mide un tramo del pipeline. Al terminar lo registra en el histograma
+    escrituras_etapa_segundos{etapa=nombre} y emite un evento 'span' con la
+    duración, el tramo padre y los campos recibidos. Los campos que se
+    agreguen al dict devuelto (ej. resultados) también se informan.
+    """
+    global _span_logger
+    _span_logger = _span_logger or get_logger("spans")
+    padre = _span_actual.get()
+    token = _span_actual.set(nombre)
+    inicio = time.perf_counter()
+    estado = "ok"
+    try:
+        yield campos
+    except BaseException:
+        estado = "error"
+        raise
+    finally:
+        segundos = time.perf_counter() - inicio
+        _span_actual.reset(token)
+        observe("escrituras_etapa_segundos", segundos, "Duración de cada etapa del pipeline", etapa=nombre)
+        log(_span_logger, f"{nombre} en {segundos:.3f} s", evento="span", span=nombre, padre=padre, segundos=round(segundos, 4), estado=estado, **campos)
+
+
+def record_span(nombre, segundos, **campos):
+    """
+    Registra un tramo ya medido en otro lugar (por ejemplo, el OCR de una
+    página hecho en un proceso del pool, que devuelve su duración).
+    """
+    global _span_logger
+    _span_logger = _span_logger or get_logger("spans")
+    observe("escrituras_etapa_segundos", segundos, "Duración de cada etapa del pipeline", etapa=nombre)
+    log(_span_logger, f"{nombre} en {segundos:.3f} s", nivel=logging.DEBUG, evento="span", span=nombre, padre=_span_actual.get(), segundos=round(segundos, 4), **campos)
+
+
+@contextmanager
+def pipeline_run(**campos):
+    """
+    Marca una corrida completa del pipeline: le asigna un id que llevan todos
+    sus eventos, la mide como span 'pipeline' y, si se pidió, la perfila.
+    """
+    token = _run_id.set(uuid.uuid4().hex[:12])
+    try:
+        with profile_once(), span("pipeline", **campos) as datos:
+            yield datos
+    finally:
+        _run_id.reset(token)
+
+
+# --- Perfilado ---
+
+_profile_lock = threading.Lock()
+_profile_pendiente = bool(METRICS_PROFILE_PATH)
+
+
+def request_profile(path):
+    """
+    Pide perfilar con cProfile la próxima corrida del pipeline y guardar el
+    resultado en `path` (se analiza con `python -m pstats path` o snakeviz).
+    """
+    global METRICS_PROFILE_PATH, _profile_pendiente
+    with _profile_lock:
+        METRICS_PROFILE_PATH = path
+        _profile_pendiente = True
+
+
+@contextmanager
+def profile_once():
+    global _profile_pendiente
+    with _profile_lock:
+        activo = _profile_pendiente
+        _profile_pendiente = False
+    if not activo:
+        yield
+        return
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        yield
+    finally:
+        perfil.disable()
+        perfil.dump_stats(METRICS_PROFILE_PATH)
+        log(get_logger("metrics"), f"Perfil de la corrida guardado en {METRICS_PROFILE_PATH}", evento="perfil", ruta=METRICS_PROFILE_PATH)
+
+
+# --- Servidor de métricas ---
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        cuerpo = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, format, *args):
+        pass  # Sin un log por cada consulta de Prometheus.
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=None):
+    """
+    Levanta (una sola vez por proceso) el endpoint /metrics en un hilo aparte.
+    Con puerto 0 no hace nada.
+
+    Returns:
+        int: El puerto en el que escucha, o None si quedó deshabilitado.
+    """
+    global _server
+    port = METRICS_PORT if port is None else port
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            except OSError as e:
+                # Otro proceso (o una recarga de Streamlit) ya tiene el puerto.
+                log(get_logger("metrics"), f"No se pudo levantar el endpoint de métricas en el puerto {port}: {e}", logging.WARNING)
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+            log(get_logger("metrics"), f"Métricas disponibles en http://localhost:{port}/metrics", puerto=port)
+    return _server.server_address[1]
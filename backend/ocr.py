@@ -1,35 +1,438 @@
+# pytesseract (que arrastra pandas) y pdf2image se importan recién al hacer OCR:
+# una escritura con capa de texto no los necesita.
 from PyPDF2 import PdfReader
-from pdf2image import convert_from_path
-import pytesseract
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from PIL import Image, ImageFilter, ImageOps
+import numpy as np
+import hashlib
+import logging
+import os
+import threading
+import time
 
-def extract_text_from_pdf(pdf_path):
+from .cache import DiskCache, hash_key
+from .metrics import get_logger, log, span, record_span, increment
+
+logger = get_logger("ocr")
+
+# --- Configuración del OCR ---
+# Cantidad de procesos que se usan para aplicar Tesseract en paralelo.
+# Con 1 (o menos) el OCR se ejecuta en serie, página por página.
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", os.cpu_count() or 1))
+# Resolución con la que se rasterizan las páginas. Si no se define, la decide el perfil.
+OCR_DPI = int(os.getenv("OCR_DPI")) if os.getenv("OCR_DPI") else None
+# Cantidad de páginas que se rasterizan a la vez. Solo esta ventana de imágenes
+# vive en memoria, por lo que el consumo no crece con el largo del documento.
+# Nunca es menor que OCR_WORKERS, para que todos los procesos tengan una página.
+OCR_WINDOW_SIZE = int(os.getenv("OCR_WINDOW_SIZE", "4"))
+# Una página usa su capa de texto si tiene al menos esta cantidad de caracteres
+# y una proporción suficiente de caracteres legibles; si no, se le aplica OCR.
+OCR_MIN_TEXT_CHARS = int(os.getenv("OCR_MIN_TEXT_CHARS", "50"))
+OCR_MIN_TEXT_RATIO = float(os.getenv("OCR_MIN_TEXT_RATIO", "0.7"))
+# Idioma de Tesseract ('spa' para español, que debe estar instalado).
+OCR_LANG = os.getenv("OCR_LANG", "spa")
+
+# --- Perfiles de OCR ---
+# Cada perfil define el preprocesamiento de la imagen (escala de grises,
+# binarización, enderezado y recorte de bordes), la resolución y el modo de
+# Tesseract: psm (segmentación de página) y oem (motor; 1 = solo LSTM).
+# 'original' reproduce el comportamiento anterior: imagen color sin tocar.
+OCR_PROFILES = {
+    "original": {"dpi": 200, "psm": 3, "oem": 3, "gris": False, "binarizar": False, "enderezar": False, "recortar": False},
+    "rapido": {"dpi": 150, "psm": 6, "oem": 1, "gris": True, "binarizar": True, "enderezar": False, "recortar": True},
+    "equilibrado": {"dpi": 200, "psm": 3, "oem": 1, "gris": True, "binarizar": True, "enderezar": True, "recortar": True},
+    "preciso": {"dpi": 300, "psm": 3, "oem": 1, "gris": True, "binarizar": True, "enderezar": True, "recortar": True},
+}
+OCR_PROFILE = os.getenv("OCR_PROFILE", "equilibrado")
+# Permiten ajustar el modo de Tesseract sin definir un perfil nuevo.
+OCR_PSM = os.getenv("OCR_PSM")
+OCR_OEM = os.getenv("OCR_OEM")
+# Máximo ángulo (en grados) que se corrige al enderezar una página escaneada.
+OCR_MAX_SKEW = float(os.getenv("OCR_MAX_SKEW", "5"))
+
+# --- Caché de resultados de OCR ---
+# Un PDF que se vuelve a subir (reintento, otra carpeta, revisión) reutiliza el
+# texto ya extraído en lugar de volver a rasterizar y aplicar Tesseract.
+# Con OCR_CACHE_MAX_MB=0 la caché queda deshabilitada.
+ocr_cache = DiskCache(
+    directory=os.getenv("OCR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "escrituras", "ocr")),
+    max_bytes=int(float(os.getenv("OCR_CACHE_MAX_MB", "500")) * 1024 * 1024),
+    name="ocr",
+)
+
+
+@lru_cache(maxsize=None)
+def _ocr_engine():
+    """
+    Identifica el motor de OCR instalado, para invalidar la caché si cambia.
+    """
+    try:
+        import pytesseract
+        return f"tesseract-{pytesseract.get_tesseract_version()}"
+    except Exception:
+        return "tesseract"
+
+
+def read_pdf_bytes(pdf):
+    """
+    Devuelve el contenido del PDF en memoria. Acepta bytes, un buffer (por
+    ejemplo, el archivo subido a Streamlit o un BytesIO) o una ruta, que se
+    lee una sola vez; desde ahí todo el pipeline trabaja sobre los bytes.
+    """
+    if isinstance(pdf, (bytes, bytearray, memoryview)):
+        return bytes(pdf)
+    if hasattr(pdf, "read"):
+        if hasattr(pdf, "seek"):
+            pdf.seek(0)
+        return pdf.read()
+    with open(pdf, "rb") as f:
+        return f.read()
+
+
+def pdf_sha256(pdf_bytes):
+    """
+    Calcula el SHA-256 del contenido del PDF.
+    """
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def _page_count(pdf_bytes, reader=None):
+    try:
+        return len((reader or PdfReader(BytesIO(pdf_bytes))).pages)
+    except Exception:
+        from pdf2image import pdfinfo_from_bytes
+        return pdfinfo_from_bytes(pdf_bytes)["Pages"]
+
+
+def get_ocr_profile(nombre=None):
+    """
+    Devuelve la configuración del perfil de OCR indicado (por defecto
+    OCR_PROFILE), aplicando OCR_DPI, OCR_PSM y OCR_OEM si están definidos.
+    """
+    nombre = nombre or OCR_PROFILE
+    if nombre not in OCR_PROFILES:
+        raise ValueError(f"Perfil de OCR desconocido: {nombre}. Opciones: {', '.join(OCR_PROFILES)}")
+    perfil = dict(OCR_PROFILES[nombre], nombre=nombre)
+    if OCR_DPI:
+        perfil["dpi"] = OCR_DPI
+    if OCR_PSM:
+        perfil["psm"] = int(OCR_PSM)
+    if OCR_OEM:
+        perfil["oem"] = int(OCR_OEM)
+    return perfil
+
+
+def _otsu_threshold(pixels):
+    """
+    Umbral de Otsu sobre un arreglo de grises: el que mejor separa tinta y fondo.
+    """
+    hist = np.bincount(pixels.ravel(), minlength=256).astype(np.float64)
+    niveles = np.arange(256)
+    peso_fondo = np.cumsum(hist)
+    peso_tinta = peso_fondo[-1] - peso_fondo
+    suma = np.cumsum(hist * niveles)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        media_fondo = suma / peso_fondo
+        media_tinta = (suma[-1] - suma) / peso_tinta
+        varianza = peso_fondo * peso_tinta * (media_fondo - media_tinta) ** 2
+    if np.isnan(varianza).all():
+        # Página de un solo tono (en blanco): queda toda como fondo.
+        return max(int(pixels.min()) - 1, 0)
+    return int(np.nanargmax(varianza))
+
+
+def _skew_angle(binaria):
+    """
+    Estima la inclinación de una página binarizada probando ángulos y
+    quedándose con el que deja las filas de texto más marcadas (mayor
+    varianza de la proyección horizontal). Se calcula sobre una versión
+    reducida de la imagen para que sea barato.
+    """
+    muestra = binaria.copy()
+    muestra.thumbnail((800, 800))
+    tinta = ImageOps.invert(muestra)
+    mejor_angulo, mejor_puntaje = 0.0, -1.0
+    for angulo in np.arange(-OCR_MAX_SKEW, OCR_MAX_SKEW + 0.01, 0.5):
+        filas = np.asarray(tinta.rotate(angulo, resample=Image.NEAREST), dtype=np.float32).sum(axis=1)
+        puntaje = float(filas.var())
+        if puntaje > mejor_puntaje:
+            mejor_angulo, mejor_puntaje = float(angulo), puntaje
+    return mejor_angulo
+
+
+def preprocess_image(image, perfil):
+    """
+    Prepara una página rasterizada para Tesseract según el perfil: escala de
+    grises, binarización (Otsu), enderezado y recorte de los bordes vacíos.
+    Sobre papel notarial rayado o con sellos, la binarización deja el texto
+    en negro puro y el fondo en blanco, y reduce el trabajo de Tesseract.
+    """
+    if perfil.get("gris") or perfil.get("binarizar"):
+        image = image.convert("L")
+    if perfil.get("binarizar"):
+        pixels = np.asarray(image)
+        umbral = _otsu_threshold(pixels)
+        image = Image.fromarray(np.where(pixels > umbral, 255, 0).astype(np.uint8))
+    if perfil.get("enderezar") and image.mode == "L":
+        angulo = _skew_angle(image)
+        if angulo:
+            image = image.rotate(angulo, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    if perfil.get("recortar") and image.mode == "L":
+        # getbbox() ubica lo que no es fondo: invertimos para que la tinta sea
+        # "contenido". El filtro descarta motas sueltas de polvo o del escaneo.
+        caja = ImageOps.invert(image.filter(ImageFilter.MaxFilter(3))).getbbox()
+        if caja:
+            margen = 20
+            image = image.crop((
+                max(0, caja[0] - margen), max(0, caja[1] - margen),
+                min(image.width, caja[2] + margen), min(image.height, caja[3] + margen),
+            ))
+    return image
+
+
+def _tesseract_config(perfil):
+    return f"--oem {perfil['oem']} --psm {perfil['psm']}"
+
+
+def _ocr_page(image, lang='spa', perfil=None):
+    """
+    Preprocesa y aplica Tesseract a una sola página, y mide cuánto tardó.
+    Está definida a nivel de módulo para que pueda enviarse a otros procesos;
+    así el preprocesamiento también corre en paralelo.
+
+    Returns:
+        tuple: (texto de la página, segundos empleados)
+    """
+    import pytesseract
+
+    perfil = perfil or get_ocr_profile()
+    inicio = time.perf_counter()
+    image = preprocess_image(image, perfil)
+    page_text = pytesseract.image_to_string(image, lang=lang, config=_tesseract_config(perfil))
+    return page_text, time.perf_counter() - inicio
+
+
+# Pools de procesos del OCR por cantidad de procesos. Se crean la primera vez
+# que se necesitan y los reutilizan todos los documentos del proceso (el
+# worker de trabajos o un script), en lugar de levantar procesos por documento.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _shared_pool(workers):
+    """
+    Devuelve el pool compartido de `workers` procesos, creándolo si hace falta.
+    """
+    with _pools_lock:
+        if workers not in _pools:
+            _pools[workers] = ProcessPoolExecutor(max_workers=workers)
+        return _pools[workers]
+
+
+def _discard_pool(executor):
+    """
+    Quita del registro un pool que falló, para que el próximo documento cree otro.
+    """
+    with _pools_lock:
+        for workers, pool in list(_pools.items()):
+            if pool is executor:
+                del _pools[workers]
+
+
+def _ocr_window(images, lang, executor, perfil):
+    """
+    Aplica OCR a una ventana de imágenes conservando su orden. Usa el pool
+    recibido si existe; si no, o si el pool falla, procesa en serie.
+    """
+    if executor is not None:
+        try:
+            # executor.map devuelve los resultados en el orden de entrada.
+            return list(executor.map(_ocr_page, images, [lang] * len(images), [perfil] * len(images))), executor
+        except Exception as e:
+            log(logger, f"Falló el OCR en paralelo ({e}), se continúa en serie.", logging.WARNING)
+            _discard_pool(executor)
+            executor.shutdown(wait=False, cancel_futures=True)
+    return [_ocr_page(image, lang, perfil) for image in images], None
+
+
+def _page_runs(page_numbers):
+    """
+    Agrupa números de página ordenados en tramos consecutivos (first, last),
+    para rasterizar cada tramo con una sola llamada a pdftoppm.
+    """
+    runs = []
+    for page_number in page_numbers:
+        if runs and runs[-1][1] == page_number - 1:
+            runs[-1][1] = page_number
+        else:
+            runs.append([page_number, page_number])
+    return runs
+
+
+def iter_ocr_pages(pdf, pages=None, lang='spa', dpi=None, window_size=None, workers=None, perfil=None):
+    """
+    Rasteriza y aplica OCR al PDF por ventanas de páginas. Cada ventana se
+    convierte a imágenes, se procesa y se libera antes de pasar a la siguiente,
+    de modo que la memoria máxima depende del tamaño de la ventana y no de la
+    cantidad de páginas. La ventana tiene al menos tantas páginas como
+    procesos, y el pool de procesos se comparte entre documentos (ver _shared_pool).
+
+    Args:
+        pdf (bytes | str | buffer): Contenido del PDF, su ruta o un buffer.
+        pages (list, optional): Números de página (desde 1) a procesar. Por defecto, todas.
+        perfil (dict, optional): Perfil de OCR (ver get_ocr_profile). Por defecto OCR_PROFILE.
+
+    Yields:
+        tuple: (número de página, texto, segundos de OCR), en orden.
+    """
+    perfil = perfil or get_ocr_profile()
+    dpi = dpi or perfil["dpi"]
+    window_size = max(1, window_size or OCR_WINDOW_SIZE)
+    if workers is None:
+        workers = OCR_WORKERS
+    pdf_bytes = read_pdf_bytes(pdf)
+    if pages is None:
+        pages = range(1, _page_count(pdf_bytes) + 1)
+    pages = sorted(pages)
+    if not pages:
+        return
+
+    # pdf2image se importa recién cuando hay páginas para rasterizar.
+    from pdf2image import convert_from_bytes
+
+    workers = min(workers, len(pages))
+    window_size = max(window_size, workers)
+    log(logger, f"Procesando {len(pages)} páginas con Tesseract (OCR, perfil {perfil['nombre']}) a {dpi} dpi, de a {window_size}...",
+        paginas=len(pages), perfil=perfil["nombre"], dpi=dpi, ventana=window_size, procesos=workers)
+
+    executor = _shared_pool(workers) if workers > 1 else None
+    for start in range(0, len(pages), window_size):
+        window = pages[start:start + window_size]
+        images = []
+        with span("ocr.rasterizado", paginas=len(window), dpi=dpi):
+            for first_page, last_page in _page_runs(window):
+                images += convert_from_bytes(pdf_bytes, dpi=dpi, first_page=first_page, last_page=last_page)
+        with span("ocr.ventana", paginas=len(window)):
+            resultados, executor = _ocr_window(images, lang, executor, perfil)
+        # Liberamos las imágenes de la ventana antes de rasterizar la siguiente.
+        del images
+        for page_number, (page_text, segundos) in zip(window, resultados):
+            # Cada página se midió en el proceso que la procesó.
+            record_span("ocr.pagina", segundos, pagina=page_number, perfil=perfil["nombre"])
+            yield page_number, page_text, segundos
+
+
+def _text_layer_is_usable(page_text):
+    """
+    Decide si la capa de texto de una página es suficientemente buena para
+    evitar el OCR: debe tener un mínimo de caracteres y, en su mayoría,
+    caracteres legibles (las capas dañadas suelen traer símbolos sueltos).
+    """
+    stripped = "".join((page_text or "").split())
+    if len(stripped) < OCR_MIN_TEXT_CHARS:
+        return False
+    legibles = sum(1 for c in stripped if c.isalnum() or c in ".,;:-()/°º\"'$")
+    return legibles / len(stripped) >= OCR_MIN_TEXT_RATIO
+
+
+def extract_pages_from_pdf(pdf, workers=None, dpi=None, window_size=None, use_cache=True, progress=None, sha256=None):
     """
-    Extrae texto de un PDF usando Tesseract. Si el PDF no es seleccionable,
-    lo convierte a imágenes y luego aplica OCR.
+    Extrae el texto de cada página decidiendo por separado si alcanza con la
+    capa de texto del PDF o si hace falta OCR. Así, en un PDF mixto (páginas
+    tipeadas y anexos escaneados) solo se aplica Tesseract donde es necesario.
+
+    El resultado se guarda en la caché de OCR con una clave formada por el
+    SHA-256 del archivo y la configuración de OCR (idioma, dpi, perfil, motor); ante
+    un acierto no se parsea ni se rasteriza el PDF. Si quien llama ya calculó
+    el hash (por ejemplo, al recibir la subida), puede pasarlo en `sha256`.
+
+    El PDF se lee una sola vez (ver read_pdf_bytes) y el mismo contenido en
+    memoria se usa para la capa de texto y para rasterizar.
+
+    Si se indica `progress`, se llama como progress(páginas_con_ocr_hechas, total_con_ocr)
+    después de cada página procesada con Tesseract.
+
+    Returns:
+        list: Un dict por página, en orden, con las claves 'pagina', 'metodo'
+        ('texto' u 'ocr'), 'segundos' y 'texto'.
     """
-    text = ""
+    perfil = get_ocr_profile()
+    dpi = dpi or perfil["dpi"]
+    pdf_bytes = read_pdf_bytes(pdf)
+    cache_key = None
+    if use_cache and ocr_cache.enabled:
+        cache_key = hash_key(sha256 or pdf_sha256(pdf_bytes), {
+            "lang": OCR_LANG,
+            "dpi": dpi,
+            "perfil": perfil,
+            "engine": _ocr_engine(),
+            "min_text_chars": OCR_MIN_TEXT_CHARS,
+            "min_text_ratio": OCR_MIN_TEXT_RATIO,
+        })
+        paginas = ocr_cache.get(cache_key)
+        if paginas is not None:
+            log(logger, "Texto del PDF recuperado de la caché de OCR.", cache="ocr", paginas=len(paginas))
+            return paginas
+
+    paginas = []
     try:
-        # Intenta extraer texto directamente si el PDF es seleccionable
-        reader = PdfReader(pdf_path)
-        for page in reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-        if text.strip(): # Si se extrajo texto seleccionable, lo retornamos
-            print("Texto seleccionable extraído directamente.")
-            return text
+        with span("pdf.capa_texto"):
+            reader = PdfReader(BytesIO(pdf_bytes))
+            for i, page in enumerate(reader.pages):
+                inicio = time.perf_counter()
+                page_text = page.extract_text() or ""
+                paginas.append({
+                    "pagina": i + 1,
+                    "metodo": "texto" if _text_layer_is_usable(page_text) else "ocr",
+                    "segundos": time.perf_counter() - inicio,
+                    "texto": page_text,
+                })
     except Exception as e:
-        print(f"No se pudo extraer texto seleccionable, intentando OCR: {e}")
+        log(logger, f"No se pudo leer la capa de texto del PDF, se aplicará OCR a todas las páginas: {e}", logging.WARNING)
+        total_pages = _page_count(pdf_bytes)
+        paginas = [{"pagina": i + 1, "metodo": "ocr", "segundos": 0.0, "texto": ""} for i in range(total_pages)]
+
+    pendientes = [p["pagina"] for p in paginas if p["metodo"] == "ocr"]
+    increment("escrituras_paginas_total", len(paginas) - len(pendientes), "Páginas procesadas por método", metodo="texto")
+    increment("escrituras_paginas_total", len(pendientes), "Páginas procesadas por método", metodo="ocr")
+    log(logger, f"{len(paginas) - len(pendientes)} páginas con texto seleccionable, {len(pendientes)} requieren OCR.",
+        paginas_texto=len(paginas) - len(pendientes), paginas_ocr=len(pendientes))
+    if pendientes:
+        ocr_pages = iter_ocr_pages(pdf_bytes, pages=pendientes, lang=OCR_LANG, dpi=dpi, window_size=window_size, workers=workers, perfil=perfil)
+        for hechas, (page_number, page_text, segundos) in enumerate(ocr_pages, start=1):
+            pagina = paginas[page_number - 1]
+            pagina["texto"] = page_text
+            pagina["segundos"] += segundos
+            if progress:
+                progress(hechas, len(pendientes))
 
-    # Si no se extrajo texto seleccionable, o hubo un error, se usa OCR
+    if cache_key:
+        try:
+            ocr_cache.set(cache_key, paginas)
+        except Exception as e:
+            log(logger, f"No se pudo guardar el resultado en la caché de OCR: {e}", logging.WARNING)
+    return paginas
+
+
+def extract_text_from_pdf(pdf, workers=None, dpi=None, window_size=None, use_cache=True, progress=None, sha256=None):
+    """
+    Extrae texto de un PDF combinando la capa de texto seleccionable y OCR con
+    Tesseract, página por página (ver extract_pages_from_pdf).
+
+    Args:
+        pdf (bytes | str | buffer): Contenido del PDF, su ruta o un buffer.
+        workers (int, optional): Procesos para el OCR en paralelo. Por defecto OCR_WORKERS.
+        dpi (int, optional): Resolución de rasterizado. Por defecto OCR_DPI o la del perfil.
+        window_size (int, optional): Páginas rasterizadas a la vez. Por defecto OCR_WINDOW_SIZE.
+        use_cache (bool): Si se consulta y actualiza la caché de OCR.
+        progress (callable, optional): Avance del OCR, ver extract_pages_from_pdf.
+        sha256 (str, optional): Hash del PDF si ya se calculó.
+    """
     try:
-        images = convert_from_path(pdf_path)
-        for i, image in enumerate(images):
-            print(f"Procesando página {i+1} con Tesseract (OCR)...")
-            # Usa 'spa' para español, el cual esté instalado en Tesseract
-            page_text = pytesseract.image_to_string(image, lang='spa')
-            text += page_text + "\n"
-        return text
+        paginas = extract_pages_from_pdf(pdf, workers=workers, dpi=dpi, window_size=window_size, use_cache=use_cache, progress=progress, sha256=sha256)
+        return "".join(p["texto"] + "\n" for p in paginas if p["texto"])
     except Exception as e:
-        print(f"Error al convertir PDF a imagen o al aplicar OCR con Tesseract: {e}")
+        logger.exception(f"Error al convertir PDF a imagen o al aplicar OCR con Tesseract: {e}")
         return e
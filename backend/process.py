@@ -1,28 +1,238 @@
-from .ocr import extract_text_from_pdf
-from .extractor import extract_data_with_langchain
+import logging
 
-def process_escritura_publica(pdf_path):
+from .ocr import extract_text_from_pdf, extract_pages_from_pdf, read_pdf_bytes, pdf_sha256
+from .extractor import extract_data_with_langchain, extract_many, extraction_metadata
+from .database import save_ocr_texts
+from .segmenter import split_escrituras
+from .similarity import find_duplicate_escrituras
+from .metrics import get_logger, log, span, pipeline_run
+
+logger = get_logger("process")
+
+
+def _find_duplicates(texto, numero_carpeta=None):
+    """
+    Escrituras ya guardadas (con otro número de carpeta) con un texto casi
+    igual. Solo se informan: usar sus datos en lugar de extraer lo decide el
+    usuario en la interfaz (ver database.reuse_escritura).
+    """
+    duplicados = find_duplicate_escrituras(texto, excluir_carpeta=numero_carpeta)
+    if duplicados:
+        log(logger, f"El texto coincide en un {duplicados[0]['similitud']:.0%} con la carpeta {duplicados[0]['numero_carpeta']}.",
+            duplicados=duplicados)
+    return duplicados
+
+
+def _extract_stage(texto, sha256, progress, corrida):
+    """
+    Etapa de extracción con LangChain y GPT sobre el texto OCR.
+    """
+    progress('extraccion', 'en_proceso')
+    with span("extraccion"):
+        relevant_data = extract_data_with_langchain(texto)
+    if not relevant_data:
+        log(logger, "No se pudieron extraer datos relevantes. Abortando.", logging.ERROR)
+        progress('extraccion', 'error')
+        corrida["resultado"] = "error_extraccion"
+        return None
+    progress('extraccion', 'terminado')
+
+    corrida["resultado"] = "ok"
+    resultado = relevant_data.model_dump()
+    log(logger, "Datos extraídos.", nivel=logging.DEBUG, datos=resultado)
+    resultado['extraccion'] = extraction_metadata(sha256)
+    return resultado
+
+
+def process_ocr_text(texto, sha256, progress=None):
+    """
+    Extrae los datos de un texto OCR ya guardado, sin el PDF ni buscar
+    duplicados (por ejemplo, cuando se pide extraer igualmente un posible
+    duplicado).
+    """
+    progress = progress or (lambda etapa, estado, **detalle: None)
+    with pipeline_run(origen="texto_ocr") as corrida:
+        return _extract_stage(texto, sha256, progress, corrida)
+
+
+def process_escritura_publica(pdf, progress=None, sha256=None, numero_carpeta=None, buscar_duplicados=True):
     """
     Orquestra el proceso completo de extracción, análisis y almacenamiento.
     Utiliza funciones de OCR y LangChain para extraer datos relevantes de un PDF de escritura pública.
+
+    Cada corrida se registra como un span 'pipeline' con sus etapas ('ocr',
+    'extraccion') anidadas, y todos sus eventos llevan el mismo id de corrida
+    (ver metrics.py). El texto OCR se guarda comprimido en MongoDB y el
+    resultado incluye 'extraccion' (versión del prompt y el esquema, modelo y
+    SHA-256 del PDF), para poder volver a extraerlo sin repetir el OCR.
+
+    Args:
+        pdf (bytes | str | buffer): Contenido del PDF (por ejemplo, la subida
+            tal como llegó), su ruta o un buffer.
+        progress (callable, optional): Se llama como progress(etapa, estado, **detalle)
+            al empezar y terminar cada etapa ('ocr', 'extraccion') y con el avance
+            de páginas del OCR. Lo usan los trabajos en segundo plano.
+        sha256 (str, optional): Hash del PDF calculado al recibirlo, para no
+            volver a calcularlo.
+        numero_carpeta (int, optional): Carpeta del análisis; una escritura
+            parecida guardada en esta misma carpeta no cuenta como duplicado.
+        buscar_duplicados (bool): Antes de llamar al LLM, busca escrituras ya
+            guardadas con un texto casi igual (ver similarity.py); si hay, no
+            extrae y devuelve solo {'posibles_duplicados': [...]}, para que el
+            usuario elija usar los datos de una de ellas o extraer igualmente.
     """
-    print(f"\n--- Iniciando procesamiento de: {pdf_path} ---")
+    progress = progress or (lambda etapa, estado, **detalle: None)
+    with pipeline_run(origen=pdf if isinstance(pdf, str) else "memoria") as corrida:
+        if sha256 is None:
+            # Leemos el PDF una sola vez: los bytes sirven para el hash y para el OCR.
+            pdf = read_pdf_bytes(pdf)
+            sha256 = pdf_sha256(pdf)
+        log(logger, "Iniciando procesamiento del PDF.", sha256=sha256)
 
-    # 1. Extraer texto del PDF
-    extracted_text = extract_text_from_pdf(pdf_path)
-    if not extracted_text:
-        print("No se pudo extraer texto del PDF. Abortando.")
-        return
+        # 1. Extraer texto del PDF
+        progress('ocr', 'en_proceso')
+        with span("ocr") as datos:
+            extracted_text = extract_text_from_pdf(
+                pdf,
+                progress=lambda hechas, total: progress('ocr', 'en_proceso', paginas_hechas=hechas, paginas_total=total),
+                sha256=sha256,
+            )
+            datos["caracteres"] = len(extracted_text) if isinstance(extracted_text, str) else 0
+        if not extracted_text or isinstance(extracted_text, Exception):
+            log(logger, "No se pudo extraer texto del PDF. Abortando.", logging.ERROR)
+            progress('ocr', 'error')
+            corrida["resultado"] = "error_ocr"
+            return
+        progress('ocr', 'terminado')
+        save_ocr_texts([(sha256, extracted_text)])
 
-    print("\nTexto extraído")
-    
-    # 2. Extraer datos relevantes con LangChain y GPT
-    print("\nIniciando extracción de datos con LangChain y GPT...")
-    relevant_data = extract_data_with_langchain(extracted_text)
-    if not relevant_data:
-        print("No se pudieron extraer datos relevantes. Abortando.")
-        return
+        # 2. Buscar una escritura ya guardada con el mismo texto
+        if buscar_duplicados:
+            duplicados = _find_duplicates(extracted_text, numero_carpeta)
+            if duplicados:
+                progress('extraccion', 'terminado', duplicado_de=duplicados[0]['numero_carpeta'])
+                corrida["resultado"] = "posible_duplicado"
+                return {'posibles_duplicados': duplicados}
+
+        # 3. Extraer datos relevantes con LangChain y GPT
+        return _extract_stage(extracted_text, sha256, progress, corrida)
+
+
+def assign_carpetas(cantidad, carpetas=None, primera_carpeta=None):
+    """
+    Números de carpeta de las escrituras separadas de un PDF: los indicados
+    (uno por escritura, en orden) o consecutivos desde `primera_carpeta`.
+    """
+    if carpetas:
+        if len(carpetas) != cantidad:
+            raise ValueError(f"Se encontraron {cantidad} escrituras en el PDF pero se indicaron {len(carpetas)} carpetas.")
+        if len(set(carpetas)) != len(carpetas):
+            raise ValueError("Cada escritura debe ir a una carpeta distinta.")
+        return list(carpetas)
+    if not primera_carpeta:
+        raise ValueError("Indica la primera carpeta o una carpeta por escritura.")
+    return [primera_carpeta + i for i in range(cantidad)]
+
+
+def process_protocolo(pdf, primera_carpeta=None, carpetas=None, progress=None, sha256=None,
+                      buscar_duplicados=True, llm=None, max_concurrency=None, validar_carpetas=None):
+    """
+    Procesa un PDF con varias escrituras (por ejemplo, el escaneo de un
+    protocolo): aplica el OCR una vez, separa las escrituras por sus
+    encabezados y cierres (ver segmenter.split_escrituras) y extrae cada una
+    con su propio prompt, en simultáneo (ver extractor.aextract_many).
+
+    El texto OCR de cada escritura se guarda con la clave '<sha256>#<n>' (o
+    el SHA-256 del PDF si tiene una sola), que queda en 'extraccion.pdf_sha256'
+    junto con el SHA-256 del protocolo y las páginas que ocupa; así cada
+    escritura puede buscarse como duplicado o reextraerse por separado. Las
+    escrituras casi iguales a una ya guardada se extraen igual y se informan
+    en 'posibles_duplicados'. No guarda las escrituras: eso queda para quien llama.
+
+    Args:
+        primera_carpeta (int, optional): Las escrituras se numeran consecutivamente desde esta carpeta.
+        carpetas (list, optional): Una carpeta por escritura, en orden; tiene prioridad sobre primera_carpeta.
+        llm (optional): Modelo de chat a usar en lugar del cliente compartido (ej. uno falso en pruebas).
+        validar_carpetas (callable, optional): Se llama con las carpetas asignadas
+            antes de llamar al LLM; si lanza una excepción, no se extrae nada.
+
+    Returns:
+        list | None: Un dict por escritura con 'numero_carpeta', 'paginas',
+        'resultado' (None si falló su extracción) y 'posibles_duplicados';
+        None si no se pudo leer el PDF.
+
+    Raises:
+        ValueError: Si la cantidad de carpetas indicadas no coincide con las escrituras encontradas.
+    """
+    progress = progress or (lambda etapa, estado, **detalle: None)
+    with pipeline_run(origen=pdf if isinstance(pdf, str) else "memoria", protocolo=True) as corrida:
+        if sha256 is None:
+            pdf = read_pdf_bytes(pdf)
+            sha256 = pdf_sha256(pdf)
+        log(logger, "Iniciando procesamiento del protocolo.", sha256=sha256)
+
+        # 1. Extraer el texto de cada página
+        progress('ocr', 'en_proceso')
+        with span("ocr") as datos:
+            try:
+                paginas = extract_pages_from_pdf(
+                    pdf,
+                    progress=lambda hechas, total: progress('ocr', 'en_proceso', paginas_hechas=hechas, paginas_total=total),
+                    sha256=sha256,
+                )
+            except Exception as e:
+                logger.exception(f"Error al convertir PDF a imagen o al aplicar OCR con Tesseract: {e}")
+                paginas = []
+            datos["paginas"] = len(paginas)
+        if not any(pagina["texto"] for pagina in paginas):
+            log(logger, "No se pudo extraer texto del PDF. Abortando.", logging.ERROR)
+            progress('ocr', 'error')
+            corrida["resultado"] = "error_ocr"
+            return None
+        progress('ocr', 'terminado')
+
+        # 2. Separar las escrituras y asignarles carpeta
+        with span("separacion") as datos:
+            escrituras = split_escrituras([pagina["texto"] for pagina in paginas])
+            datos["escrituras"] = len(escrituras)
+        numeros = assign_carpetas(len(escrituras), carpetas, primera_carpeta)
+        if validar_carpetas:
+            validar_carpetas(numeros)
+        claves = [f"{sha256}#{i}" for i in range(1, len(escrituras) + 1)] if len(escrituras) > 1 else [sha256]
+        save_ocr_texts([(clave, escritura["texto"]) for clave, escritura in zip(claves, escrituras)])
+
+        # 3. Extraer todas en simultáneo; las casi iguales a una ya guardada solo se marcan
+        duplicados = [
+            _find_duplicates(escritura["texto"], numero) if buscar_duplicados else []
+            for escritura, numero in zip(escrituras, numeros)
+        ]
+        resultados = [None] * len(escrituras)
+        progress('extraccion', 'en_proceso', escrituras_total=len(escrituras))
+        with span("extraccion", escrituras=len(escrituras)):
+            extraidos = extract_many([escritura["texto"] for escritura in escrituras], llm=llm, max_concurrency=max_concurrency)
+        for i, extraido in enumerate(extraidos):
+            if extraido is None:
+                log(logger, f"No se pudieron extraer los datos de la escritura de las páginas {escrituras[i]['paginas'][0]} a {escrituras[i]['paginas'][1]}.",
+                    logging.ERROR, paginas=escrituras[i]["paginas"])
+                continue
+            resultados[i] = extraido.model_dump()
+            resultados[i]['extraccion'] = {
+                **extraction_metadata(claves[i]),
+                'protocolo_sha256': sha256,
+                'paginas': list(escrituras[i]["paginas"]),
+            }
 
-    print("\nDatos extraídos:")
-    print(relevant_data.model_dump_json(indent=2))
-    return relevant_data.model_dump()
+        salida = [
+            {
+                'numero_carpeta': numero,
+                'paginas': list(escritura["paginas"]),
+                'resultado': resultado,
+                'posibles_duplicados': duplicados_escritura,
+            }
+            for escritura, numero, resultado, duplicados_escritura in zip(escrituras, numeros, resultados, duplicados)
+        ]
+        errores = resultados.count(None)
+        progress('extraccion', 'error' if errores == len(resultados) else 'terminado', escrituras_con_error=errores)
+        corrida["escrituras"] = len(escrituras)
+        corrida["resultado"] = "ok" if not errores else "error_extraccion" if errores == len(resultados) else "parcial"
+        return salida
@@ -0,0 +1,123 @@
+"""
+Carga de un PDF con varias escrituras (por ejemplo, un protocolo escaneado)
+sin interfaz gráfica.
+
+Aplica el OCR una vez, separa las escrituras por su encabezado ("ESCRITURA
+NÚMERO ...") y su cierre ("Ante mí:", "CONCUERDA"), extrae cada una con su
+propio prompt en simultáneo y las guarda en carpetas consecutivas o en las
+indicadas, una por escritura. Con --simular solo muestra cómo se separaría
+el PDF, sin llamar al LLM ni guardar.
+
+Uso:
+    python -m backend.protocolo protocolo_2021.pdf --simular
+    python -m backend.protocolo protocolo_2021.pdf --primera-carpeta 120
+    python -m backend.protocolo protocolo_2021.pdf --carpetas 120 121 125
+"""
+import argparse
+import time
+
+from .database import get_db_collection, save_many_to_mongodb
+from .extractor import LLM_MAX_CONCURRENCY
+from .ocr import extract_pages_from_pdf, read_pdf_bytes, pdf_sha256
+from .process import process_protocolo
+from .segmenter import split_escrituras
+from .metrics import get_logger, log
+
+logger = get_logger("protocolo")
+
+
+def existing_carpetas(numeros) -> list:
+    """
+    Devuelve, de `numeros`, las carpetas que ya tienen una escritura guardada.
+    """
+    collection = get_db_collection()
+    if collection is None:
+        raise RuntimeError("No hay conexión a la base de datos.")
+    documentos = collection.find({'numero_carpeta': {'$in': list(numeros)}}, {'_id': 0, 'numero_carpeta': 1})
+    return sorted(documento['numero_carpeta'] for documento in documentos)
+
+
+def check_carpetas_libres(numeros):
+    """
+    Lanza ValueError si alguna de las carpetas ya tiene una escritura guardada.
+    """
+    ocupadas = existing_carpetas(numeros)
+    if ocupadas:
+        raise ValueError(f"Las carpetas {', '.join(map(str, ocupadas))} ya tienen una escritura guardada "
+                         "(usa otras carpetas o --sobrescribir).")
+
+
+def load_protocolo(pdf, primera_carpeta=None, carpetas=None, sobrescribir=False, llm=None, max_concurrency=None):
+    """
+    Separa, extrae y guarda las escrituras de un PDF. Salvo con `sobrescribir`,
+    si alguna de las carpetas ya existe no se extrae ni se guarda nada: las
+    indicadas se verifican antes del OCR y las consecutivas apenas se sabe
+    cuántas escrituras hay, antes de llamar al LLM.
+
+    Returns:
+        list: Un dict por escritura con 'numero_carpeta', 'paginas', 'ok' y 'error'.
+    """
+    if carpetas and not sobrescribir:
+        check_carpetas_libres(carpetas)
+    escrituras = process_protocolo(
+        pdf, primera_carpeta=primera_carpeta, carpetas=carpetas, llm=llm, max_concurrency=max_concurrency,
+        validar_carpetas=None if sobrescribir else check_carpetas_libres,
+    )
+    if escrituras is None:
+        raise RuntimeError("No se pudo extraer texto del PDF.")
+
+    extraidas = [escritura for escritura in escrituras if escritura['resultado']]
+    guardadas = {r['numero_carpeta']: r for r in save_many_to_mongodb((e['resultado'], e['numero_carpeta']) for e in extraidas)}
+    resumen = []
+    for escritura in escrituras:
+        guardada = guardadas.get(escritura['numero_carpeta'], {})
+        resumen.append({
+            'numero_carpeta': escritura['numero_carpeta'],
+            'paginas': escritura['paginas'],
+            'ok': bool(guardada.get('ok')),
+            'error': guardada.get('error') if escritura['resultado'] else "No se pudieron extraer los datos.",
+        })
+    log(logger, f"Guardadas {sum(r['ok'] for r in resumen)} de {len(resumen)} escrituras del protocolo.", escrituras=resumen)
+    return resumen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Separa un PDF con varias escrituras, extrae cada una y las guarda en su carpeta.")
+    parser.add_argument("pdf", help="Ruta del PDF.")
+    destino = parser.add_mutually_exclusive_group()
+    destino.add_argument("--primera-carpeta", type=int, help="Las escrituras se guardan en carpetas consecutivas desde esta.")
+    destino.add_argument("--carpetas", type=int, nargs="+", help="Una carpeta por escritura, en orden.")
+    parser.add_argument("--simular", action="store_true", help="Solo mostrar las escrituras encontradas y sus páginas.")
+    parser.add_argument("--sobrescribir", action="store_true", help="Guardar aunque la carpeta ya tenga una escritura.")
+    parser.add_argument("--llm-workers", type=int, default=LLM_MAX_CONCURRENCY, help="Extracciones con GPT en simultáneo.")
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    if args.simular:
+        pdf = read_pdf_bytes(args.pdf)
+        paginas = extract_pages_from_pdf(pdf, sha256=pdf_sha256(pdf))
+        escrituras = split_escrituras([pagina["texto"] for pagina in paginas])
+        print(f"{len(escrituras)} escrituras en {len(paginas)} páginas:")
+        for i, escritura in enumerate(escrituras, 1):
+            print(f"  {i}. páginas {escritura['paginas'][0]} a {escritura['paginas'][1]} ({len(escritura['texto'])} caracteres): "
+                  f"{escritura['texto'][:60].splitlines()[0] if escritura['texto'] else ''}")
+        return
+    if not args.primera_carpeta and not args.carpetas:
+        parser.error("indica --primera-carpeta o --carpetas (o usa --simular).")
+
+    try:
+        resumen = load_protocolo(
+            args.pdf, primera_carpeta=args.primera_carpeta, carpetas=args.carpetas,
+            sobrescribir=args.sobrescribir, max_concurrency=max(1, args.llm_workers),
+        )
+    except (ValueError, RuntimeError) as e:
+        print(f"Error: {e}")
+        raise SystemExit(1)
+    for escritura in resumen:
+        estado = "guardada" if escritura['ok'] else f"error: {escritura['error']}"
+        print(f"  Carpeta {escritura['numero_carpeta']} (páginas {escritura['paginas'][0]} a {escritura['paginas'][1]}): {estado}")
+    print(f"{sum(e['ok'] for e in resumen)} de {len(resumen)} escrituras guardadas en {time.perf_counter() - inicio:.1f} s.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Reextracción de escrituras con una versión vieja del prompt o del esquema.
+
+Cada resultado guarda en 'extraccion' la versión con la que se extrajo (un
+hash del prompt y de EscrituraPublicaData, ver extractor.extraction_version)
+y el SHA-256 del PDF, cuyo texto OCR queda guardado comprimido en MongoDB.
+Al mejorar el prompt o models.py, este comando vuelve a correr solo la
+extracción con GPT sobre ese texto, sin el PDF ni el OCR, por lotes y solo
+para las escrituras desactualizadas. Los campos corregidos a mano en la
+interfaz ('campos_editados') conservan el valor corregido.
+
+Uso:
+    python -m backend.reextract --simular
+    python -m backend.reextract --lote 20 --limite 500
+    python -m backend.reextract --carpetas 1203 1204 --forzar
+"""
+from datetime import datetime
+import argparse
+import copy
+import time
+
+from .database import get_db_collection, load_ocr_texts, search_fields
+from .extractor import extract_many, extraction_metadata, extraction_version, LLM_MAX_CONCURRENCY
+from .metrics import get_logger, log, span, increment
+
+logger = get_logger("reextract")
+
+# Datos de 'extraccion' que no dependen de la versión (ver process.process_protocolo).
+ORIGEN_PROTOCOLO = ('protocolo_sha256', 'paginas')
+
+
+def stale_query(version=None, carpetas=None, forzar=False):
+    """
+    Filtro de las escrituras a reextraer: las que tienen texto OCR guardado
+    y una versión de extracción distinta de la actual (o todas, con `forzar`).
+    """
+    query = {'extraccion.pdf_sha256': {'$nin': [None, '']}}
+    if not forzar:
+        query['extraccion.version'] = {'$ne': version or extraction_version()}
+    if carpetas:
+        query['numero_carpeta'] = {'$in': list(carpetas)}
+    return query
+
+
+def _get_path(data, partes):
+    for parte in partes:
+        if isinstance(data, dict) and parte in data:
+            data = data[parte]
+        elif isinstance(data, list) and parte.isdigit() and int(parte) < len(data):
+            data = data[int(parte)]
+        else:
+            return False, None
+    return True, data
+
+
+def _set_path(data, partes, valor):
+    ok, contenedor = _get_path(data, partes[:-1])
+    ultima = partes[-1]
+    if ok and isinstance(contenedor, dict):
+        contenedor[ultima] = valor
+        return True
+    if ok and isinstance(contenedor, list) and ultima.isdigit() and int(ultima) < len(contenedor):
+        contenedor[int(ultima)] = valor
+        return True
+    return False
+
+
+def preserve_edits(nuevo: dict, actual: dict, campos_editados) -> dict:
+    """
+    Aplica sobre el resultado de la reextracción los campos corregidos a mano
+    en el documento actual. Si la ruta editada ya no existe en el resultado
+    nuevo (por ejemplo, 'partes_intervinientes.3.nombre' cuando ahora se
+    extrajeron tres partes), se conserva el campo de primer nivel completo
+    tal como está guardado.
+    """
+    resultado = copy.deepcopy(nuevo)
+    for ruta in campos_editados or []:
+        partes = ruta.split('.')
+        existe, valor = _get_path(actual, partes)
+        if not existe:
+            continue
+        if not _set_path(resultado, partes, copy.deepcopy(valor)):
+            resultado[partes[0]] = copy.deepcopy(actual.get(partes[0]))
+    return resultado
+
+
+def _save_reextraction(collection, documento, datos):
+    """
+    Guarda el resultado con control de concurrencia optimista: si alguien
+    editó la escritura mientras se reextraía, no se pisa y queda pendiente
+    para la próxima corrida.
+
+    Returns:
+        bool: True si se guardó.
+    """
+    datos.pop('_id', None)
+    datos.pop('fecha_creacion', None)
+    datos.pop('version', None)
+    datos['numero_carpeta'] = documento['numero_carpeta']
+    datos['campos_editados'] = documento.get('campos_editados') or []
+    version = documento.get('version') or 0
+    filtro_version = version if version else {'$in': [None, 0]}
+    resultado = collection.update_one(
+        {'numero_carpeta': documento['numero_carpeta'], 'version': filtro_version},
+        {'$set': {**datos, **search_fields(datos), 'ultima_modificacion': datetime.now()}, '$inc': {'version': 1}},
+    )
+    return bool(resultado.matched_count)
+
+
+def reextract(lote=20, limite=None, carpetas=None, forzar=False, simular=False, llm=None, max_concurrency=None):
+    """
+    Reextrae por lotes las escrituras desactualizadas. En cada lote se leen
+    los textos OCR guardados, se extraen en simultáneo (con el límite de
+    concurrencia y de tokens por minuto de extractor.aextract_many) y se
+    guardan conservando los campos editados a mano.
+
+    Args:
+        llm (optional): Modelo de chat a usar en lugar del cliente compartido (ej. uno falso en pruebas).
+
+    Returns:
+        dict: Cantidades 'pendientes', 'reextraidas', 'sin_texto', 'errores',
+        'conflictos' y 'sin_texto_guardado' (escrituras que requieren volver a subir el PDF).
+    """
+    collection = get_db_collection()
+    if collection is None:
+        raise RuntimeError("No hay conexión a la base de datos.")
+
+    version = extraction_version()
+    query = stale_query(version, carpetas, forzar)
+    sin_texto_guardado = collection.count_documents({'extraccion.pdf_sha256': {'$in': [None, '']}})
+    pendientes = collection.count_documents(query)
+    if limite:
+        pendientes = min(pendientes, limite)
+    resumen = {'pendientes': pendientes, 'reextraidas': 0, 'sin_texto': 0, 'errores': 0, 'conflictos': 0,
+               'sin_texto_guardado': sin_texto_guardado}
+    log(logger, f"{pendientes} escrituras a reextraer con la versión {version}; {sin_texto_guardado} sin texto OCR guardado.",
+        pendientes=pendientes, version=version, sin_texto_guardado=sin_texto_guardado)
+    if simular or not pendientes:
+        return resumen
+
+    # Tomamos los números de carpeta de antemano: cada lote guardado deja de
+    # cumplir el filtro, y así un error no hace que se vuelva a intentar en esta corrida.
+    cursor = collection.find(query, {'numero_carpeta': 1}).sort('numero_carpeta', 1)
+    if limite:
+        cursor = cursor.limit(limite)
+    numeros = [documento['numero_carpeta'] for documento in cursor]
+
+    for inicio in range(0, len(numeros), lote):
+        with span("reextraccion.lote", escrituras=len(numeros[inicio:inicio + lote])) as datos_lote:
+            documentos = list(collection.find(
+                {'numero_carpeta': {'$in': numeros[inicio:inicio + lote]}},
+                {'busqueda': 0, 'fecha_otorgamiento_iso': 0},
+            ))
+            textos = load_ocr_texts({documento['extraccion']['pdf_sha256'] for documento in documentos})
+            con_texto = [documento for documento in documentos if documento['extraccion']['pdf_sha256'] in textos]
+            resumen['sin_texto'] += len(documentos) - len(con_texto)
+
+            resultados = extract_many(
+                [textos[documento['extraccion']['pdf_sha256']] for documento in con_texto],
+                llm=llm, max_concurrency=max_concurrency,
+            )
+            for documento, extraido in zip(con_texto, resultados):
+                if extraido is None:
+                    resumen['errores'] += 1
+                    log(logger, f"No se pudo reextraer la carpeta {documento['numero_carpeta']}.", numero_carpeta=documento['numero_carpeta'])
+                    continue
+                datos = preserve_edits(extraido.model_dump(), documento, documento.get('campos_editados'))
+                datos['extraccion'] = extraction_metadata(documento['extraccion']['pdf_sha256'])
+                # Las escrituras separadas de un protocolo conservan de dónde salieron.
+                datos['extraccion'].update({clave: documento['extraccion'][clave] for clave in ORIGEN_PROTOCOLO if clave in documento['extraccion']})
+                if _save_reextraction(collection, documento, datos):
+                    resumen['reextraidas'] += 1
+                else:
+                    resumen['conflictos'] += 1
+            datos_lote.update({clave: resumen[clave] for clave in ('reextraidas', 'errores', 'conflictos')})
+        increment("escrituras_reextracciones_total", len(con_texto), "Escrituras reextraídas con una versión nueva del prompt o el esquema")
+        log(logger, f"Reextraídas {resumen['reextraidas']} de {pendientes}.", **resumen)
+    return resumen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vuelve a extraer con GPT las escrituras con una versión vieja del prompt o del esquema, usando el texto OCR guardado.")
+    parser.add_argument("--lote", type=int, default=20, help="Escrituras por lote.")
+    parser.add_argument("--limite", type=int, help="Máximo de escrituras a reextraer en esta corrida.")
+    parser.add_argument("--carpetas", type=int, nargs="+", help="Reextraer solo estos números de carpeta.")
+    parser.add_argument("--forzar", action="store_true", help="Reextraer aunque la versión guardada sea la actual.")
+    parser.add_argument("--simular", action="store_true", help="Solo informar cuántas escrituras se reextraerían.")
+    parser.add_argument("--llm-workers", type=int, default=LLM_MAX_CONCURRENCY, help="Extracciones con GPT en simultáneo.")
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    resumen = reextract(
+        lote=max(1, args.lote), limite=args.limite, carpetas=args.carpetas,
+        forzar=args.forzar, simular=args.simular, max_concurrency=max(1, args.llm_workers),
+    )
+    print(f"\n--- Reextracción (versión {extraction_version()}) ---")
+    print(f"Pendientes: {resumen['pendientes']} | reextraídas: {resumen['reextraidas']} | con error: {resumen['errores']} | "
+          f"editadas durante la reextracción: {resumen['conflictos']} | sin texto: {resumen['sin_texto']}")
+    if resumen['sin_texto_guardado']:
+        print(f"{resumen['sin_texto_guardado']} escrituras no tienen texto OCR guardado: para actualizarlas hay que volver a subir el PDF.")
+    print(f"Tiempo total: {time.perf_counter() - inicio:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+from datetime import datetime
+import re
+
+from .metrics import get_logger, log
+
+logger = get_logger("rules")
+
+# --- Extracción determinística de campos con formato fijo ---
+# Estos campos (CUIT/CUIL, DNI, folio, registro, número de escritura, partida y
+# matrícula) siguen patrones fijos y pueden obtenerse localmente en milisegundos,
+# sin pedírselos a GPT.
+
+_FLAGS = re.IGNORECASE
+_NUMERO = r"(?:(?:n[úu]mero|nro\.?|n\s?[°º.])\s*[°º]?\s*:?\s*|[°º]\s*)?"
+_CUIT = re.compile(r"(?<![\d.])(\d{2})\s?[-‐–]?\s?(\d{2}\.?\d{3}\.?\d{3})\s?[-‐–]?\s?(\d)(?!\d|\.\d)")
+_DNI = re.compile(r"\bD\.?\s?N\.?\s?I\.?\s*:?\s*" + _NUMERO + r"(\d{1,2}\.?\d{3}\.?\d{3})\b", _FLAGS)
+_FOLIO = re.compile(r"\bfolios?\s+" + _NUMERO + r"(\d{1,5})\b", _FLAGS)
+_REGISTRO = re.compile(r"\bregistro\s+(?:notarial\s+)?" + _NUMERO + r"(\d{1,5})\b", _FLAGS)
+_PARTIDA = re.compile(r"\bpartida\s+(?:inmobiliaria\s+)?" + _NUMERO + r"([\d][\d\-/.]*\d|\d)", _FLAGS)
+_MATRICULA = re.compile(r"\bmatr[ií]cula\s+" + _NUMERO + r"([\d][\d\-/.]*\d|\d)", _FLAGS)
+# Número de escritura: con una marca explícita ("Escritura número…", "ESCRITURA N° 12") o
+# en un encabezado en mayúsculas al comienzo de un renglón ("ESCRITURA CIENTO DOCE").
+# Sin marca, "Escritura pública un poco…" en el texto no es un número.
+_ESCRITURA = re.compile(
+    r"\bESCRITURA\s+(?:P[ÚU]BLICA\s+)?(?:n[úu]mero|nro\.?|n\s?[°º.])\s*[°º]?\s*:?\s*([A-ZÁÉÍÓÚÑa-záéíóúñ ]+|\d+)",
+    _FLAGS,
+)
+_ESCRITURA_ENCABEZADO = re.compile(r"^[ \t]*ESCRITURA\s+(?:P[ÚU]BLICA\s+)?([A-ZÁÉÍÓÚÑ ]+\b|\d+)", re.MULTILINE)
+_CIERRE = re.compile(r"\b(?:Ante\s+m[ií]|CONCUERDA)\b", _FLAGS)
+
+_PESOS_CUIT = (5, 4, 3, 2, 7, 6, 5, 4, 3, 2)
+_PREFIJOS_CUIT = {"20", "23", "24", "25", "26", "27", "30", "33", "34"}
+
+_UNIDADES = {
+    "cero": 0, "un": 1, "uno": 1, "una": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5,
+    "seis": 6, "siete": 7, "ocho": 8, "nueve": 9, "diez": 10, "once": 11, "doce": 12,
+    "trece": 13, "catorce": 14, "quince": 15, "dieciseis": 16, "diecisiete": 17,
+    "dieciocho": 18, "diecinueve": 19, "veinte": 20, "veintiun": 21, "veintiuno": 21,
+    "veintiuna": 21, "veintidos": 22, "veintitres": 23, "veinticuatro": 24,
+    "veinticinco": 25, "veintiseis": 26, "veintisiete": 27, "veintiocho": 28,
+    "veintinueve": 29, "treinta": 30, "cuarenta": 40, "cincuenta": 50, "sesenta": 60,
+    "setenta": 70, "ochenta": 80, "noventa": 90, "cien": 100, "ciento": 100,
+    "doscientos": 200, "doscientas": 200, "trescientos": 300, "trescientas": 300,
+    "cuatrocientos": 400, "cuatrocientas": 400, "quinientos": 500, "quinientas": 500,
+    "seiscientos": 600, "seiscientas": 600, "setecientos": 700, "setecientas": 700,
+    "ochocientos": 800, "ochocientas": 800, "novecientos": 900, "novecientas": 900,
+}
+
+
+def _digits(value):
+    return re.sub(r"\D", "", value or "")
+
+
+def cuit_is_valid(cuit):
+    """
+    Verifica el dígito verificador de un CUIT/CUIL (módulo 11).
+    """
+    digits = _digits(cuit)
+    if len(digits) != 11 or digits[:2] not in _PREFIJOS_CUIT:
+        return False
+    resto = sum(int(d) * p for d, p in zip(digits, _PESOS_CUIT)) % 11
+    verificador = 0 if resto == 0 else 11 - resto
+    return verificador != 10 and verificador == int(digits[10])
+
+
+def format_cuit(cuit):
+    digits = _digits(cuit)
+    return f"{digits[:2]}-{digits[2:10]}-{digits[10]}"
+
+
+def spanish_words_to_int(words):
+    """
+    Convierte un número escrito en palabras en español a entero
+    (ej. 'cuatrocientos treinta y cinco' -> 435). Devuelve None si alguna
+    palabra no es parte de un número.
+    """
+    normalizado = words.lower()
+    for acentuada, simple in zip("áéíóú", "aeiou"):
+        normalizado = normalizado.replace(acentuada, simple)
+    total, actual, encontrado = 0, 0, False
+    for palabra in normalizado.split():
+        if palabra == "y":
+            continue
+        if palabra in _UNIDADES:
+            actual += _UNIDADES[palabra]
+        elif palabra == "mil":
+            total += (actual or 1) * 1000
+            actual = 0
+        else:
+            return None
+        encontrado = True
+    return total + actual if encontrado else None
+
+
+def _number_words_prefix(words):
+    """
+    Toma las palabras iniciales que forman un número ('CIENTO DOCE. En la
+    ciudad…' -> 'CIENTO DOCE').
+    """
+    tomadas = []
+    for palabra in words.split():
+        if spanish_words_to_int(palabra) is None and palabra.lower() not in ("y", "mil"):
+            break
+        tomadas.append(palabra)
+    while tomadas and tomadas[-1].lower() == "y":
+        tomadas.pop()
+    return " ".join(tomadas)
+
+
+def _single(values):
+    """
+    Devuelve el único valor distinto de la lista, o None si hay cero o varios
+    (en ese caso la regla no es confiable y se deja el campo al LLM).
+    """
+    distintos = set(values)
+    return distintos.pop() if len(distintos) == 1 else None
+
+
+def _closing_offset(text):
+    """
+    Posición donde empieza el bloque de cierre (la última cuarta parte del
+    texto si no se encuentra "Ante mí" ni "CONCUERDA").
+    """
+    marcas = list(_CIERRE.finditer(text))
+    inicio = marcas[0].start() if marcas else len(text) * 3 // 4
+    # Folio y registro suelen mencionarse en los párrafos previos al "Ante mí".
+    return max(0, min(inicio, len(text) * 3 // 4) - 1500)
+
+
+def extract_rule_fields(text):
+    """
+    Extrae los campos de formato fijo del texto de la escritura.
+
+    Returns:
+        dict: 'campos' con los valores de EscrituraPublicaData obtenidos con
+        confianza ('numero_escritura', 'folio_escritura', 'registro_escribano');
+        'propiedad' con 'Partida' y 'matricula' si son únicos; 'cuits' con los
+        CUIT/CUIL válidos encontrados (formato XX-XXXXXXXX-X) y 'dnis' con los
+        números de DNI (solo dígitos).
+    """
+    text = text or ""
+    campos = {}
+
+    match = _ESCRITURA.search(text[:3000]) or _ESCRITURA_ENCABEZADO.search(text[:3000])
+    if match:
+        valor = match.group(1).strip()
+        if valor.isdigit():
+            campos["numero_escritura"] = str(int(valor))
+        else:
+            numero = spanish_words_to_int(_number_words_prefix(valor))
+            if numero:
+                campos["numero_escritura"] = str(numero)
+
+    cierre = text[_closing_offset(text):]
+    folio = _single(m.group(1) for m in _FOLIO.finditer(cierre))
+    if folio:
+        campos["folio_escritura"] = folio
+    registro = _single(m.group(1) for m in _REGISTRO.finditer(cierre))
+    if registro:
+        campos["registro_escribano"] = registro
+
+    propiedad = {}
+    partida = _single(m.group(1).rstrip(".") for m in _PARTIDA.finditer(text))
+    if partida:
+        propiedad["Partida"] = partida
+    matricula = _single(m.group(1).rstrip(".") for m in _MATRICULA.finditer(text))
+    if matricula:
+        propiedad["matricula"] = matricula
+
+    cuits = []
+    for match in _CUIT.finditer(text):
+        candidato = "".join(match.groups())
+        if cuit_is_valid(candidato) and format_cuit(candidato) not in cuits:
+            cuits.append(format_cuit(candidato))
+    dnis = []
+    for match in _DNI.finditer(text):
+        dni = _digits(match.group(1))
+        if dni not in dnis:
+            dnis.append(dni)
+
+    return {"campos": campos, "propiedad": propiedad, "cuits": cuits, "dnis": dnis}
+
+
+def _same(a, b):
+    return _digits(a) == _digits(b) if _digits(a) and _digits(b) else str(a).strip() == str(b).strip()
+
+
+def apply_rule_fields(data, reglas):
+    """
+    Completa y valida con las reglas los datos devueltos por el LLM (un dict
+    de EscrituraPublicaData) y registra la concordancia entre ambos:
+
+    - Los campos de 'campos' se toman de las reglas.
+    - 'Partida' y 'matricula' se completan si el LLM los dejó vacíos.
+    - Un CUIT/CUIL del LLM con dígito verificador inválido se reemplaza por el
+      CUIT válido del texto que contiene el DNI de esa parte.
+
+    Returns:
+        dict: Los datos corregidos.
+    """
+    coincidencias, diferencias = 0, 0
+
+    def comparar(campo, valor_llm, valor_regla):
+        nonlocal coincidencias, diferencias
+        if not valor_llm or not valor_regla:
+            return
+        if _same(valor_llm, valor_regla):
+            coincidencias += 1
+        else:
+            diferencias += 1
+            log(logger, f"Reglas y LLM difieren en {campo}: reglas='{valor_regla}', LLM='{valor_llm}'.")
+
+    for campo, valor in reglas["campos"].items():
+        comparar(campo, data.get(campo), valor)
+        data[campo] = valor
+
+    propiedad = data.get("descripcion_propiedad")
+    if isinstance(propiedad, dict):
+        for campo, valor in reglas["propiedad"].items():
+            comparar(f"descripcion_propiedad.{campo}", propiedad.get(campo), valor)
+            if not propiedad.get(campo):
+                propiedad[campo] = valor
+
+    cuits_por_dni = {cuit[3:11].lstrip("0"): cuit for cuit in reglas["cuits"]}
+    for i, parte in enumerate(data.get("partes_intervinientes") or []):
+        cuit_llm = parte.get("numero_CUIL")
+        dni = _digits(parte.get("numero_documento")).lstrip("0")
+        cuit_regla = cuits_por_dni.get(dni)
+        if cuit_llm and cuit_is_valid(cuit_llm):
+            comparar(f"partes_intervinientes.{i}.numero_CUIL", cuit_llm, cuit_regla)
+        elif cuit_regla:
+            if cuit_llm:
+                diferencias += 1
+                log(logger, f"CUIT/CUIL inválido del LLM en la parte {i+1} ('{cuit_llm}'), se usa '{cuit_regla}'.")
+            parte["numero_CUIL"] = cuit_regla
+        if dni and reglas["dnis"]:
+            if dni in (d.lstrip("0") for d in reglas["dnis"]):
+                coincidencias += 1
+            else:
+                diferencias += 1
+                log(logger, f"El DNI de la parte {i+1} ('{parte.get('numero_documento')}') no aparece en el texto.")
+
+    total = coincidencias + diferencias
+    if total:
+        log(logger, f"Concordancia reglas/LLM: {coincidencias} de {total} campos ({100 * coincidencias / total:.0f}%).",
+            evento="concordancia_reglas", coincidencias=coincidencias, total=total)
+    return data
+
+
+_MESES = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6, "julio": 7,
+    "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12,
+}
+# "1° de enero", "1ro. de enero", "primero de enero": el día uno se escribe como ordinal.
+_DIA_ORDINAL = re.compile(r"\b(\d{1,2})\s*(?:[°º]|ro\b\.?)", _FLAGS)
+_PRIMERO = re.compile(r"\bprimer[oa]?\b", _FLAGS)
+_FECHA_NUMERICA = re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{2,4})\b")
+_FECHA_TEXTO = re.compile(
+    r"\b(?:a\s+los\s+)?([\wáéíóú ]+?)\s+(?:d[ií]as?\s+)?del?\s+(?:mes\s+de\s+)?(" + "|".join(_MESES) + r")\s+(?:del?\s+)?(?:a[ñn]o\s+)?([\wáéíóú ]+)",
+    _FLAGS,
+)
+
+
+def parse_spanish_date(value):
+    """
+    Interpreta una fecha de escritura en los formatos habituales
+    ('15-03-2023', '15/03/2023', '15 de marzo de 2023', 'a los quince días
+    del mes de marzo del año dos mil veintitrés', '1° de enero de 2023',
+    'primero de enero de dos mil veintitrés').
+
+    Returns:
+        datetime | None: La fecha, o None si no se pudo interpretar.
+    """
+    if not value:
+        return None
+    value = _PRIMERO.sub("1", _DIA_ORDINAL.sub(r"\1", value))
+    match = _FECHA_NUMERICA.search(value)
+    if match:
+        dia, mes, anio = (int(g) for g in match.groups())
+        anio += 2000 if anio < 100 else 0
+    else:
+        match = _FECHA_TEXTO.search(value)
+        if not match:
+            return None
+        dia = _as_int(match.group(1))
+        mes = _MESES[match.group(2).lower()]
+        anio = _as_int(match.group(3))
+        if dia is None or anio is None:
+            return None
+    try:
+        return datetime(anio, mes, dia)
+    except ValueError:
+        return None
+
+
+def _as_int(words):
+    """
+    Convierte a entero el número (en cifras o en palabras) al final o al
+    principio de la frase ('quince', 'los 15', 'dos mil veintitrés').
+    """
+    digitos = re.findall(r"\d+", words)
+    if digitos:
+        return int(digitos[0])
+    palabras = words.split()
+    # Probamos desde el principio de la frase, descartando palabras no numéricas.
+    for inicio in range(len(palabras)):
+        numero = spanish_words_to_int(_number_words_prefix(" ".join(palabras[inicio:])))
+        if numero is not None:
+            return numero
+    return None
+
+
+def normalize_identifier(value):
+    """
+    Deja solo los dígitos de un identificador (CUIT, DNI, partida, matrícula,
+    registro) para que las búsquedas no dependan de puntos y guiones.
+    """
+    return _digits(value)
+
+
+def normalize_name(value):
+    """
+    Pasa un nombre a minúsculas, sin acentos y con espacios simples.
+    """
+    normalizado = (value or "").lower()
+    for acentuada, simple in zip("áéíóúü", "aeiouu"):
+        normalizado = normalizado.replace(acentuada, simple)
+    return " ".join(normalizado.split())
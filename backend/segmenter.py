@@ -0,0 +1,210 @@
+import bisect
+import os
+import re
+
+from .metrics import get_logger, log
+
+logger = get_logger("segmenter")
+
+# --- Configuración del segmentador ---
+# Solo se recorta el texto de escrituras largas; las cortas se envían completas.
+SEGMENTER_MIN_CHARS = int(os.getenv("SEGMENTER_MIN_CHARS", "12000"))
+# Caracteres que se toman alrededor de cada marca encontrada.
+SEGMENT_CONTEXT_CHARS = int(os.getenv("SEGMENT_CONTEXT_CHARS", "800"))
+
+# Campos de EscrituraPublicaData que se obtienen de cada sección.
+SECTION_FIELDS = {
+    "encabezado": ["fecha_otorgamiento", "lugar_escritura", "numero_escritura"],
+    "comparecencia": ["partes_intervinientes"],
+    "inmueble": ["descripcion_propiedad"],
+    "precio": ["valor_transaccion"],
+    "cierre": ["folio_escritura", "escribano", "registro_escribano"],
+}
+
+_FLAGS = re.IGNORECASE | re.MULTILINE
+_COMPARECENCIA_INICIO = re.compile(r"\bCOMPARECE(?:N)?\b", _FLAGS)
+_COMPARECENCIA_FIN = re.compile(r"\b(?:INTERVIENE(?:N)?|Y\s+DICE(?:N)?|EXPONE(?:N)?|MANIFIESTA(?:N)?|Y\s+EXPRESA(?:N)?)\b", _FLAGS)
+_INMUEBLE = re.compile(r"\b(?:inmueble|unidad\s+funcional|ubicad[oa]\s+en|sit[oa]\s+en)\b", _FLAGS)
+_DATOS_CATASTRALES = re.compile(r"\b(?:nomenclatura\s+catastral|circunscripci[oó]n|partida|matr[ií]cula|superficie)\b", _FLAGS)
+_PRECIO = re.compile(r"\b(?:precio|suma\s+de|d[oó]lares|pesos)\b", _FLAGS)
+_ANTE_MI = re.compile(r"\bAnte\s+m[ií]\b", _FLAGS)
+_CONCUERDA = re.compile(r"\bCONCUERDA\b", _FLAGS)
+_FOLIO_REGISTRO = re.compile(r"\b(?:folio|registro)\b", _FLAGS)
+
+
+def _window(text, start, end, context=None):
+    context = SEGMENT_CONTEXT_CHARS if context is None else context
+    return max(0, start - context), min(len(text), end + context)
+
+
+def find_sections(text):
+    """
+    Ubica en el texto de la escritura las secciones de donde salen los campos
+    a extraer: el encabezado (número, fecha y lugar), la comparecencia (las
+    partes), la descripción del inmueble, el precio y el bloque de cierre
+    ("Ante mí" … "CONCUERDA") con el escribano, el folio y el registro.
+
+    Returns:
+        dict: Para cada sección, una lista de tramos (inicio, fin) del texto.
+        Una sección que no se encontró tiene la lista vacía.
+    """
+    sections = {name: [] for name in SECTION_FIELDS}
+    # El encabezado son siempre los primeros párrafos.
+    sections["encabezado"].append((0, min(len(text), 2 * SEGMENT_CONTEXT_CHARS)))
+
+    match = _COMPARECENCIA_INICIO.search(text)
+    if match:
+        fin = _COMPARECENCIA_FIN.search(text, match.end())
+        end = fin.start() if fin and fin.start() - match.start() < 10 * SEGMENT_CONTEXT_CHARS else match.end() + 6 * SEGMENT_CONTEXT_CHARS
+        sections["comparecencia"].append(_window(text, match.start(), end, context=SEGMENT_CONTEXT_CHARS // 2))
+
+    match = _INMUEBLE.search(text, sections["comparecencia"][0][1] if sections["comparecencia"] else 0)
+    if match:
+        sections["inmueble"].append(_window(text, match.start(), match.end() + 4 * SEGMENT_CONTEXT_CHARS, context=SEGMENT_CONTEXT_CHARS // 2))
+    for match in _DATOS_CATASTRALES.finditer(text):
+        sections["inmueble"].append(_window(text, match.start(), match.end()))
+
+    match = _PRECIO.search(text)
+    if match:
+        sections["precio"].append(_window(text, match.start(), match.end()))
+
+    # El cierre es la última aparición de "CONCUERDA" (o, si no está, de "Ante mí"),
+    # junto con los datos de folio y registro que la preceden.
+    concuerda = list(_CONCUERDA.finditer(text))
+    ante_mi = list(_ANTE_MI.finditer(text))
+    marca = concuerda[-1] if concuerda else (ante_mi[-1] if ante_mi else None)
+    if marca:
+        start = ante_mi[-1].start() if ante_mi and ante_mi[-1].start() < marca.start() else marca.start()
+        sections["cierre"].append(_window(text, start, marca.end(), context=2 * SEGMENT_CONTEXT_CHARS))
+        for match in _FOLIO_REGISTRO.finditer(text, max(0, start - 4 * SEGMENT_CONTEXT_CHARS)):
+            sections["cierre"].append(_window(text, match.start(), match.end(), context=SEGMENT_CONTEXT_CHARS // 2))
+    return sections
+
+
+def _merge_spans(spans):
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def reduce_text(text):
+    """
+    Arma un texto reducido con las secciones encontradas, en su orden original.
+    Si a una sección no se la encuentra, sus campos no pueden resolverse con el
+    texto reducido y se envía el texto completo (fallback).
+
+    Returns:
+        tuple: (texto a enviar al modelo, lista de campos que salieron del texto
+        reducido; vacía si se envía el texto completo).
+    """
+    if not text or len(text) < SEGMENTER_MIN_CHARS:
+        return text, []
+
+    sections = find_sections(text)
+    faltantes = [name for name, spans in sections.items() if not spans]
+    if faltantes:
+        log(logger, f"No se encontraron las secciones {', '.join(faltantes)}; se envía el texto completo.", secciones_faltantes=faltantes)
+        return text, []
+
+    spans = _merge_spans([span for spans in sections.values() for span in spans])
+    reduced = "\n[...]\n".join(text[start:end] for start, end in spans)
+    if len(reduced) >= len(text):
+        return text, []
+    campos = [field for fields in SECTION_FIELDS.values() for field in fields]
+    return reduced, campos
+
+
+# --- Separación de escrituras en un mismo PDF (protocolos) ---
+# Largo mínimo de una escritura: un encabezado más cerca que esto del anterior no abre otra.
+SPLIT_MIN_CHARS = int(os.getenv("SPLIT_MIN_CHARS", "1000"))
+
+# Encabezado de una escritura: "ESCRITURA NÚMERO ..." (o N°, NRO.) en mayúsculas al
+# comienzo de un renglón; las menciones dentro del texto suelen ir en minúsculas.
+_ENCABEZADO = re.compile(
+    r"^[ \t]*(?:(?:PRIMER|SEGUNDO|TERCER)\s+TESTIMONIO\W+)?ESCRITURA\s+(?:P[UÚ]BLICA\s+)?(?:N[UÚ]MERO|N\s*[°º]|NRO\.?|NO\.)",
+    re.MULTILINE,
+)
+# Cierre de una escritura: "CONCUERDA" o "Ante mí:" (no el "ante mí" de la comparecencia).
+_CIERRE = re.compile(r"(?i:\bCONCUERDA\b)|\bAnte\s+m[ií]\s*[:.]|\bANTE\s+M[IÍ]\b")
+_FIN_PARRAFO = re.compile(r"\n[ \t]*\n")
+
+
+def _fallback_boundaries(text):
+    """
+    Sin encabezados reconocibles, corta después de cada cierre, al final de
+    su párrafo, si lo que sigue alcanza para otra escritura.
+    """
+    cortes = []
+    for match in _CIERRE.finditer(text):
+        fin = _FIN_PARRAFO.search(text, match.end())
+        corte = fin.end() if fin else len(text)
+        if corte - (cortes[-1] if cortes else 0) >= SPLIT_MIN_CHARS and len(text) - corte >= SPLIT_MIN_CHARS:
+            cortes.append(corte)
+    return cortes
+
+
+def split_escrituras(paginas):
+    """
+    Separa el texto de un PDF con varias escrituras (por ejemplo, el escaneo de
+    un protocolo) en una escritura por tramo.
+
+    Cada escritura empieza en un encabezado "ESCRITURA NÚMERO ..." y un
+    encabezado solo abre una escritura nueva si la anterior ya tuvo su cierre
+    ("CONCUERDA" o "Ante mí:"); así una mención a otra escritura en el texto no
+    la corta. Lo que precede al primer encabezado (una carátula) queda en la
+    primera escritura. Si no hay encabezados, se corta después de cada cierre.
+
+    Args:
+        paginas (list): El texto de cada página, en orden.
+
+    Returns:
+        list: Un dict por escritura con 'texto' y 'paginas' (primera y última
+        página, contando desde 1). Un solo elemento si no se encontraron
+        varias escrituras.
+    """
+    inicios_pagina, partes, posicion = [], [], 0
+    for texto_pagina in paginas:
+        inicios_pagina.append(posicion)
+        partes.append(texto_pagina or "")
+        posicion += len(texto_pagina or "") + 1
+    text = "\n".join(partes)
+
+    cierres = [match.start() for match in _CIERRE.finditer(text)]
+    cortes, abierta = [], None
+    for match in _ENCABEZADO.finditer(text):
+        inicio = match.start()
+        if abierta is None:
+            # El primer encabezado no corta: la carátula queda con la primera escritura.
+            abierta = inicio
+            continue
+        anterior = cortes[-1] if cortes else 0
+        if inicio - anterior < SPLIT_MIN_CHARS:
+            continue
+        if any(abierta <= cierre < inicio for cierre in cierres):
+            cortes.append(inicio)
+            abierta = inicio
+    if abierta is None:
+        cortes = _fallback_boundaries(text)
+
+    def pagina_de(offset):
+        return bisect.bisect_right(inicios_pagina, offset)
+
+    escrituras = []
+    for inicio, fin in zip([0] + cortes, cortes + [len(text)]):
+        tramo = text[inicio:fin]
+        # Las páginas salen del texto sin los saltos de línea de los bordes: un
+        # corte que cae justo en el cambio de página no suma la página vecina.
+        primero = inicio + len(tramo) - len(tramo.lstrip())
+        ultimo = max(primero, inicio + len(tramo.rstrip()) - 1)
+        escrituras.append({
+            "texto": tramo.strip(),
+            "paginas": (pagina_de(primero), pagina_de(ultimo)),
+        })
+    if len(escrituras) > 1:
+        log(logger, f"Se separaron {len(escrituras)} escrituras.", escrituras=len(escrituras),
+            paginas=[escritura["paginas"] for escritura in escrituras])
+    return escrituras
@@ -0,0 +1,279 @@
+"""
+Detección de escrituras casi duplicadas (otro escaneo del mismo documento,
+un testimonio cargado con otro número de carpeta) a partir del texto OCR.
+
+Cada texto se resume en una firma MinHash de sus shingles (secuencias de
+DUPLICATE_SHINGLE_SIZE caracteres del texto normalizado): la proporción de
+posiciones iguales entre dos firmas estima la similitud de Jaccard de los
+textos. Las firmas se guardan en MongoDB junto al texto OCR (colección
+textos_ocr) y se indexan en memoria con LSH (bandas de la firma en tablas
+hash), así una consulta solo compara contra los candidatos que comparten
+alguna banda y tarda milisegundos aunque haya miles de escrituras.
+"""
+from datetime import datetime, timedelta
+import logging
+import os
+import re
+import threading
+import unicodedata
+import zlib
+
+import numpy as np
+from pymongo.errors import PyMongoError
+
+from .database import get_client, get_db_collection, MONGODB_DB_NAME, OCR_TEXT_COLLECTION
+from .rules import extract_rule_fields, normalize_identifier, parse_spanish_date
+from .metrics import get_logger, log, span
+
+logger = get_logger("similarity")
+
+# Similitud (Jaccard estimada) desde la que dos textos se consideran la misma escritura (0 = no buscar).
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.7"))
+DUPLICATE_SHINGLE_SIZE = int(os.getenv("DUPLICATE_SHINGLE_SIZE", "5"))
+# Largo de la firma y cantidad de bandas del LSH (filas por banda = largo / bandas).
+# Con 128 y 16 bandas de 8 filas, un par con similitud 0.8 es candidato el 95% de las veces.
+DUPLICATE_NUM_PERM = int(os.getenv("DUPLICATE_NUM_PERM", "128"))
+DUPLICATE_BANDS = int(os.getenv("DUPLICATE_BANDS", "16"))
+
+# Coeficientes fijos de las funciones de hash (multiplicar y desplazar): las
+# firmas guardadas solo son comparables si se calculan siempre con los mismos.
+_rng = np.random.default_rng(20240611)
+_A = _rng.integers(1, 2**63, size=DUPLICATE_NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2**63, size=DUPLICATE_NUM_PERM, dtype=np.uint64)
+_FNV_PRIME = np.uint64(1099511628211)
+
+
+def normalize_text(texto):
+    """
+    Minúsculas, sin acentos y solo letras y dígitos separados por un espacio,
+    para que los saltos de línea, la puntuación y los acentos que el OCR lee
+    distinto no cambien los shingles.
+    """
+    texto = unicodedata.normalize("NFKD", (texto or "").lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(re.findall(r"[a-z0-9]+", texto))
+
+
+def _shingles(texto):
+    """
+    Hash de 64 bits de cada secuencia de DUPLICATE_SHINGLE_SIZE caracteres, sin repetidos.
+    """
+    datos = np.frombuffer(normalize_text(texto).encode("ascii"), dtype=np.uint8).astype(np.uint64)
+    k = DUPLICATE_SHINGLE_SIZE
+    if len(datos) < k:
+        return np.empty(0, dtype=np.uint64)
+    hashes = np.zeros(len(datos) - k + 1, dtype=np.uint64)
+    for j in range(k):
+        hashes = (hashes * _FNV_PRIME) ^ datos[j:len(datos) - k + 1 + j]
+    return np.unique(hashes)
+
+
+def minhash_signature(texto):
+    """
+    Firma MinHash del texto: para cada una de las DUPLICATE_NUM_PERM funciones
+    de hash, el mínimo sobre todos los shingles.
+
+    Returns:
+        numpy.ndarray: DUPLICATE_NUM_PERM enteros uint32 (vacía si no hay texto).
+    """
+    shingles = _shingles(texto)
+    if not len(shingles):
+        return np.empty(0, dtype=np.uint32)
+    firma = np.full(DUPLICATE_NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint32)
+    # Por tramos, para no armar una matriz enorme con textos muy largos.
+    for inicio in range(0, len(shingles), 4096):
+        tramo = shingles[inicio:inicio + 4096]
+        with np.errstate(over="ignore"):
+            valores = ((_A[:, None] * tramo[None, :] + _B[:, None]) >> np.uint64(32)).astype(np.uint32)
+        np.minimum(firma, valores.min(axis=1), out=firma)
+    return firma
+
+
+def estimate_similarity(firma_a, firma_b):
+    """
+    Similitud de Jaccard estimada: proporción de posiciones iguales.
+    """
+    if len(firma_a) != len(firma_b) or not len(firma_a):
+        return 0.0
+    return float(np.mean(firma_a == firma_b))
+
+
+class LSHIndex:
+    """
+    Índice LSH en memoria: cada firma se parte en bandas y cada banda se
+    guarda en su tabla hash. Dos firmas son candidatas si coinciden en al
+    menos una banda completa.
+    """
+
+    def __init__(self, bandas=DUPLICATE_BANDS):
+        self.bandas = bandas
+        self.filas = DUPLICATE_NUM_PERM // bandas
+        self.tablas = [{} for _ in range(bandas)]
+        self.firmas = {}
+
+    def _claves_bandas(self, firma):
+        return [firma[i * self.filas:(i + 1) * self.filas].tobytes() for i in range(self.bandas)]
+
+    def add(self, clave, firma):
+        if clave in self.firmas or len(firma) != DUPLICATE_NUM_PERM:
+            return
+        self.firmas[clave] = firma
+        for tabla, banda in zip(self.tablas, self._claves_bandas(firma)):
+            tabla.setdefault(banda, []).append(clave)
+
+    def query(self, firma, umbral):
+        """
+        Devuelve [(clave, similitud)] de las firmas con similitud >= umbral, de mayor a menor.
+        """
+        if len(firma) != DUPLICATE_NUM_PERM:
+            return []
+        candidatos = set()
+        for tabla, banda in zip(self.tablas, self._claves_bandas(firma)):
+            candidatos.update(tabla.get(banda, ()))
+        similares = [(clave, estimate_similarity(firma, self.firmas[clave])) for clave in candidatos]
+        return sorted((par for par in similares if par[1] >= umbral), key=lambda par: par[1], reverse=True)
+
+    def __len__(self):
+        return len(self.firmas)
+
+
+# Índice del proceso: se carga de MongoDB la primera vez y luego solo se
+# le agregan las firmas guardadas desde la última consulta (por este u otros procesos).
+_index = None
+# La fecha de cada firma la pone el proceso que la guarda, antes de escribirla,
+# con su propio reloj: otro worker puede terminar de guardar una firma con fecha
+# anterior a la última carga. Cada carga vuelve a leer este margen hacia atrás
+# (las firmas ya cargadas se ignoran).
+_SOLAPAMIENTO_CARGA = timedelta(minutes=10)
+_cargado_hasta = None
+_index_lock = threading.Lock()
+
+
+def _ocr_texts():
+    return get_client()[MONGODB_DB_NAME][OCR_TEXT_COLLECTION]
+
+
+def _backfill_signatures(collection):
+    """
+    Calcula la firma de los textos guardados antes de que existiera.
+    """
+    for documento in collection.find({'minhash': {'$exists': False}}, {'texto': 1}):
+        texto = zlib.decompress(documento['texto']).decode('utf-8')
+        collection.update_one({'_id': documento['_id']}, {'$set': {'minhash': minhash_signature(texto).tobytes()}})
+
+
+def get_index():
+    """
+    Devuelve el índice LSH del proceso, actualizado con las firmas nuevas de MongoDB.
+    """
+    global _index, _cargado_hasta
+    collection = _ocr_texts()
+    with _index_lock:
+        query = {'minhash': {'$exists': True}}
+        if _index is None:
+            collection.create_index('fecha_creacion', name='fecha_creacion')
+            _backfill_signatures(collection)
+            _index = LSHIndex()
+        elif _cargado_hasta is not None:
+            query['fecha_creacion'] = {'$gte': _cargado_hasta - _SOLAPAMIENTO_CARGA}
+        ahora = datetime.now()
+        for documento in collection.find(query, {'minhash': 1}):
+            _index.add(documento['_id'], np.frombuffer(documento['minhash'], dtype=np.uint32))
+        _cargado_hasta = ahora
+        return _index
+
+
+def find_similar_texts(texto, umbral=None, excluir=None):
+    """
+    Busca textos OCR guardados casi iguales a `texto`.
+
+    Args:
+        excluir (str, optional): SHA-256 del PDF a ignorar (el propio texto).
+
+    Returns:
+        list: [(sha256 del PDF, similitud)] de mayor a menor similitud.
+    """
+    umbral = DUPLICATE_THRESHOLD if umbral is None else umbral
+    firma = minhash_signature(texto)
+    return [(clave, similitud) for clave, similitud in get_index().query(firma, umbral) if clave != excluir]
+
+
+_COMPARECENCIA = re.compile(r"\bCOMPARECE(?:N)?\b", re.IGNORECASE)
+
+
+def text_identity(texto):
+    """
+    Datos que identifican una escritura y se obtienen del texto sin el LLM
+    (ver rules.py): número de escritura, registro y fecha de otorgamiento
+    (la primera fecha del encabezado, antes de la comparecencia).
+    """
+    campos = extract_rule_fields(texto)["campos"]
+    encabezado = (texto or "")[:2000]
+    match = _COMPARECENCIA.search(encabezado)
+    fecha = parse_spanish_date(encabezado[:match.start()] if match else encabezado)
+    return {
+        'numero_escritura': normalize_identifier(campos.get('numero_escritura')),
+        'registro_escribano': normalize_identifier(campos.get('registro_escribano')),
+        'fecha_otorgamiento_iso': fecha,
+    }
+
+
+def same_identity(identidad, documento):
+    """
+    False si el texto y la escritura guardada difieren en algún dato que
+    identifica a la escritura y ambos tienen (escrituras distintas de un
+    mismo escribano siguen un modelo y sus textos se parecen mucho).
+    """
+    guardada = {
+        'numero_escritura': normalize_identifier(documento.get('numero_escritura')),
+        'registro_escribano': normalize_identifier(documento.get('registro_escribano')),
+        'fecha_otorgamiento_iso': documento.get('fecha_otorgamiento_iso'),
+    }
+    return all(not identidad[campo] or not guardada[campo] or identidad[campo] == guardada[campo] for campo in guardada)
+
+
+def find_duplicate_escrituras(texto, excluir_carpeta=None, umbral=None):
+    """
+    Busca escrituras ya guardadas cuyo texto es casi igual a `texto` (incluye
+    las que tienen exactamente el mismo PDF con otro número de carpeta) y
+    cuyo número, registro y fecha no contradicen los del texto.
+
+    Returns:
+        list: Un dict por escritura con 'numero_carpeta', 'similitud' y
+        'pdf_sha256', de mayor a menor similitud. Vacía si la búsqueda está
+        deshabilitada (DUPLICATE_THRESHOLD=0) o si falla la consulta a la base
+        de datos (el error queda registrado y el análisis sigue sin la búsqueda).
+    """
+    umbral = DUPLICATE_THRESHOLD if umbral is None else umbral
+    if umbral <= 0:
+        return []
+    collection = get_db_collection()
+    if collection is None:
+        log(logger, "Sin conexión a la base de datos: no se buscan escrituras duplicadas.", logging.ERROR)
+        return []
+    try:
+        with span("duplicados.busqueda") as datos:
+            similares = dict(find_similar_texts(texto, umbral))
+            datos["candidatos"] = len(similares)
+            if not similares:
+                return []
+            documentos = collection.find(
+                {'extraccion.pdf_sha256': {'$in': list(similares)}},
+                {'_id': 0, 'numero_carpeta': 1, 'extraccion.pdf_sha256': 1,
+                 'numero_escritura': 1, 'registro_escribano': 1, 'fecha_otorgamiento_iso': 1},
+            )
+            identidad = text_identity(texto)
+            duplicados = [
+                {
+                    'numero_carpeta': documento['numero_carpeta'],
+                    'similitud': round(similares[documento['extraccion']['pdf_sha256']], 3),
+                    'pdf_sha256': documento['extraccion']['pdf_sha256'],
+                }
+                for documento in documentos
+                if documento['numero_carpeta'] != excluir_carpeta and same_identity(identidad, documento)
+            ]
+            datos["duplicados"] = len(duplicados)
+    except PyMongoError as e:
+        log(logger, f"No se pudo buscar escrituras duplicadas: {e}", logging.ERROR)
+        return []
+    return sorted(duplicados, key=lambda duplicado: duplicado['similitud'], reverse=True)
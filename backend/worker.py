@@ -0,0 +1,29 @@
+"""
+Worker de trabajos de análisis en segundo plano.
+
+Uso:
+    python -m backend.worker
+    python -m backend.worker --once   # procesa lo pendiente y termina
+    python -m backend.worker --perfilar perfil.prof   # perfila el próximo análisis con cProfile
+"""
+import argparse
+
+from .jobs import run_worker
+from .metrics import start_metrics_server, request_profile
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Procesa los trabajos de análisis de escrituras encolados.")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="Segundos de espera cuando no hay trabajos.")
+    parser.add_argument("--once", action="store_true", help="Procesar los trabajos pendientes y terminar.")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Puerto del endpoint /metrics (por defecto METRICS_PORT; 0 = sin endpoint).")
+    parser.add_argument("--perfilar", metavar="ARCHIVO", help="Perfilar con cProfile el próximo análisis y guardar el perfil en ARCHIVO.")
+    args = parser.parse_args(argv)
+    start_metrics_server(args.metrics_port)
+    if args.perfilar:
+        request_profile(args.perfilar)
+    run_worker(poll_interval=args.poll_interval, once=args.once)
+
+
+if __name__ == "__main__":
+    main()
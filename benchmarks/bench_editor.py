@@ -0,0 +1,113 @@
+"""
+Mide el tiempo de renderizado del editor de escrituras (frontend.data_display)
+con una escritura sintética de muchas partes, sin navegador ni base de datos.
+
+Uso:
+    python -m benchmarks.bench_editor
+    python -m benchmarks.bench_editor --partes 50 --repeticiones 10
+"""
+import argparse
+import statistics
+import time
+
+from streamlit.testing.v1 import AppTest
+
+
+def synthetic_deed(partes):
+    """
+    Arma una escritura con `partes` partes intervinientes y datos de propiedad completos.
+    """
+    return {
+        "fecha_otorgamiento": "15 de marzo de 2021",
+        "numero_escritura": "123",
+        "escribano": "Juan Pérez",
+        "lugar_escritura": "Córdoba",
+        "folio_escritura": "456",
+        "registro_escribano": "12",
+        "partes_intervinientes": [
+            {
+                "rol": "Vendedor" if i % 2 else "Comprador",
+                "nombre": f"Nombre {i}",
+                "apellido": f"Apellido {i}",
+                "nacionalidad": "argentina",
+                "fecha_nacimiento": "1 de enero de 1970",
+                "tipo_documento": "DNI",
+                "numero_documento": str(20000000 + i),
+                "tipo_CUIL": "CUIL",
+                "numero_CUIL": f"20-{20000000 + i}-0",
+                "estado_civil": "casado",
+                "nombre_apellido_conyuge": f"Cónyuge {i}",
+                "domicilio": f"Calle {i} 100",
+                "representacion": None,
+            }
+            for i in range(partes)
+        ],
+        "descripcion_propiedad": {
+            "direccion": "Av. Siempre Viva 742",
+            "Partida": "1101-1234567/8",
+            "superficie": "300 m2",
+            "matricula": "123456",
+            "medidas": "10 x 30",
+            "nomenclatura_catastral": [{"circunscripcion": "1", "seccion": "2", "manzana": "3", "parcela": "4"}],
+        },
+        "valor_transaccion": "USD 100000",
+        "observaciones": "",
+    }
+
+
+def _editor_app():
+    # Se ejecuta dentro de AppTest: los imports tienen que estar acá.
+    import streamlit as st
+    from frontend.data_display import display_structured_data
+    display_structured_data(st.session_state.datos_bench, 1)
+
+
+def _editar_escribano(at, n):
+    at.text_input(key="escribano").set_value(f"Escribano {n}")
+    aplicar = [b for b in at.button if b.label == "Aplicar cambios"]
+    if aplicar:
+        aplicar[0].click()
+
+
+def _medir(at, repeticiones, accion):
+    tiempos = []
+    for _ in range(repeticiones):
+        accion(at)
+        inicio = time.perf_counter()
+        at.run()
+        tiempos.append(time.perf_counter() - inicio)
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+    return tiempos
+
+
+def _reporte(nombre, tiempos, widgets):
+    print(f"  {nombre:<28} mediana={statistics.median(tiempos) * 1000:7.1f} ms  "
+          f"máx={max(tiempos) * 1000:7.1f} ms  widgets={widgets}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de renderizado del editor de escrituras.")
+    parser.add_argument("--partes", type=int, default=50, help="Cantidad de partes de la escritura sintética.")
+    parser.add_argument("--repeticiones", type=int, default=10, help="Reruns medidos por escenario.")
+    args = parser.parse_args(argv)
+
+    print(f"Editor con {args.partes} partes ({args.repeticiones} reruns por escenario):")
+    for editando in (False, True):
+        at = AppTest.from_function(_editor_app, default_timeout=120)
+        at.session_state.datos_bench = synthetic_deed(args.partes)
+        at.session_state.editing = editando
+        at.run()
+        widgets = len(at.text_input) + len(at.text_area)
+        modo = "edición" if editando else "visualización"
+        _reporte(f"rerun ({modo})", _medir(at, args.repeticiones, lambda at: None), widgets)
+        if editando:
+            # Simula editar un campo y confirmarlo (con el formulario, al aplicar el bloque).
+            contador = iter(range(args.repeticiones))
+            _reporte("editar 'Escribano'", _medir(
+                at, args.repeticiones, lambda at: _editar_escribano(at, next(contador)),
+            ), widgets)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Reporte de tiempos de importación en frío, por módulo.
+
+Cada módulo se importa en un intérprete nuevo con `python -X importtime`,
+así no se beneficia de lo que ya cargaron los anteriores. Se informa el
+tiempo total de la importación, los módulos propios y de terceros que más
+pesan y cuáles de las bibliotecas pesadas (LangChain, OpenAI, OCR) quedaron
+cargadas. Lo que importa la aplicación de Streamlit al arrancar es lo que
+paga cada worker de Streamlit y la primera carga de la página.
+
+Uso:
+    python -m benchmarks.bench_imports
+    python -m benchmarks.bench_imports --modulos backend.process backend.worker --detalle 15
+    python -m benchmarks.bench_imports --maximo-ms 1500
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# Lo que importa app.py al arrancar (sin ejecutar la página).
+APP_MODULES = [
+    "frontend.sidebar",
+    "frontend.data_display",
+    "frontend.search_results",
+    "frontend.jobs_panel",
+    "backend.database",
+    "backend.jobs",
+]
+MODULOS = {
+    "app": APP_MODULES,
+    "backend.process": ["backend.process"],
+    "backend.extractor": ["backend.extractor"],
+    "backend.ocr": ["backend.ocr"],
+    "backend.worker": ["backend.worker"],
+    "backend.batch": ["backend.batch"],
+}
+# Bibliotecas que no deberían cargarse hasta que haga falta analizar un PDF.
+PESADAS = ["langchain", "langchain_core", "langchain_openai", "openai", "tiktoken", "pytesseract", "pdf2image"]
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_imports(modulos):
+    """
+    Importa `modulos` en un intérprete nuevo.
+
+    Returns:
+        dict: 'total_ms' (importación completa), 'paquetes' (ms acumulados por
+        paquete de primer nivel) y 'pesadas' (bibliotecas pesadas cargadas).
+    """
+    codigo = (
+        "import sys\n"
+        + "".join(f"import {modulo}\n" for modulo in modulos)
+        + f"print(','.join(m for m in {PESADAS!r} if m in sys.modules))\n"
+    )
+    entorno = dict(os.environ, LOG_LEVEL="WARNING")
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", codigo],
+        cwd=RAIZ, env=entorno, capture_output=True, text=True,
+    )
+    if proceso.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {', '.join(modulos)}:\n{proceso.stderr[-2000:]}")
+
+    # Formato de cada línea: "import time: propio | acumulado | [sangría]módulo"
+    paquetes, total = {}, 0
+    for linea in proceso.stderr.splitlines():
+        if not linea.startswith("import time:") or "self [us]" in linea:
+            continue
+        _, propio, acumulado, nombre = (parte.strip() for parte in linea.replace("import time:", "|", 1).split("|"))
+        paquete = nombre.split(".")[0]
+        paquetes[paquete] = paquetes.get(paquete, 0) + int(propio) / 1000
+        if nombre in modulos:
+            # Los módulos pedidos son de primer nivel en el árbol: su acumulado no se solapa.
+            total += int(acumulado) / 1000
+    pesadas = [m for m in proceso.stdout.strip().split(",") if m]
+    return {"total_ms": total, "paquetes": paquetes, "pesadas": pesadas}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mide el tiempo de importación en frío de la aplicación y del backend.")
+    parser.add_argument("--modulos", nargs="+", default=list(MODULOS), help="Módulos a medir ('app' = lo que importa app.py).")
+    parser.add_argument("--detalle", type=int, default=5, help="Cantidad de paquetes más pesados a listar por módulo.")
+    parser.add_argument("--maximo-ms", type=float, help="Termina con error si la importación de 'app' supera estos ms.")
+    args = parser.parse_args(argv)
+
+    resultados = {}
+    print(f"{'módulo':<20} {'total (ms)':>11}  bibliotecas pesadas cargadas")
+    for nombre in args.modulos:
+        medida = resultados[nombre] = measure_imports(MODULOS.get(nombre, [nombre]))
+        print(f"{nombre:<20} {medida['total_ms']:>11.0f}  {', '.join(medida['pesadas']) or '-'}")
+        mas_pesados = sorted(medida["paquetes"].items(), key=lambda item: item[1], reverse=True)[:args.detalle]
+        for paquete, ms in mas_pesados:
+            print(f"    {paquete:<24} {ms:>8.0f}")
+
+    if args.maximo_ms is not None and "app" in resultados and resultados["app"]["total_ms"] > args.maximo_ms:
+        print(f"\nLa importación de la aplicación tarda {resultados['app']['total_ms']:.0f} ms (máximo {args.maximo_ms:.0f} ms).")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Compara los perfiles de OCR (backend.ocr.OCR_PROFILES) en segundos por
+página y precisión de caracteres.
+
+Por defecto usa páginas sintéticas: texto notarial dibujado sobre papel
+rayado, con un sello y una leve inclinación, como un escaneo. También puede
+usar muestras reales: un directorio con imágenes o PDFs de una página
+(pagina1.png, pagina2.pdf, ...), cada una con su transcripción en un .txt
+del mismo nombre.
+
+Requiere Tesseract (y poppler para las muestras en PDF).
+
+Uso:
+    python -m benchmarks.bench_ocr
+    python -m benchmarks.bench_ocr --muestras muestras/ --perfiles original equilibrado
+"""
+import argparse
+import difflib
+import os
+import random
+import statistics
+
+from PIL import Image, ImageDraw, ImageFont
+
+from backend.ocr import OCR_LANG, OCR_PROFILES, get_ocr_profile, _ocr_page
+
+TEXTO_MUESTRA = (
+    "ESCRITURA NUMERO CIENTO VEINTITRES. En la ciudad de Cordoba, Republica Argentina, "
+    "a quince dias del mes de marzo de dos mil veintiuno, ante mi, Escribano Autorizante, "
+    "comparecen: Juan Carlos Perez, argentino, nacido el primero de enero de mil novecientos "
+    "setenta, DNI 20.123.456, CUIL 20-20123456-3, casado en primeras nupcias, con domicilio "
+    "en calle San Martin 1234; y Maria Laura Gomez, argentina, DNI 25.987.654. Y el primero "
+    "dice que VENDE a favor de la segunda el inmueble ubicado en Avenida Colon 742, "
+    "Matricula 123456, Nomenclatura Catastral Circunscripcion 1, Seccion 2, Manzana 3, "
+    "Parcela 4, por el precio total de DOLARES CIEN MIL."
+)
+
+
+def _lineas(texto, ancho):
+    palabras, lineas, actual = texto.split(), [], ""
+    for palabra in palabras:
+        if len(actual) + len(palabra) + 1 > ancho:
+            lineas.append(actual)
+            actual = palabra
+        else:
+            actual = f"{actual} {palabra}".strip()
+    return lineas + [actual]
+
+
+def synthetic_page(dpi, inclinacion=1.5, semilla=0):
+    """
+    Dibuja una página A4 a la resolución indicada, como la rasterizaría
+    pdf2image, y devuelve (imagen, texto esperado).
+    """
+    rng = random.Random(semilla)
+    escala = dpi / 200
+    ancho, alto = int(1654 * escala), int(2339 * escala)
+    imagen = Image.new("RGB", (ancho, alto), (238, 232, 214))
+    dibujo = ImageDraw.Draw(imagen)
+    fuente = ImageFont.load_default(size=int(26 * escala))
+    interlineado = int(44 * escala)
+    lineas = _lineas(TEXTO_MUESTRA, 80)
+    for i, linea in enumerate(lineas):
+        y = int(200 * escala) + i * interlineado
+        # Renglones del papel notarial.
+        dibujo.line((int(120 * escala), y + int(34 * escala), ancho - int(120 * escala), y + int(34 * escala)), fill=(190, 170, 205), width=max(1, int(2 * escala)))
+        dibujo.text((int(160 * escala), y), linea, fill=(25, 25, 70), font=fuente)
+    # Sello en tinta clara sobre el texto.
+    cx, cy, r = int(ancho * 0.7), int(260 * escala), int(110 * escala)
+    dibujo.ellipse((cx - r, cy - r, cx + r, cy + r), outline=(150, 90, 160), width=max(2, int(5 * escala)))
+    for _ in range(int(4000 * escala)):
+        x, y = rng.randrange(ancho), rng.randrange(alto)
+        dibujo.point((x, y), fill=(120, 120, 120))
+    imagen = imagen.rotate(inclinacion, expand=True, fillcolor=(238, 232, 214), resample=Image.BICUBIC)
+    return imagen, "\n".join(lineas)
+
+
+def load_samples(directorio, dpi):
+    """
+    Carga las muestras reales del directorio como (imagen, texto esperado).
+    """
+    muestras = []
+    for nombre in sorted(os.listdir(directorio)):
+        base, extension = os.path.splitext(nombre)
+        transcripcion = os.path.join(directorio, base + ".txt")
+        if extension.lower() not in (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".pdf") or not os.path.exists(transcripcion):
+            continue
+        ruta = os.path.join(directorio, nombre)
+        if extension.lower() == ".pdf":
+            from pdf2image import convert_from_path
+            imagen = convert_from_path(ruta, dpi=dpi, first_page=1, last_page=1)[0]
+        else:
+            imagen = Image.open(ruta)
+            imagen.load()
+        with open(transcripcion, encoding="utf-8") as f:
+            muestras.append((imagen, f.read()))
+    return muestras
+
+
+def character_accuracy(esperado, obtenido):
+    """
+    Proporción de caracteres coincidentes entre la transcripción y el OCR,
+    ignorando diferencias de espacios y saltos de línea.
+    """
+    esperado, obtenido = " ".join(esperado.split()), " ".join(obtenido.split())
+    if not esperado:
+        return 1.0 if not obtenido else 0.0
+    return difflib.SequenceMatcher(None, esperado, obtenido, autojunk=False).ratio()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de perfiles de OCR.")
+    parser.add_argument("--muestras", help="Directorio con páginas de muestra y sus transcripciones (.txt).")
+    parser.add_argument("--paginas", type=int, default=3, help="Páginas sintéticas por perfil (sin --muestras).")
+    parser.add_argument("--perfiles", nargs="+", default=list(OCR_PROFILES), choices=list(OCR_PROFILES))
+    args = parser.parse_args(argv)
+
+    print(f"{'perfil':<12} {'dpi':>4} {'psm':>4} {'oem':>4} {'s/página':>9} {'precisión':>10}")
+    for nombre in args.perfiles:
+        perfil = get_ocr_profile(nombre)
+        if args.muestras:
+            muestras = load_samples(args.muestras, perfil["dpi"])
+        else:
+            muestras = [synthetic_page(perfil["dpi"], semilla=i) for i in range(args.paginas)]
+        if not muestras:
+            raise SystemExit("No se encontraron muestras con transcripción.")
+        segundos, precisiones = [], []
+        for imagen, esperado in muestras:
+            texto, tiempo = _ocr_page(imagen, OCR_LANG, perfil)
+            segundos.append(tiempo)
+            precisiones.append(character_accuracy(esperado, texto))
+        print(f"{nombre:<12} {perfil['dpi']:>4} {perfil['psm']:>4} {perfil['oem']:>4} "
+              f"{statistics.mean(segundos):>9.2f} {statistics.mean(precisiones):>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
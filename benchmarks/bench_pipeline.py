@@ -0,0 +1,191 @@
+"""
+Benchmark de punta a punta sin servicios externos.
+
+Genera escrituras sintéticas (PDF con capa de texto, escaneado y mixto, con
+distinta cantidad de páginas), reemplaza a GPT por un modelo de chat falso y
+determinístico dentro de la cadena `prompt | llm | parser` y a
+MongoDB por mongomock, y mide:
+
+    extract_text_from_pdf, extract_data_with_langchain, save_to_mongodb
+    y process_escritura_publica completo
+
+Cada escenario corre en un proceso nuevo para medir su pico de memoria (RSS)
+sin arrastrar el de los anteriores. Los resultados se comparan con
+benchmarks/baseline.json y el comando termina con error si algún tiempo o el
+pico de memoria supera la línea base más la tolerancia.
+
+Requiere mongomock (pip install mongomock); los escenarios escaneados y
+mixtos requieren además Tesseract y poppler, y se omiten si no están.
+
+Uso:
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline --paginas 2 10 30 --tipos texto mixto
+    python -m benchmarks.bench_pipeline --guardar-linea-base
+"""
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import statistics
+import sys
+import time
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+OPERACIONES = ["extract_text_from_pdf", "extract_data_with_langchain", "save_to_mongodb", "process_escritura_publica"]
+# Encabezados cortos para la tabla del reporte.
+COLUMNAS = {
+    "extract_text_from_pdf": "texto (s)",
+    "extract_data_with_langchain": "extracción (s)",
+    "save_to_mongodb": "guardado (s)",
+    "process_escritura_publica": "completo (s)",
+}
+# Los tiempos muy cortos varían mucho entre corridas: no se falla por menos que esto.
+MARGEN_MINIMO_SEGUNDOS = 0.05
+
+
+def _peak_rss_mb():
+    # ru_maxrss está en KB en Linux y en bytes en macOS.
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    propio = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    hijos = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(propio, hijos) / divisor
+
+
+def _medir(funcion, repeticiones):
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        # El pipeline informa su avance con print; no lo mezclamos con el reporte.
+        with contextlib.redirect_stdout(io.StringIO()):
+            resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos), resultado
+
+
+def run_scenario(tipo, paginas, repeticiones, latencia_llm):
+    """
+    Ejecuta un escenario en el proceso actual (se llama en un proceso nuevo).
+
+    Returns:
+        dict: Mediana de segundos por operación y pico de RSS en MB.
+    """
+    import mongomock
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+    from backend import database, extractor
+    from backend.ocr import extract_text_from_pdf
+    from backend.process import process_escritura_publica
+    from benchmarks.synthetic import synthetic_deed_pdf, synthetic_deed_response
+
+    database._client = mongomock.MongoClient()
+    llm = FakeListChatModel(responses=[synthetic_deed_response()], sleep=latencia_llm or None)
+    # process_escritura_publica usa el cliente compartido del módulo.
+    extractor._llm = llm
+
+    pdf = synthetic_deed_pdf(paginas, tipo=tipo)
+    resultado = {}
+    resultado["extract_text_from_pdf"], texto = _medir(lambda: extract_text_from_pdf(pdf, use_cache=False), repeticiones)
+    if isinstance(texto, Exception) or not texto:
+        raise RuntimeError(f"No se extrajo texto del PDF sintético: {texto}")
+    # La primera extracción importa LangChain y arma el prompt (una vez por
+    # proceso); ese arranque lo mide benchmarks/bench_imports.py, no este.
+    extractor.extract_data_with_langchain(texto, use_cache=False, llm=llm)
+    resultado["extract_data_with_langchain"], datos = _medir(lambda: extractor.extract_data_with_langchain(texto, use_cache=False, llm=llm), repeticiones)
+    if not datos:
+        raise RuntimeError("El modelo falso no produjo datos válidos.")
+    datos = datos.model_dump()
+    carpetas = iter(range(1, repeticiones + 1))
+    resultado["save_to_mongodb"], guardado = _medir(lambda: database.save_to_mongodb(dict(datos), next(carpetas)), repeticiones)
+    if not guardado:
+        raise RuntimeError("No se pudo guardar en la base de prueba.")
+    resultado["process_escritura_publica"], _ = _medir(lambda: process_escritura_publica(pdf), repeticiones)
+    resultado["rss_mb"] = _peak_rss_mb()
+    return resultado
+
+
+def _ocr_disponible():
+    return bool(shutil.which("tesseract") and shutil.which("pdftoppm"))
+
+
+def compare_with_baseline(resultados, linea_base, tolerancia):
+    """
+    Devuelve la lista de mediciones que superan la línea base más la tolerancia.
+    """
+    excedidos = []
+    for escenario, medidas in resultados.items():
+        for clave, valor in medidas.items():
+            limite = linea_base.get(escenario, {}).get(clave)
+            if limite is None:
+                continue
+            maximo = limite * (1 + tolerancia)
+            if clave != "rss_mb":
+                maximo = max(maximo, limite + MARGEN_MINIMO_SEGUNDOS)
+            if valor > maximo:
+                excedidos.append(f"{escenario} {clave}: {valor:.3f} > {limite:.3f} (+{tolerancia:.0%})")
+    return excedidos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de punta a punta con escrituras sintéticas, sin OpenAI ni MongoDB.")
+    parser.add_argument("--paginas", type=int, nargs="+", default=[2, 10], help="Cantidades de páginas de las escrituras.")
+    parser.add_argument("--tipos", nargs="+", default=["texto", "escaneado", "mixto"], choices=["texto", "escaneado", "mixto"])
+    parser.add_argument("--repeticiones", type=int, default=3, help="Repeticiones por operación (se informa la mediana).")
+    parser.add_argument("--latencia-llm", type=float, default=0.0, help="Segundos que tarda en responder el modelo falso.")
+    parser.add_argument("--tolerancia", type=float, default=0.5, help="Margen sobre la línea base antes de fallar (0.5 = +50%%).")
+    parser.add_argument("--linea-base", default=BASELINE_PATH, help="Archivo JSON con la línea base.")
+    parser.add_argument("--guardar-linea-base", action="store_true", help="Guarda los resultados como nueva línea base.")
+    args = parser.parse_args(argv)
+
+    # Sin cachés (cada medición tiene que hacer el trabajo) y sin clave real de OpenAI.
+    os.environ["OCR_CACHE_MAX_MB"] = "0"
+    os.environ["LLM_CACHE_MAX_MB"] = "0"
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    # Los logs del pipeline no se mezclan con el reporte.
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    tipos = args.tipos
+    if not _ocr_disponible() and any(tipo != "texto" for tipo in tipos):
+        print("Tesseract o poppler no están instalados: se omiten los escenarios escaneados y mixtos.")
+        tipos = [tipo for tipo in tipos if tipo == "texto"]
+
+    resultados = {}
+    contexto = multiprocessing.get_context("spawn")
+    print(f"{'escenario':<16} " + " ".join(f"{COLUMNAS[op]:>15}" for op in OPERACIONES) + f" {'RSS (MB)':>9}")
+    for tipo in tipos:
+        for paginas in args.paginas:
+            escenario = f"{tipo}-{paginas}p"
+            with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as executor:
+                medidas = executor.submit(run_scenario, tipo, paginas, args.repeticiones, args.latencia_llm).result()
+            resultados[escenario] = medidas
+            print(f"{escenario:<16} " + " ".join(f"{medidas[op]:>15.3f}" for op in OPERACIONES) + f" {medidas['rss_mb']:>9.1f}")
+
+    if args.guardar_linea_base:
+        with open(args.linea_base, "w", encoding="utf-8") as f:
+            json.dump({escenario: {clave: round(valor, 4) for clave, valor in medidas.items()} for escenario, medidas in resultados.items()}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Línea base guardada en {args.linea_base}.")
+        return 0
+
+    if not os.path.exists(args.linea_base):
+        print("No hay línea base para comparar (usa --guardar-linea-base).")
+        return 0
+    with open(args.linea_base, encoding="utf-8") as f:
+        linea_base = json.load(f)
+    excedidos = compare_with_baseline(resultados, linea_base, args.tolerancia)
+    if excedidos:
+        print("\nSe superó la línea base:")
+        for excedido in excedidos:
+            print(f"  {excedido}")
+        return 1
+    print("\nTodos los escenarios dentro de la línea base.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
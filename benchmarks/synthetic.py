@@ -0,0 +1,210 @@
+"""
+Escrituras sintéticas para los benchmarks: texto con la estructura de una
+escritura de compraventa, su resultado de extracción esperado y PDFs con
+capa de texto, escaneados (solo imagen) o mixtos, armados con un escritor
+de PDF mínimo para no depender de bibliotecas externas.
+"""
+from io import BytesIO
+import json
+import random
+
+from PIL import Image, ImageDraw, ImageFont
+
+# Caracteres por renglón y renglones por página, como en el papel notarial.
+RENGLONES_POR_PAGINA = 40
+CARACTERES_POR_RENGLON = 85
+
+_RELLENO = (
+    "Y los comparecientes manifiestan que aceptan la presente en todos sus terminos, "
+    "declarando bajo juramento que no se encuentran inhibidos para disponer de sus bienes, "
+    "que el inmueble no reconoce gravamenes ni restricciones y que los impuestos, tasas y "
+    "contribuciones se encuentran pagos hasta la fecha, segun constancias que se agregan. "
+)
+
+
+def synthetic_deed_data(partes=2):
+    """
+    Datos de la escritura sintética, en el formato de EscrituraPublicaData.
+    Es también la respuesta del modelo falso.
+    """
+    return {
+        "fecha_otorgamiento": "15 de marzo de 2021",
+        "lugar_escritura": "Cordoba",
+        "numero_escritura": "123",
+        "folio_escritura": "456",
+        "escribano": "Roberto Sanchez",
+        "registro_escribano": "12",
+        "partes_intervinientes": [
+            {
+                "rol": "Vendedor" if i % 2 == 0 else "Comprador",
+                "nombre": f"Nombre{i}",
+                "apellido": f"Apellido{i}",
+                "nacionalidad": "argentina",
+                "fecha_nacimiento": "01-01-1970",
+                "tipo_documento": "DNI",
+                "numero_documento": str(20000000 + i),
+                "tipo_CUIL": "CUIL",
+                "numero_CUIL": None,
+                "estado_civil": "casado",
+                "nombre_apellido_conyuge": None,
+                "domicilio": f"Calle {i} 100, Cordoba",
+                "representacion": None,
+            }
+            for i in range(partes)
+        ],
+        "descripcion_propiedad": {
+            "direccion": "Avenida Colon 742, Cordoba",
+            "Partida": "1101-1234567/8",
+            "nomenclatura_catastral": [{"circunscripcion": "1", "seccion": "2", "manzana": "3", "parcela": "4"}],
+            "superficie": "300 m2",
+            "medidas": "10 x 30",
+            "matricula": "123456",
+        },
+        "valor_transaccion": "USD 100000",
+        "observaciones": "",
+    }
+
+
+def synthetic_deed_response(partes=2):
+    """
+    Respuesta JSON del modelo falso para la escritura sintética.
+    """
+    return json.dumps(synthetic_deed_data(partes), ensure_ascii=False)
+
+
+def synthetic_deed_text(paginas, partes=2, semilla=0):
+    """
+    Texto de una escritura de `paginas` páginas: encabezado, comparecencia,
+    inmueble, precio, cláusulas de relleno y cierre ("Ante mí" ... "CONCUERDA").
+
+    Returns:
+        list: Las páginas, cada una como una lista de renglones.
+    """
+    rng = random.Random(semilla)
+    datos = synthetic_deed_data(partes)
+    comparecientes = "; ".join(
+        f"{p['nombre']} {p['apellido']}, {p['nacionalidad']}, nacido el {p['fecha_nacimiento']}, "
+        f"DNI {p['numero_documento']}, {p['estado_civil']}, con domicilio en {p['domicilio']}"
+        for p in datos["partes_intervinientes"]
+    )
+    inicio = (
+        f"ESCRITURA NUMERO CIENTO VEINTITRES. En la ciudad de Cordoba, a quince dias del mes de marzo "
+        f"de dos mil veintiuno, ante mi, Escribano Autorizante, COMPARECEN: {comparecientes}. "
+        f"Y DICEN: que el primero VENDE a favor del segundo el inmueble ubicado en "
+        f"{datos['descripcion_propiedad']['direccion']}, Matricula 123456, Partida 1101-1234567/8, "
+        f"Nomenclatura Catastral Circunscripcion 1, Seccion 2, Manzana 3, Parcela 4, con una superficie "
+        f"de 300 m2. El precio total de la venta es la suma de DOLARES CIEN MIL. "
+    )
+    cierre = (
+        "Leida que les fue, la firman ante mi, doy fe. Ante mi: Roberto Sanchez, Escribano, "
+        "Registro 12, folio 456. CONCUERDA con su matriz que paso ante mi al folio 456 del Registro 12."
+    )
+    renglones = _renglones(inicio)
+    total = paginas * RENGLONES_POR_PAGINA
+    cierre_renglones = _renglones(cierre)
+    while len(renglones) + len(cierre_renglones) < total:
+        renglones += _renglones(_RELLENO * rng.randint(1, 3))
+    renglones = renglones[:total - len(cierre_renglones)] + cierre_renglones
+    return [renglones[i:i + RENGLONES_POR_PAGINA] for i in range(0, len(renglones), RENGLONES_POR_PAGINA)]
+
+
+def _renglones(texto):
+    renglones, actual = [], ""
+    for palabra in texto.split():
+        if len(actual) + len(palabra) + 1 > CARACTERES_POR_RENGLON:
+            renglones.append(actual)
+            actual = palabra
+        else:
+            actual = f"{actual} {palabra}".strip()
+    return renglones + [actual] if actual else renglones
+
+
+def render_page(renglones, dpi=150, semilla=0):
+    """
+    Dibuja una página A4 como la entregaría un escáner: papel claro, tinta
+    azul oscura, leve ruido y una pequeña inclinación.
+    """
+    rng = random.Random(semilla)
+    escala = dpi / 72
+    ancho, alto = int(595 * escala), int(842 * escala)
+    imagen = Image.new("RGB", (ancho, alto), (240, 236, 222))
+    dibujo = ImageDraw.Draw(imagen)
+    fuente = ImageFont.load_default(size=int(11 * escala))
+    for i, renglon in enumerate(renglones):
+        dibujo.text((int(50 * escala), int((60 + i * 18) * escala)), renglon, fill=(25, 25, 70), font=fuente)
+    for _ in range(int(800 * escala)):
+        dibujo.point((rng.randrange(ancho), rng.randrange(alto)), fill=(140, 140, 140))
+    return imagen.rotate(rng.uniform(-1, 1), fillcolor=(240, 236, 222), resample=Image.BICUBIC)
+
+
+def _escape(texto):
+    return texto.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def build_pdf(paginas, tipo="texto", dpi=150):
+    """
+    Arma un PDF con las páginas recibidas (listas de renglones).
+
+    Args:
+        tipo (str): 'texto' (capa de texto seleccionable), 'escaneado' (cada
+            página es una imagen JPEG, sin texto) o 'mixto' (alterna ambas).
+
+    Returns:
+        bytes: El contenido del PDF.
+    """
+    objetos = []  # Contenido de cada objeto; el número de objeto es su índice + 1.
+
+    def agregar(contenido):
+        objetos.append(contenido)
+        return len(objetos)
+
+    catalogo = agregar(None)
+    arbol = agregar(None)
+    fuente = agregar(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    hojas = []
+    for n, renglones in enumerate(paginas):
+        escaneada = tipo == "escaneado" or (tipo == "mixto" and n % 2 == 1)
+        if escaneada:
+            buffer = BytesIO()
+            imagen = render_page(renglones, dpi=dpi, semilla=n)
+            imagen.save(buffer, format="JPEG", quality=75)
+            jpeg = buffer.getvalue()
+            imagen_obj = agregar(
+                b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB "
+                b"/BitsPerComponent 8 /Filter /DCTDecode /Length %d >>\nstream\n" % (imagen.width, imagen.height, len(jpeg))
+                + jpeg + b"\nendstream"
+            )
+            contenido = b"q 595 0 0 842 0 0 cm /Im0 Do Q"
+            recursos = b"<< /XObject << /Im0 %d 0 R >> >>" % imagen_obj
+        else:
+            lineas = [b"BT /F1 11 Tf 50 782 Td 18 TL"]
+            for renglon in renglones:
+                lineas.append(b"(" + _escape(renglon).encode("cp1252", errors="replace") + b") Tj T*")
+            lineas.append(b"ET")
+            contenido = b"\n".join(lineas)
+            recursos = b"<< /Font << /F1 %d 0 R >> >>" % fuente
+        flujo = agregar(b"<< /Length %d >>\nstream\n" % len(contenido) + contenido + b"\nendstream")
+        hojas.append(agregar(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] /Contents %d 0 R /Resources %s >>"
+            % (arbol, flujo, recursos)
+        ))
+    objetos[catalogo - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % arbol
+    objetos[arbol - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % h for h in hojas), len(hojas))
+
+    salida = bytearray(b"%PDF-1.4\n")
+    posiciones = []
+    for numero, contenido in enumerate(objetos, start=1):
+        posiciones.append(len(salida))
+        salida += b"%d 0 obj\n" % numero + contenido + b"\nendobj\n"
+    xref = len(salida)
+    salida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    salida += b"".join(b"%010d 00000 n \n" % posicion for posicion in posiciones)
+    salida += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, catalogo, xref)
+    return bytes(salida)
+
+
+def synthetic_deed_pdf(paginas, tipo="texto", partes=2, dpi=150):
+    """
+    PDF de una escritura sintética de `paginas` páginas del tipo indicado.
+    """
+    return build_pdf(synthetic_deed_text(paginas, partes), tipo=tipo, dpi=dpi)
@@ -1,6 +1,14 @@
+from contextlib import contextmanager
+import os
 import streamlit as st
 import pandas as pd
-from backend.database import save_to_mongodb
+from backend.database import (
+    save_analysis_to_mongodb, save_changes_to_mongodb, changed_paths,
+    GUARDADO, SIN_CAMBIOS, CONFLICTO, ERROR_GUARDADO,
+)
+
+# Partes que se muestran por página en el editor (escrituras con muchas partes).
+EDITOR_PARTES_POR_PAGINA = int(os.getenv("EDITOR_PARTES_POR_PAGINA", "10"))
 
 def display_data_view(data, carpeta):
     """
@@ -11,6 +19,8 @@ def display_data_view(data, carpeta):
         data (dict): Los datos extraídos del PDF para mostrar.
     """
     st.header("Visualización y Edición de Datos Extraídos")
+    if st.session_state.get('datos_originales') is None and st.session_state.get('version_carpeta') is not None:
+        st.warning(f"La carpeta {carpeta} ya tiene una escritura guardada: al guardar este análisis se reemplazará.")
 
     # --- Controles de Edición y Guardado ---
     col1, col2 = st.columns(2)
@@ -27,19 +37,38 @@ def display_data_view(data, carpeta):
                 st.rerun()
 
     with col2:
+        # Datos tal como se cargaron de la base (None si es un análisis nuevo).
+        original = st.session_state.get('datos_originales')
         if st.button("Guardar en Base de Datos", type="primary"):
-            # Llamamos a la función y capturamos el resultado.
-            save_success = save_to_mongodb(data, carpeta)
-            
+            if original is None:
+                # Análisis nuevo: se guarda el documento completo, anotando qué
+                # campos se corrigieron a mano para que una reextracción los respete.
+                editados = set(data.get('campos_editados') or [])
+                extraidos = st.session_state.get('datos_extraidos')
+                if extraidos is not None:
+                    editados |= set(changed_paths(extraidos, data))
+                resultado = save_analysis_to_mongodb(data, carpeta, st.session_state.get('version_carpeta'), campos_editados=editados)
+            else:
+                # Carpeta existente: solo se envían los campos modificados.
+                data['campos_editados'] = sorted(set(data.get('campos_editados') or []) | set(changed_paths(original, data)))
+                resultado = save_changes_to_mongodb(data, carpeta, original)
+            save_success = resultado in (GUARDADO, SIN_CAMBIOS)
+            if resultado == CONFLICTO:
+                st.error("Otra persona guardó cambios en esta carpeta después de que la cargaste. "
+                         "Vuelve a buscarla para ver la versión actual antes de editar.")
+            elif resultado == ERROR_GUARDADO:
+                st.error("Error al guardar los cambios en la base de datos.")
+
             # Si el guardado fue exitoso, establecemos la bandera.
             if save_success:
                 st.session_state.data_saved_successfully = True
+                st.session_state.datos_originales = None
                 # Forzamos un rerun para que app.py pueda detectar la bandera inmediatamente.
                 st.rerun()
 
     # Mensaje informativo sobre el modo actual
     if st.session_state.get('editing', False):
-        st.info("Modo Edición: Puedes modificar los campos. Haz clic en 'Guardar Cambios en Interfaz' para aplicar.")
+        st.info("Modo Edición: Puedes modificar los campos. Haz clic en 'Aplicar cambios' en cada bloque y luego en 'Guardar Cambios en Interfaz'.")
     else:
         st.info("Modo Visualización: Para modificar, haz clic en 'Habilitar Edición'.")
 
@@ -49,6 +78,87 @@ def display_data_view(data, carpeta):
     display_structured_data(data, carpeta)
 
 
+@contextmanager
+def _bloque_editable(key):
+    """
+    En modo edición agrupa los campos de un bloque en un st.form: escribir en
+    ellos no provoca un rerun y los valores se aplican todos juntos con
+    "Aplicar cambios". En modo visualización es un contenedor común.
+    """
+    if not st.session_state.editing:
+        yield
+        return
+    with st.form(key):
+        yield
+        st.form_submit_button("Aplicar cambios")
+
+
+def _expander_perezoso(label, key):
+    """
+    Expander que informa si está abierto (Streamlit >= 1.52), para no crear
+    los widgets de su contenido mientras está cerrado. En versiones anteriores
+    el contenido se arma siempre.
+
+    Returns:
+        tuple: (expander, abierto)
+    """
+    try:
+        expander = st.expander(label, key=key, on_change="rerun")
+    except TypeError:
+        return st.expander(label), True
+    return expander, expander.open is not False
+
+
+def _resumen_partes(partes):
+    columnas = ["rol", "nombre", "apellido", "tipo_documento", "numero_documento", "numero_CUIL"]
+    return pd.DataFrame([{col: parte.get(col) for col in columnas} for parte in partes], columns=columnas)
+
+
+def _display_parte(parte, i):
+    rol = parte.get('rol', 'parte')
+    col1_p, col2_p = st.columns(2)
+    with col1_p:
+        parte["nombre"] = st.text_input(f"Nombre", value=parte.get("nombre", ""), disabled=not st.session_state.editing, key=f"nombre_{rol}_{i}")
+        parte["nacionalidad"] = st.text_input(f"Nacionalidad", value=parte.get("nacionalidad", ""), disabled=not st.session_state.editing, key=f"nacionalidad_{rol}_{i}")
+        parte["tipo_documento"] = st.text_input(f"Tipo Documento", value=parte.get("tipo_documento", ""), disabled=not st.session_state.editing, key=f"tipo_doc_{rol}_{i}")
+        parte["tipo_CUIL"] = st.text_input(f"Tipo CUIL", value=parte.get("tipo_CUIL", ""), disabled=not st.session_state.editing, key=f"tipo_cuil_{rol}_{i}")
+        parte["estado_civil"] = st.text_input(f"Estado Civil", value=parte.get("estado_civil", ""), disabled=not st.session_state.editing, key=f"estado_civil_{rol}_{i}")
+        parte["domicilio"] = st.text_input(f"Domicilio", value=parte.get("domicilio", ""), disabled=not st.session_state.editing, key=f"domicilio_{rol}_{i}")
+    with col2_p:
+        parte["apellido"] = st.text_input(f"Apellido", value=parte.get("apellido", ""), disabled=not st.session_state.editing, key=f"apellido_{rol}_{i}")
+        parte["fecha_nacimiento"] = st.text_input(f"Fecha Nacimiento", value=parte.get("fecha_nacimiento", ""), disabled=not st.session_state.editing, key=f"fecha_nacimiento_{rol}_{i}")
+        parte["numero_documento"] = st.text_input(f"Número Documento", value=parte.get("numero_documento", ""), disabled=not st.session_state.editing, key=f"numero_doc_{rol}_{i}")
+        parte["numero_CUIL"] = st.text_input(f"Número CUIL", value=parte.get("numero_CUIL", ""), disabled=not st.session_state.editing, key=f"numero_cuil_{rol}_{i}")
+        parte["nombre_apellido_conyuge"] = st.text_input(f"Cónyuge", value=parte.get("nombre_apellido_conyuge", ""), disabled=not st.session_state.editing, key=f"conyuge_{rol}_{i}")
+        parte["representacion"] = st.text_input(f"Representación", value=parte.get("representacion", ""), disabled=not st.session_state.editing, key=f"representacion_{rol}_{i}")
+
+
+def _display_partes(partes):
+    """
+    Muestra las partes de a una página. Los detalles de cada parte se arman
+    solo cuando su expander está abierto, así un rerun no reconstruye los
+    ~12 campos de cada una de las partes de una escritura grande.
+    """
+    if not st.session_state.editing:
+        # Vista general de todas las partes en una sola tabla.
+        st.dataframe(_resumen_partes(partes), hide_index=True)
+
+    paginas = max(1, -(-len(partes) // EDITOR_PARTES_POR_PAGINA))
+    pagina = 1
+    if paginas > 1:
+        pagina = st.number_input(f"Página de partes (de {paginas})", min_value=1, max_value=paginas, value=1, step=1, key="pagina_partes")
+        if st.session_state.editing:
+            st.caption("Aplica los cambios de una parte antes de cambiar de página.")
+    inicio = (pagina - 1) * EDITOR_PARTES_POR_PAGINA
+
+    for i, parte in enumerate(partes[inicio:inicio + EDITOR_PARTES_POR_PAGINA], start=inicio):
+        expander, abierto = _expander_perezoso(f"Parte {i+1}: {parte.get('rol', 'Desconocido')} - {parte.get('nombre') or ''} {parte.get('apellido') or ''}", key=f"expander_parte_{i}")
+        if not abierto:
+            continue
+        with expander, _bloque_editable(f"form_parte_{i}"):
+            _display_parte(parte, i)
+
+
 def display_structured_data(data, carpeta):
     """
     Muestra o permite editar datos JSON de forma estructurada con separadores y tablas.
@@ -71,70 +181,55 @@ def display_structured_data(data, carpeta):
     st.markdown(f"**Carpeta Asignada:** {carpeta_mostrada}")
 
     st.subheader("Datos de la Operación")
-    col1_op, col2_op = st.columns(2)
-    with col1_op:
-        data["fecha_otorgamiento"] = st.text_input("Fecha Otorgamiento", value=data.get("fecha_otorgamiento", ""), disabled=not st.session_state.editing, key="fecha_otorgamiento")
-        data["numero_escritura"] = st.text_input("Número Escritura", value=data.get("numero_escritura", ""), disabled=not st.session_state.editing, key="numero_escritura")
-        data["escribano"] = st.text_input("Escribano", value=data.get("escribano", ""), disabled=not st.session_state.editing, key="escribano")
-    with col2_op:
-        data["lugar_escritura"] = st.text_input("Lugar Escritura", value=data.get("lugar_escritura", ""), disabled=not st.session_state.editing, key="lugar_escritura")
-        data["folio_escritura"] = st.text_input("Folio Escritura", value=data.get("folio_escritura", ""), disabled=not st.session_state.editing, key="folio_escritura")
-        data["registro_escribano"] = st.text_input("Registro Escribano", value=data.get("registro_escribano", ""), disabled=not st.session_state.editing, key="registro_escribano")
+    with _bloque_editable("form_operacion"):
+        col1_op, col2_op = st.columns(2)
+        with col1_op:
+            data["fecha_otorgamiento"] = st.text_input("Fecha Otorgamiento", value=data.get("fecha_otorgamiento", ""), disabled=not st.session_state.editing, key="fecha_otorgamiento")
+            data["numero_escritura"] = st.text_input("Número Escritura", value=data.get("numero_escritura", ""), disabled=not st.session_state.editing, key="numero_escritura")
+            data["escribano"] = st.text_input("Escribano", value=data.get("escribano", ""), disabled=not st.session_state.editing, key="escribano")
+        with col2_op:
+            data["lugar_escritura"] = st.text_input("Lugar Escritura", value=data.get("lugar_escritura", ""), disabled=not st.session_state.editing, key="lugar_escritura")
+            data["folio_escritura"] = st.text_input("Folio Escritura", value=data.get("folio_escritura", ""), disabled=not st.session_state.editing, key="folio_escritura")
+            data["registro_escribano"] = st.text_input("Registro Escribano", value=data.get("registro_escribano", ""), disabled=not st.session_state.editing, key="registro_escribano")
 
     # ---
     ## Partes Intervinientes
     st.subheader("Partes Intervinientes")
     if "partes_intervinientes" in data and data["partes_intervinientes"]:
-        for i, parte in enumerate(data["partes_intervinientes"]):
-            st.markdown(f"### Parte {i+1}: {parte.get('rol', 'Desconocido')}")
-            with st.expander(f"Detalles de {parte.get('rol', 'Parte')}"):
-                col1_p, col2_p = st.columns(2)
-                with col1_p:
-                    parte["nombre"] = st.text_input(f"Nombre", value=parte.get("nombre", ""), disabled=not st.session_state.editing, key=f"nombre_{parte.get('rol', 'parte')}_{i}")
-                    parte["nacionalidad"] = st.text_input(f"Nacionalidad", value=parte.get("nacionalidad", ""), disabled=not st.session_state.editing, key=f"nacionalidad_{parte.get('rol', 'parte')}_{i}")
-                    parte["tipo_documento"] = st.text_input(f"Tipo Documento", value=parte.get("tipo_documento", ""), disabled=not st.session_state.editing, key=f"tipo_doc_{parte.get('rol', 'parte')}_{i}")
-                    parte["tipo_CUIL"] = st.text_input(f"Tipo CUIL", value=parte.get("tipo_CUIL", ""), disabled=not st.session_state.editing, key=f"tipo_cuil_{parte.get('rol', 'parte')}_{i}")
-                    parte["estado_civil"] = st.text_input(f"Estado Civil", value=parte.get("estado_civil", ""), disabled=not st.session_state.editing, key=f"estado_civil_{parte.get('rol', 'parte')}_{i}")
-                    parte["domicilio"] = st.text_input(f"Domicilio", value=parte.get("domicilio", ""), disabled=not st.session_state.editing, key=f"domicilio_{parte.get('rol', 'parte')}_{i}")
-                with col2_p:
-                    parte["apellido"] = st.text_input(f"Apellido", value=parte.get("apellido", ""), disabled=not st.session_state.editing, key=f"apellido_{parte.get('rol', 'parte')}_{i}")
-                    parte["fecha_nacimiento"] = st.text_input(f"Fecha Nacimiento", value=parte.get("fecha_nacimiento", ""), disabled=not st.session_state.editing, key=f"fecha_nacimiento_{parte.get('rol', 'parte')}_{i}")
-                    parte["numero_documento"] = st.text_input(f"Número Documento", value=parte.get("numero_documento", ""), disabled=not st.session_state.editing, key=f"numero_doc_{parte.get('rol', 'parte')}_{i}")
-                    parte["numero_CUIL"] = st.text_input(f"Número CUIL", value=parte.get("numero_CUIL", ""), disabled=not st.session_state.editing, key=f"numero_cuil_{parte.get('rol', 'parte')}_{i}")
-                    parte["nombre_apellido_conyuge"] = st.text_input(f"Cónyuge", value=parte.get("nombre_apellido_conyuge", ""), disabled=not st.session_state.editing, key=f"conyuge_{parte.get('rol', 'parte')}_{i}")
-                    parte["representacion"] = st.text_input(f"Representación", value=parte.get("representacion", ""), disabled=not st.session_state.editing, key=f"representacion_{parte.get('rol', 'parte')}_{i}")
+        _display_partes(data["partes_intervinientes"])
     else:
         st.info("No hay partes intervinientes para mostrar.")
 
     # ---
-    ## Descripción de la Propiedad
-    st.subheader("Datos de la Propiedad")
-    if "descripcion_propiedad" in data and data["descripcion_propiedad"]:
-        propiedad = data["descripcion_propiedad"]
-        propiedad["direccion"] = st.text_area("Dirección", value=propiedad.get("direccion", ""), disabled=not st.session_state.editing, key="direccion_propiedad")
-        col1_prop, col2_prop = st.columns(2)
-        with col1_prop:
-            propiedad["Partida"] = st.text_input("Partida", value=propiedad.get("Partida", ""), disabled=not st.session_state.editing, key="partida_propiedad")
-            propiedad["superficie"] = st.text_input("Superficie", value=propiedad.get("superficie", ""), disabled=not st.session_state.editing, key="superficie_propiedad")
-        with col2_prop:
-            propiedad["matricula"] = st.text_input("Matrícula", value=propiedad.get("matricula", ""), disabled=not st.session_state.editing, key="matricula_propiedad")
-            propiedad["medidas"] = st.text_input("Medidas", value=propiedad.get("medidas", ""), disabled=not st.session_state.editing, key="medidas_propiedad")
-
-        st.markdown("**Nomenclatura Catastral:**")
-        if "nomenclatura_catastral" in propiedad and propiedad["nomenclatura_catastral"]:
-            df_nomenclatura = pd.DataFrame(propiedad["nomenclatura_catastral"])
-            if st.session_state.editing:
-                edited_df = st.data_editor(df_nomenclatura, num_rows="dynamic", key="nomenclatura_catastral_editor")
-                propiedad["nomenclatura_catastral"] = edited_df.to_dict('records')
+    ## Descripción de la Propiedad y Valor de Transacción
+    with _bloque_editable("form_propiedad"):
+        st.subheader("Datos de la Propiedad")
+        if "descripcion_propiedad" in data and data["descripcion_propiedad"]:
+            propiedad = data["descripcion_propiedad"]
+            propiedad["direccion"] = st.text_area("Dirección", value=propiedad.get("direccion", ""), disabled=not st.session_state.editing, key="direccion_propiedad")
+            col1_prop, col2_prop = st.columns(2)
+            with col1_prop:
+                propiedad["Partida"] = st.text_input("Partida", value=propiedad.get("Partida", ""), disabled=not st.session_state.editing, key="partida_propiedad")
+                propiedad["superficie"] = st.text_input("Superficie", value=propiedad.get("superficie", ""), disabled=not st.session_state.editing, key="superficie_propiedad")
+            with col2_prop:
+                propiedad["matricula"] = st.text_input("Matrícula", value=propiedad.get("matricula", ""), disabled=not st.session_state.editing, key="matricula_propiedad")
+                propiedad["medidas"] = st.text_input("Medidas", value=propiedad.get("medidas", ""), disabled=not st.session_state.editing, key="medidas_propiedad")
+
+            st.markdown("**Nomenclatura Catastral:**")
+            if "nomenclatura_catastral" in propiedad and propiedad["nomenclatura_catastral"]:
+                df_nomenclatura = pd.DataFrame(propiedad["nomenclatura_catastral"])
+                if st.session_state.editing:
+                    edited_df = st.data_editor(df_nomenclatura, num_rows="dynamic", key="nomenclatura_catastral_editor")
+                    propiedad["nomenclatura_catastral"] = edited_df.to_dict('records')
+                else:
+                    st.dataframe(df_nomenclatura, hide_index=True)
             else:
-                st.dataframe(df_nomenclatura, hide_index=True)
+                st.info("No hay datos de nomenclatura catastral para mostrar.")
         else:
-            st.info("No hay datos de nomenclatura catastral para mostrar.")
-    else:
-        st.info("No hay descripción de propiedad para mostrar.")
+            st.info("No hay descripción de propiedad para mostrar.")
 
-    # ---
-    ## Valor de Transacción y Observaciones
-    st.subheader("Información Adicional")
-    data["valor_transaccion"] = st.text_input("Valor de Transacción", value=data.get("valor_transaccion", ""), disabled=not st.session_state.editing, key="valor_transaccion")
-    data["observaciones"] = st.text_area("Observaciones", value=data.get("observaciones", ""), disabled=not st.session_state.editing, key="observaciones")
+        # ---
+        ## Valor de Transacción y Observaciones
+        st.subheader("Información Adicional")
+        data["valor_transaccion"] = st.text_input("Valor de Transacción", value=data.get("valor_transaccion", ""), disabled=not st.session_state.editing, key="valor_transaccion")
+        data["observaciones"] = st.text_area("Observaciones", value=data.get("observaciones", ""), disabled=not st.session_state.editing, key="observaciones")
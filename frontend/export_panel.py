@@ -0,0 +1,44 @@
+from datetime import datetime, time
+import os
+import tempfile
+import zipfile
+import streamlit as st
+from backend.export import export_escrituras, FORMATOS
+
+
+def _export_zip(formato, desde):
+    """
+    Exporta a un directorio temporal (escribiendo por tramos, como el
+    comando) y devuelve los bytes de un ZIP con las tablas de partes y
+    nomenclaturas. El ZIP se arma en un archivo temporal, que se borra antes
+    de devolverlo; Streamlit guarda la descarga completa en memoria, por lo
+    que para exportar todo el archivo conviene el comando.
+    """
+    with tempfile.TemporaryDirectory() as directorio:
+        resumen = export_escrituras(directorio, formato=formato, desde=desde)
+        with tempfile.NamedTemporaryFile(suffix=".zip", dir=directorio) as destino:
+            with zipfile.ZipFile(destino, "w", zipfile.ZIP_DEFLATED) as archivo_zip:
+                for path in resumen["archivos"].values():
+                    archivo_zip.write(path, os.path.basename(path))
+            destino.seek(0)
+            return destino.read()
+
+
+@st.fragment
+def display_export_panel():
+    """
+    Descarga de todas las escrituras (o las modificadas desde una fecha) como
+    tablas planas. La exportación corre recién al presionar el botón y, al ser
+    un fragmento, sin volver a ejecutar la aplicación.
+    """
+    st.header("Exportar Escrituras")
+    formato = st.selectbox("Formato", FORMATOS, format_func=str.upper, key="export_formato")
+    desde = st.date_input("Modificadas desde (opcional)", value=None, format="DD/MM/YYYY", key="export_desde")
+    desde = datetime.combine(desde, time.min) if desde else None
+    st.download_button(
+        "Descargar exportación",
+        data=lambda: _export_zip(formato, desde),
+        file_name=f"escrituras_{datetime.now():%Y%m%d}.zip",
+        mime="application/zip",
+        help="Un archivo con una fila por parte interviniente y otro con una fila por nomenclatura catastral.",
+    )
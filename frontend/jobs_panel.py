@@ -0,0 +1,197 @@
+import copy
+from datetime import datetime, timedelta
+import streamlit as st
+import pandas as pd
+from backend.jobs import list_jobs, get_job, force_extraction, EN_COLA, EN_PROCESO, TERMINADO, ERROR
+from backend.database import reuse_escritura, carpeta_version
+
+# Cada cuántos segundos se consulta el estado de los trabajos mientras haya alguno en cola o en proceso.
+INTERVALO_CONSULTA = 3
+# Los trabajos ya terminados se muestran durante estas horas desde que se crearon.
+HORAS_RECIENTES = 24
+
+ETIQUETAS_ESTADO = {
+    EN_COLA: "En cola",
+    EN_PROCESO: "En proceso",
+    TERMINADO: "Terminado",
+    ERROR: "Error",
+}
+
+
+def _describir_etapa(etapa):
+    """
+    Resume el estado de una etapa, con el avance de páginas si lo hay.
+    """
+    etapa = etapa or {}
+    if etapa.get('duplicado_de'):
+        return "Pendiente (posible duplicado)"
+    texto = ETIQUETAS_ESTADO.get(etapa.get('estado'), "-")
+    if etapa.get('estado') == EN_PROCESO and etapa.get('paginas_total'):
+        texto += f" ({etapa.get('paginas_hechas', 0)}/{etapa['paginas_total']} páginas)"
+    if etapa.get('escrituras_total'):
+        texto += f" ({etapa['escrituras_total']} escrituras"
+        texto += f", {etapa['escrituras_con_error']} con error)" if etapa.get('escrituras_con_error') else ")"
+    return texto
+
+
+def _opciones_resultado(trabajo):
+    """
+    Resultados a revisar de un trabajo terminado: uno, o uno por escritura
+    separada si el PDF tenía varias. Cada opción es (trabajo, índice de la escritura o None).
+    """
+    base = f"{trabajo.get('archivo') or ''} ({trabajo['creado']:%d/%m %H:%M})"
+    if not trabajo.get('dividir'):
+        if trabajo.get('etapas', {}).get('extraccion', {}).get('duplicado_de'):
+            base += " - posible duplicado"
+        return {f"Carpeta {trabajo['numero_carpeta']} - {base}": (str(trabajo['_id']), None)}
+    return {
+        f"Carpeta {e['numero_carpeta']} - {base}, páginas {e['paginas'][0]} a {e['paginas'][1]}": (str(trabajo['_id']), i)
+        for i, e in enumerate(trabajo.get('escrituras') or []) if e['ok']
+    }
+
+
+def _describir_duplicados(duplicados):
+    """
+    Resume las escrituras ya guardadas con un texto casi igual.
+    """
+    return ", ".join(f"Carpeta {d['numero_carpeta']} ({d['similitud']:.0%})" for d in duplicados or [])
+
+
+def display_duplicate_warning():
+    """
+    Si el análisis cargado es un posible duplicado de escrituras ya
+    guardadas, lo avisa y deja elegir: usar los datos de una de ellas
+    (se revisan y se guardan en la carpeta del análisis) o, si todavía no se
+    extrajo, extraer igualmente con el LLM.
+    """
+    aviso = st.session_state.get('posibles_duplicados')
+    if not aviso:
+        return
+    duplicados = aviso['duplicados']
+    extraido = bool(st.session_state.get('resultado_analisis'))
+    if extraido:
+        st.warning(f"Esta escritura parece un duplicado de {_describir_duplicados(duplicados)}. Revisa los datos extraídos antes de guardar.")
+    else:
+        st.warning(
+            f"El PDF de la carpeta {aviso['numero_carpeta']} parece un duplicado de {_describir_duplicados(duplicados)}, "
+            "por lo que no se extrajeron sus datos con GPT. Puedes usar los datos de la escritura guardada o extraer igualmente."
+        )
+    col_origen, col_usar, col_extraer = st.columns([2, 1, 1])
+    with col_origen:
+        origen = st.selectbox(
+            "Escritura a reutilizar", [d['numero_carpeta'] for d in duplicados],
+            format_func=lambda numero: f"Carpeta {numero}", label_visibility="collapsed", key="duplicado_origen",
+        )
+    with col_usar:
+        if st.button(f"Usar los datos de la carpeta {origen}"):
+            datos = reuse_escritura(origen, aviso.get('pdf_sha256'))
+            if datos:
+                st.session_state.resultado_analisis = datos
+                st.session_state.current_folder_number = aviso['numero_carpeta']
+                st.session_state.datos_originales = None
+                st.session_state.datos_extraidos = copy.deepcopy(datos)
+                st.session_state.posibles_duplicados = None
+                st.rerun()
+            st.error(f"No se pudieron leer los datos de la carpeta {origen}.")
+    # Solo un análisis que no se extrajo y no viene de un PDF con varias escrituras.
+    with col_extraer:
+        if not extraido and aviso['trabajo'] and st.button("Extraer igualmente con GPT"):
+            if force_extraction(aviso['trabajo']):
+                st.session_state.posibles_duplicados = None
+                st.info("Se encoló la extracción; su avance se muestra en los análisis en segundo plano.")
+            else:
+                st.error("No se pudo volver a encolar el análisis.")
+
+
+def display_jobs_panel():
+    """
+    Muestra los trabajos de análisis recientes. Mientras alguno está en cola
+    o en proceso se actualiza solo cada pocos segundos sin volver a ejecutar
+    toda la aplicación; cuando terminan todos deja de consultar. Los trabajos
+    terminados pueden cargarse en la vista de datos para revisarlos y guardarlos.
+    """
+    if st.session_state.get('trabajos_activos', True):
+        _panel_en_vivo()
+    else:
+        _panel()
+
+
+@st.fragment(run_every=INTERVALO_CONSULTA)
+def _panel_en_vivo():
+    if not _mostrar_trabajos():
+        # Ya no hay nada en curso: se vuelve a dibujar el panel sin consultas periódicas.
+        st.rerun()
+
+
+@st.fragment
+def _panel():
+    if _mostrar_trabajos():
+        st.rerun()
+
+
+def _mostrar_trabajos():
+    """
+    Dibuja la tabla de trabajos y la carga de resultados.
+
+    Returns:
+        bool: True si hay trabajos en cola o en proceso.
+    """
+    try:
+        trabajos = list_jobs(limit=15, desde=datetime.now() - timedelta(hours=HORAS_RECIENTES))
+    except Exception as e:
+        st.error(f"No se pudo consultar el estado de los análisis: {e}")
+        return False
+    activos = any(trabajo.get('estado') in (EN_COLA, EN_PROCESO) for trabajo in trabajos)
+    st.session_state.trabajos_activos = activos
+    if not trabajos:
+        return activos
+
+    st.header("Análisis en Segundo Plano")
+    filas = [{
+        "Carpeta": trabajo.get('numero_carpeta'),
+        "Archivo": (trabajo.get('archivo') or "") + (" (varias escrituras)" if trabajo.get('dividir') else ""),
+        "Estado": ETIQUETAS_ESTADO.get(trabajo.get('estado'), trabajo.get('estado')),
+        "OCR": _describir_etapa(trabajo.get('etapas', {}).get('ocr')),
+        "Extracción": _describir_etapa(trabajo.get('etapas', {}).get('extraccion')),
+        "Posible duplicado": _describir_duplicados(trabajo.get('posibles_duplicados')),
+        "Creado": trabajo.get('creado'),
+        "Error": trabajo.get('error') or "",
+    } for trabajo in trabajos]
+    st.dataframe(pd.DataFrame(filas), hide_index=True)
+
+    terminados = [trabajo for trabajo in trabajos if trabajo.get('estado') == TERMINADO]
+    if terminados:
+        col_trabajo, col_cargar = st.columns([3, 1])
+        with col_trabajo:
+            opciones = {}
+            for t in terminados:
+                opciones.update(_opciones_resultado(t))
+            elegido = st.selectbox("Resultado a revisar", list(opciones), label_visibility="collapsed", key="trabajo_a_revisar")
+        with col_cargar:
+            if st.button("Cargar resultado"):
+                job_id, indice = opciones[elegido]
+                trabajo = get_job(job_id)
+                if indice is None:
+                    resultado, numero_carpeta = trabajo['resultado'], trabajo['numero_carpeta']
+                    duplicados, trabajo_duplicado, sha256 = trabajo.get('posibles_duplicados'), job_id, trabajo['sha256']
+                else:
+                    escritura = trabajo['resultado']['escrituras'][indice]
+                    resultado, numero_carpeta = escritura['resultado'], escritura['numero_carpeta']
+                    duplicados, trabajo_duplicado = escritura.get('posibles_duplicados'), None
+                    sha256 = resultado['extraccion']['pdf_sha256']
+                st.session_state.resultado_analisis = resultado
+                st.session_state.current_folder_number = numero_carpeta
+                # Es un análisis nuevo: se guardará el documento completo, siempre
+                # que nadie guarde en la carpeta mientras se revisa.
+                st.session_state.datos_originales = None
+                st.session_state.version_carpeta = carpeta_version(numero_carpeta)
+                # Lo que devolvió la extracción, para saber qué se corrige a mano.
+                st.session_state.datos_extraidos = copy.deepcopy(resultado)
+                st.session_state.posibles_duplicados = (
+                    {'trabajo': trabajo_duplicado, 'duplicados': duplicados, 'numero_carpeta': numero_carpeta, 'pdf_sha256': sha256}
+                    if duplicados else None
+                )
+                st.session_state.editing = False
+                st.rerun(scope="app")
+    st.markdown("---")
+    return activos
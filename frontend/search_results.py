@@ -0,0 +1,69 @@
+import streamlit as st
+import pandas as pd
+from backend.database import search_escrituras
+
+RESULTADOS_POR_PAGINA = 20
+
+
+def display_search_results(filtros):
+    """
+    Muestra una página de resultados de la búsqueda avanzada, con controles
+    para cambiar de página y abrir una carpeta.
+
+    Args:
+        filtros (dict): Los filtros elegidos en la barra lateral (ver search_escrituras).
+    """
+    pagina = st.session_state.get('advanced_search_page', 1)
+    with st.spinner("Buscando escrituras..."):
+        respuesta = search_escrituras(**filtros, page=pagina, page_size=RESULTADOS_POR_PAGINA)
+
+    col_titulo, col_cerrar = st.columns([4, 1])
+    with col_titulo:
+        st.header("Resultados de la Búsqueda")
+    with col_cerrar:
+        if st.button("Cerrar búsqueda"):
+            st.session_state.advanced_search = None
+            st.rerun()
+
+    if respuesta is None:
+        st.error("No se pudo realizar la búsqueda: revisa la conexión a la base de datos.")
+        return
+    if not respuesta['total']:
+        st.info("No se encontraron escrituras con esos filtros.")
+        return
+
+    filas = []
+    for documento in respuesta['resultados']:
+        partes = documento.get('partes_intervinientes') or []
+        filas.append({
+            "Carpeta": documento.get('numero_carpeta'),
+            "Escritura": documento.get('numero_escritura', ""),
+            "Fecha": documento.get('fecha_otorgamiento', ""),
+            "Escribano": documento.get('escribano', ""),
+            "Registro": documento.get('registro_escribano', ""),
+            "Dirección": (documento.get('descripcion_propiedad') or {}).get('direccion', ""),
+            "Partes": "; ".join(
+                f"{p.get('rol', '')}: {' '.join(filter(None, [p.get('nombre'), p.get('apellido')]))}" for p in partes
+            ),
+        })
+    st.caption(f"{respuesta['total']} escrituras encontradas. Página {respuesta['pagina']} de {respuesta['paginas']}.")
+    st.dataframe(pd.DataFrame(filas), hide_index=True)
+
+    col_anterior, col_siguiente, col_carpeta, col_abrir = st.columns(4)
+    with col_anterior:
+        if st.button("Anterior", disabled=pagina <= 1):
+            st.session_state.advanced_search_page = pagina - 1
+            st.rerun()
+    with col_siguiente:
+        if st.button("Siguiente", disabled=pagina >= respuesta['paginas']):
+            st.session_state.advanced_search_page = pagina + 1
+            st.rerun()
+    with col_carpeta:
+        carpeta = st.selectbox("Carpeta", [fila["Carpeta"] for fila in filas], label_visibility="collapsed")
+    with col_abrir:
+        if st.button("Abrir carpeta"):
+            # Reutilizamos la búsqueda por número de carpeta de app.py
+            st.session_state.search_query = carpeta
+            st.session_state.search_triggered = True
+            st.session_state.advanced_search = None
+            st.rerun()
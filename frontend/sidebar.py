@@ -1,4 +1,16 @@
+import re
 import streamlit as st
+from datetime import datetime, time
+
+
+def parse_carpetas(texto):
+    """
+    Convierte "120, 121 125" en [120, 121, 125]. Vacío si no se indicó ninguna.
+    """
+    valores = [valor for valor in re.split(r"[\s,;]+", texto or "") if valor]
+    if not all(valor.isdigit() and int(valor) > 0 for valor in valores):
+        raise ValueError("Las carpetas deben ser números positivos separados por comas.")
+    return [int(valor) for valor in valores]
 
 def display_sidebar():
     """
@@ -27,7 +39,21 @@ def display_sidebar():
             help="Este es el número de Carpeta para la nueva operación."
         )
 
-        # 3. Botón "Iniciar Extracción"
+        # 3. PDF con varias escrituras (por ejemplo, un protocolo escaneado)
+        dividir = st.checkbox(
+            "El PDF contiene varias escrituras",
+            key="dividir_escrituras",
+            help="Se separan las escrituras y cada una se extrae por separado y se revisa en su propia carpeta."
+        )
+        if dividir:
+            st.text_input(
+                "Carpeta de cada escritura (opcional):",
+                key="carpetas_escrituras",
+                placeholder="Ej.: 120, 121, 125",
+                help="Una carpeta por escritura, en orden. Si se deja vacío, se usan carpetas consecutivas desde la asignada."
+            )
+
+        # 4. Botón "Iniciar Extracción"
         if st.button("Iniciar Extracción", type="primary"):
             if uploaded_file is not None:
                 st.success("¡Análisis iniciado!")
@@ -45,7 +71,7 @@ def display_sidebar():
         
         st.header("Buscar Carpeta Existente")
 
-        # 4. Campo para buscar por número de carpeta
+        # 5. Campo para buscar por número de carpeta
         search_number = st.number_input(
             "Introduce el número de Carpeta a buscar:",
             min_value=0,
@@ -53,7 +79,7 @@ def display_sidebar():
             key="search_number_input"
         )
 
-        # 5. Botón para iniciar la búsqueda
+        # 6. Botón para iniciar la búsqueda
         if st.button("Buscar Carpeta"):
             if search_number > 0:
                 # Comunicamos la acción de búsqueda a app.py
@@ -63,4 +89,40 @@ def display_sidebar():
             else:
                 st.warning("Por favor, introduce un número de carpeta válido para buscar.")
 
+        # Separador visual para la búsqueda avanzada
+        st.markdown("---")
+
+        st.header("Búsqueda Avanzada")
+
+        # 7. Filtros combinables; se envían todos juntos al presionar "Buscar"
+        with st.form("busqueda_avanzada"):
+            cuil = st.text_input("CUIT/CUIL de una parte")
+            documento = st.text_input("DNI de una parte")
+            escribano = st.text_input("Escribano")
+            registro = st.text_input("Registro")
+            matricula = st.text_input("Matrícula")
+            partida = st.text_input("Partida")
+            fecha_desde = st.date_input("Otorgada desde", value=None, format="DD/MM/YYYY")
+            fecha_hasta = st.date_input("Otorgada hasta", value=None, format="DD/MM/YYYY")
+            texto = st.text_input("Texto en observaciones o dirección")
+            if st.form_submit_button("Buscar"):
+                filtros = {
+                    "cuil": cuil.strip(),
+                    "documento": documento.strip(),
+                    "escribano": escribano.strip(),
+                    "registro": registro.strip(),
+                    "matricula": matricula.strip(),
+                    "partida": partida.strip(),
+                    "fecha_desde": datetime.combine(fecha_desde, time.min) if fecha_desde else None,
+                    "fecha_hasta": datetime.combine(fecha_hasta, time.max) if fecha_hasta else None,
+                    "texto": texto.strip(),
+                }
+                filtros = {campo: valor for campo, valor in filtros.items() if valor}
+                if filtros:
+                    # Comunicamos la búsqueda avanzada a app.py
+                    st.session_state.advanced_search = filtros
+                    st.session_state.advanced_search_page = 1
+                else:
+                    st.warning("Por favor, completa al menos un filtro.")
+
         return uploaded_file, assigned_number
@@ -0,0 +1,86 @@
+import os
+import time
+
+from backend.cache import DiskCache, hash_key
+
+
+def _clave(i):
+    return hash_key("entrada", i)
+
+
+def _tamano_en_disco(directorio):
+    return sum(os.path.getsize(os.path.join(raiz, nombre)) for raiz, _, nombres in os.walk(directorio) for nombre in nombres)
+
+
+def test_guarda_y_recupera(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=10_000)
+    cache.set(_clave(1), {"texto": "hola"})
+    assert cache.get(_clave(1)) == {"texto": "hola"}
+    assert cache.get(_clave(2)) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_hash_key_no_confunde_las_partes():
+    assert hash_key("ab", "c") != hash_key("a", "bc")
+    assert hash_key({"a": 1, "b": 2}) == hash_key({"b": 2, "a": 1})
+
+
+def test_deshabilitada_con_tamano_cero(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=0)
+    cache.set(_clave(1), "valor")
+    assert cache.get(_clave(1)) is None
+    assert not os.listdir(tmp_path)
+
+
+def test_las_entradas_expiran(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path), max_bytes=10_000, ttl=60)
+    cache.set(_clave(1), "valor")
+    ahora = time.time()
+    monkeypatch.setattr(time, "time", lambda: ahora + 30)
+    assert cache.get(_clave(1)) == "valor"
+    monkeypatch.setattr(time, "time", lambda: ahora + 61)
+    assert cache.get(_clave(1)) is None
+    # La entrada vencida se borra del disco.
+    assert not os.path.exists(cache._path(_clave(1)))
+
+
+def test_desaloja_las_menos_usadas(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=3_000)
+    for i in range(10):
+        cache.set(_clave(i), os.urandom(300).hex())
+        # Fechas de uso distintas aunque el sistema de archivos tenga poca resolución.
+        os.utime(cache._path(_clave(i)), (i, i))
+    assert _tamano_en_disco(tmp_path) <= 3_000
+    assert cache.get(_clave(9)) is not None
+    assert cache.get(_clave(0)) is None
+
+
+def test_un_acierto_protege_la_entrada_del_desalojo(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=3_000)
+    for i in range(4):
+        cache.set(_clave(i), os.urandom(300).hex())
+        os.utime(cache._path(_clave(i)), (i, i))
+    assert cache.get(_clave(0)) is not None  # Pasa a ser la más reciente.
+    for i in range(4, 8):
+        cache.set(_clave(i), os.urandom(300).hex())
+    assert cache.get(_clave(0)) is not None
+    assert cache.get(_clave(1)) is None
+
+
+def test_no_recorre_el_directorio_en_cada_escritura(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path), max_bytes=1_000_000, rescan_every=50)
+    recorridos = []
+    entries = cache._entries
+    monkeypatch.setattr(cache, "_entries", lambda: recorridos.append(1) or entries())
+    for i in range(100):
+        cache.set(_clave(i), "valor")
+    # La primera escritura y la 50.ª desde entonces.
+    assert len(recorridos) == 2
+    assert cache._size == _tamano_en_disco(tmp_path)
+
+
+def test_reemplazar_una_entrada_no_infla_el_total(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1_000_000)
+    for _ in range(20):
+        cache.set(_clave(1), "x" * 100)
+    assert cache._size == _tamano_en_disco(tmp_path)
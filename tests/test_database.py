@@ -0,0 +1,86 @@
+import copy
+from datetime import datetime
+
+from backend.database import search_fields, changed_paths, build_update_operations
+
+
+ESCRITURA = {
+    'numero_escritura': '112',
+    'escribano': 'María José Núñez',
+    'registro_escribano': 'Registro N° 12',
+    'fecha_otorgamiento': '1 de marzo de 2023',
+    'partes_intervinientes': [
+        {'nombre': 'Juan Pérez', 'numero_CUIL': '20-12345678-6', 'numero_documento': '12.345.678'},
+        {'nombre': 'Ana Gómez', 'numero_CUIL': None, 'numero_documento': '23.456.789'},
+    ],
+    'descripcion_propiedad': {'matricula': '123.456', 'Partida': '11-01-1234567/8'},
+}
+
+
+def test_campos_de_busqueda_normalizados():
+    campos = search_fields(ESCRITURA)
+    assert campos['busqueda'] == {
+        'cuils': ['20123456786'],
+        'documentos': ['12345678', '23456789'],
+        'escribano': 'maria jose nuñez',
+        'registro': '12',
+        'matricula': '123456',
+        'partida': '110112345678',
+    }
+    assert campos['fecha_otorgamiento_iso'] == datetime(2023, 3, 1)
+
+
+def test_campos_de_busqueda_de_una_escritura_vacia():
+    campos = search_fields({})
+    assert campos['busqueda']['cuils'] == [] and campos['busqueda']['escribano'] == ''
+    assert campos['fecha_otorgamiento_iso'] is None
+
+
+def test_sin_cambios():
+    assert changed_paths(ESCRITURA, copy.deepcopy(ESCRITURA)) == {}
+
+
+def test_cambios_anidados_en_notacion_de_puntos():
+    editada = copy.deepcopy(ESCRITURA)
+    editada['partes_intervinientes'][1]['numero_documento'] = '23.456.780'
+    editada['descripcion_propiedad']['matricula'] = '654.321'
+    assert changed_paths(ESCRITURA, editada) == {
+        'partes_intervinientes.1.numero_documento': '23.456.780',
+        'descripcion_propiedad.matricula': '654.321',
+    }
+
+
+def test_una_lista_que_cambia_de_largo_se_envia_entera():
+    editada = copy.deepcopy(ESCRITURA)
+    editada['partes_intervinientes'].pop()
+    assert changed_paths(ESCRITURA, editada) == {'partes_intervinientes': editada['partes_intervinientes']}
+
+
+def test_vacios_equivalentes_no_son_cambios():
+    # Los widgets devuelven "" y el editor de tablas NaN donde había None.
+    original = {'observaciones': None, 'partes_intervinientes': [{'numero_CUIL': None}]}
+    editada = {'observaciones': '', 'partes_intervinientes': [{'numero_CUIL': float('nan')}]}
+    assert changed_paths(original, editada) == {}
+
+
+def test_ignora_los_campos_que_maneja_la_base():
+    editada = copy.deepcopy(ESCRITURA)
+    editada.update({'version': 7, 'ultima_modificacion': datetime.now(), 'busqueda': {}, 'campos_editados': ['x']})
+    assert changed_paths(ESCRITURA, editada) == {}
+
+
+def test_actualizacion_completa():
+    ahora = datetime(2024, 5, 1, 12, 0)
+    data = {**ESCRITURA, '_id': 'x', 'fecha_creacion': datetime(2020, 1, 1), 'version': 3}
+    operaciones = build_update_operations(data, 15, now=ahora, campos_editados={'escribano', 'folio_escritura'})
+    assert operaciones['$setOnInsert'] == {'fecha_creacion': ahora}
+    assert operaciones['$inc'] == {'version': 1}
+    actualizacion = operaciones['$set']
+    assert actualizacion['numero_carpeta'] == 15
+    assert actualizacion['ultima_modificacion'] == ahora
+    assert actualizacion['campos_editados'] == ['escribano', 'folio_escritura']
+    assert actualizacion['busqueda']['cuils'] == ['20123456786']
+    # La base es la única que fija _id, la fecha de creación y la versión.
+    assert not {'_id', 'fecha_creacion', 'version'} & set(actualizacion)
+    # No modifica los datos recibidos.
+    assert data['version'] == 3 and '_id' in data
@@ -0,0 +1,93 @@
+from datetime import datetime
+
+import pytest
+
+from backend.rules import (
+    cuit_is_valid, format_cuit, spanish_words_to_int, extract_rule_fields,
+    parse_spanish_date, normalize_identifier, normalize_name,
+)
+
+
+@pytest.mark.parametrize("cuit", ["20-12345678-6", "20123456786", "27-23456789-1", "20 12.345.678 6"])
+def test_cuit_con_digito_verificador_correcto(cuit):
+    assert cuit_is_valid(cuit)
+
+
+@pytest.mark.parametrize("cuit", [
+    "20-12345678-5",   # Dígito verificador incorrecto.
+    "21-12345678-6",   # Prefijo inexistente.
+    "20-1234567-6",    # Faltan dígitos.
+    "",
+    None,
+])
+def test_cuit_invalido(cuit):
+    assert not cuit_is_valid(cuit)
+
+
+def test_format_cuit():
+    assert format_cuit("20123456786") == "20-12345678-6"
+
+
+@pytest.mark.parametrize("palabras, numero", [
+    ("cero", 0),
+    ("quince", 15),
+    ("veintitrés", 23),
+    ("cuarenta y dos", 42),
+    ("CIENTO DOCE", 112),
+    ("cuatrocientos treinta y cinco", 435),
+    ("mil", 1000),
+    ("dos mil veintitrés", 2023),
+    ("mil novecientos noventa y nueve", 1999),
+])
+def test_numeros_en_palabras(palabras, numero):
+    assert spanish_words_to_int(palabras) == numero
+
+
+@pytest.mark.parametrize("palabras", ["casa", "ciento casa", "", "y"])
+def test_palabras_que_no_son_numeros(palabras):
+    assert spanish_words_to_int(palabras) is None
+
+
+TEXTO = (
+    "ESCRITURA NÚMERO CIENTO DOCE. En la ciudad de Córdoba, a primero de marzo de dos mil veintitrés, "
+    "COMPARECE Juan Pérez, CUIT 20-12345678-6, CUIL 20-12345678-5, DNI 12.345.678, "
+    "quien vende el inmueble matrícula 123.456, partida 11-01-1234567/8. "
+    "Ante mí: folio 45, registro 12. CONCUERDA"
+)
+
+
+def test_extrae_los_campos_de_formato_fijo():
+    reglas = extract_rule_fields(TEXTO)
+    assert reglas["campos"] == {"numero_escritura": "112", "folio_escritura": "45", "registro_escribano": "12"}
+    assert reglas["propiedad"] == {"Partida": "11-01-1234567/8", "matricula": "123.456"}
+    # El CUIL con dígito verificador incorrecto se descarta.
+    assert reglas["cuits"] == ["20-12345678-6"]
+    assert reglas["dnis"] == ["12345678"]
+
+
+def test_numero_de_escritura_requiere_marca():
+    # Una mención a otra escritura sin "número" no se toma como el número.
+    reglas = extract_rule_fields("En la ciudad de Córdoba, según escritura 45 del registro anterior...")
+    assert "numero_escritura" not in reglas["campos"]
+    assert extract_rule_fields("ESCRITURA N° 58. En la ciudad...")["campos"]["numero_escritura"] == "58"
+
+
+@pytest.mark.parametrize("texto, fecha", [
+    ("15/03/2021", datetime(2021, 3, 15)),
+    ("a primero de marzo de dos mil veintitrés", datetime(2023, 3, 1)),
+    ("1° de enero de 2020", datetime(2020, 1, 1)),
+    ("a los quince días del mes de agosto de dos mil diecinueve", datetime(2019, 8, 15)),
+])
+def test_fechas_en_espanol(texto, fecha):
+    assert parse_spanish_date(texto) == fecha
+
+
+def test_fecha_no_reconocida():
+    assert parse_spanish_date("sin fecha") is None
+    assert parse_spanish_date(None) is None
+
+
+def test_normalizacion_para_busquedas():
+    assert normalize_identifier("20-12.345.678-6") == "20123456786"
+    assert normalize_identifier(None) == ""
+    assert normalize_name("  José   MARÍA Núñez ") == "jose maria nuñez"
@@ -0,0 +1,97 @@
+import pytest
+
+from backend import segmenter
+from backend.segmenter import find_sections, reduce_text, split_escrituras, SECTION_FIELDS
+
+
+def _relleno(n):
+    return ("lorem ipsum dolor sit amet " * (n // 27 + 1))[:n]
+
+
+def _escritura(numero="CIENTO DOCE", largo=3000):
+    return (
+        f"ESCRITURA NÚMERO {numero}. En la ciudad de Córdoba, a quince de marzo de dos mil veintitrés. "
+        + _relleno(largo)
+        + " COMPARECE Juan Pérez, DNI 12.345.678, y DICE que vende "
+        + _relleno(largo)
+        + " el inmueble ubicado en calle Falsa 123, matrícula 123.456. "
+        + _relleno(largo)
+        + " El precio es la suma de pesos un millón. "
+        + _relleno(largo)
+        + " Leída, firman ante mí. Ante mí: Escribana Ana Gómez, folio 45, registro 12. CONCUERDA con su matriz."
+    )
+
+
+@pytest.fixture
+def contexto_chico(monkeypatch):
+    monkeypatch.setattr(segmenter, "SEGMENT_CONTEXT_CHARS", 100)
+    monkeypatch.setattr(segmenter, "SEGMENTER_MIN_CHARS", 1000)
+
+
+def _contiene(texto, tramos, marca):
+    return any(marca in texto[inicio:fin] for inicio, fin in tramos)
+
+
+def test_ubica_cada_seccion(contexto_chico):
+    texto = _escritura()
+    secciones = find_sections(texto)
+    assert set(secciones) == set(SECTION_FIELDS)
+    assert secciones["encabezado"][0][0] == 0
+    assert _contiene(texto, secciones["comparecencia"], "COMPARECE Juan Pérez")
+    assert _contiene(texto, secciones["inmueble"], "calle Falsa 123")
+    assert _contiene(texto, secciones["precio"], "la suma de pesos")
+    assert _contiene(texto, secciones["cierre"], "CONCUERDA")
+    assert _contiene(texto, secciones["cierre"], "registro 12")
+
+
+def test_seccion_no_encontrada_queda_vacia(contexto_chico):
+    secciones = find_sections("ESCRITURA NÚMERO UNO. " + _relleno(3000))
+    assert secciones["comparecencia"] == [] and secciones["cierre"] == []
+
+
+def test_reduce_el_texto_a_las_secciones(contexto_chico):
+    texto = _escritura()
+    reducido, campos = reduce_text(texto)
+    assert len(reducido) < len(texto)
+    assert "\n[...]\n" in reducido
+    for marca in ("ESCRITURA NÚMERO CIENTO DOCE", "COMPARECE", "calle Falsa 123", "suma de pesos", "registro 12", "CONCUERDA"):
+        assert marca in reducido
+    assert campos == [campo for campos_seccion in SECTION_FIELDS.values() for campo in campos_seccion]
+
+
+def test_texto_corto_o_sin_secciones_va_completo(contexto_chico):
+    corto = "ESCRITURA NÚMERO UNO. COMPARECE Juan."
+    assert reduce_text(corto) == (corto, [])
+    sin_cierre = _escritura().replace("CONCUERDA", "").replace("Ante mí", "").replace("ante mí", "")
+    assert reduce_text(sin_cierre) == (sin_cierre, [])
+
+
+def test_separa_escrituras_con_sus_paginas():
+    primera, segunda = _escritura("CIENTO DOCE", 400), _escritura("CIENTO TRECE", 400)
+    mitad = len(primera) // 2
+    paginas = ["Protocolo 2023 - carátula", primera[:mitad], primera[mitad:], segunda]
+    escrituras = split_escrituras(paginas)
+    assert [e["paginas"] for e in escrituras] == [(1, 3), (4, 4)]
+    # La carátula queda con la primera escritura.
+    assert escrituras[0]["texto"].startswith("Protocolo 2023")
+    assert escrituras[1]["texto"].startswith("ESCRITURA NÚMERO CIENTO TRECE")
+
+
+def test_una_mencion_antes_del_cierre_no_corta():
+    texto = _escritura(largo=400).replace(
+        " El precio", "\nESCRITURA NÚMERO OCHENTA citada en el título antecedente. El precio"
+    )
+    escrituras = split_escrituras([texto, _escritura("CIENTO TRECE", 400)])
+    assert [e["paginas"] for e in escrituras] == [(1, 1), (2, 2)]
+
+
+def test_sin_encabezados_corta_despues_de_cada_cierre():
+    cuerpo = _escritura(largo=400).replace("ESCRITURA NÚMERO", "Escritura")
+    escrituras = split_escrituras([cuerpo + "\n\n", cuerpo])
+    assert len(escrituras) == 2
+    assert escrituras[0]["texto"].endswith("CONCUERDA con su matriz.")
+
+
+def test_una_sola_escritura():
+    escrituras = split_escrituras([_escritura(largo=400)])
+    assert len(escrituras) == 1 and escrituras[0]["paginas"] == (1, 1)